@@ -0,0 +1,84 @@
+# benchmarks/bench_csv.py
+# Leitura de CSV: caminho antigo (sep=None, engine="python") x novo
+# (csv.Sniffer numa amostra de bytes + engine C em blocos).
+#
+# Uso (a partir da raiz do repo):
+#   python -m benchmarks.bench_csv [n_linhas]
+#
+# Importa o app Streamlit em "bare mode" só para usar as funções de leitura.
+
+import io
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import reposicao_facil as app
+
+
+def _csv_pedidos(n: int, encoding: str, seed: int = 7) -> bytes:
+    """Export de pedidos estilo Shopee: ';', decimal com vírgula, textos com acento."""
+    rng = np.random.default_rng(seed)
+    skus = np.array([f"SKU-{i:05d}" for i in range(20_000)], dtype=object)
+    df = pd.DataFrame({
+        "ID do pedido": [f"2405{i:010d}" for i in range(n)],
+        "Data de criação do pedido": "2024-05-01 10:00",
+        "Status do pedido": rng.choice(["Concluído", "Cancelado", "Enviado"], n),
+        "Número de referência SKU": skus[rng.zipf(1.3, n) % len(skus)],
+        "Nome do Produto": "Kit Organizador Multiuso Coração",
+        "Quantidade": rng.integers(1, 5, n).astype(str),
+        "Preço acordado": [f"{v:.2f}".replace(".", ",") for v in rng.integers(990, 19990, n) / 100],
+        "Cidade": rng.choice(["São Paulo", "Goiânia", "Florianópolis"], n),
+    })
+    return df.to_csv(index=False, sep=";").encode(encoding)
+
+
+def _antigo(blob: bytes) -> pd.DataFrame:
+    return pd.read_csv(io.BytesIO(blob), dtype=str, keep_default_na=False, sep=None, engine="python")
+
+
+def _novo(blob: bytes) -> pd.DataFrame:
+    partes = list(app._read_raw(io.BytesIO(blob), "x.csv", chunks=True))
+    return pd.concat(partes, ignore_index=True)
+
+
+def _medir(fn, blob):
+    t0 = time.perf_counter()
+    df = fn(blob)
+    dt = time.perf_counter() - t0
+    del df
+    tracemalloc.start()
+    fn(blob)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dt, pico
+
+
+def main(n: int = 500_000):
+    blob_utf8 = _csv_pedidos(n, "utf-8")
+    blob_latin1 = _csv_pedidos(n, "latin-1")
+
+    pd.testing.assert_frame_equal(_antigo(blob_utf8), _novo(blob_utf8))
+    pd.testing.assert_frame_equal(_novo(blob_utf8), _novo(blob_latin1))
+
+    print(f"{n:,} linhas, {len(blob_utf8) / 1e6:.1f} MB".replace(",", "."))
+    print(f"{'caminho':<38}{'tempo (s)':>11}{'pico (MB)':>11}")
+    linhas = [
+        ("python sep=None (antigo, utf-8)", _antigo, blob_utf8),
+        ("sniff + engine C em blocos (utf-8)", _novo, blob_utf8),
+        ("sniff + engine C em blocos (latin-1)", _novo, blob_latin1),
+    ]
+    for nome, fn, blob in linhas:
+        dt, pico = _medir(fn, blob)
+        print(f"{nome:<38}{dt:>11.2f}{pico / 1e6:>11.1f}")
+
+    # leitura completa do app (projeção + limpeza por bloco) para referência
+    t0 = time.perf_counter()
+    tipo, df = app.load_mapped_table_from_bytes("pedidos.csv", blob_latin1, "VENDAS")
+    print(f"load_mapped_table_from_bytes ({tipo}, {len(df):,} linhas): {time.perf_counter() - t0:.2f} s".replace(",", "."))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000)
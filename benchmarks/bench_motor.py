@@ -0,0 +1,187 @@
+# benchmarks/bench_motor.py
+# Benchmark do motor de reposição com cargas sintéticas (benchmarks/gerador.py).
+#
+# Uso (a partir da raiz do repo):
+#   python -m benchmarks.bench_motor                                   # 1k, 10k e 100k SKUs
+#   python -m benchmarks.bench_motor --tamanhos 1000 10000 --saida atual.json
+#   python -m benchmarks.bench_motor --baseline base.json --tolerancia 0.25
+#
+# Saída (JSON): por tamanho, tempo (melhor de N execuções) e pico de memória
+# (tracemalloc) de cada caso, as etapas do motor (ms; normalização, junções,
+# painel...) e a paridade do `calcular_compra` do motor (backends pandas e
+# numpy) com a referência congelada (benchmarks/referencia.py, o `calcular`
+# original do app). Com --baseline, casos que ficaram mais lentos que
+# baseline * (1 + tolerância) são listados e o processo sai com código 1
+# (idem se a paridade falhar).
+#
+# Importa o app Streamlit em "bare mode" só para usar as funções dele.
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict
+
+import numpy as np
+import pandas as pd
+
+import reposicao_facil as app
+from v4_api import engine_compras as motor
+from benchmarks import referencia
+from benchmarks.gerador import CargaSintetica, ConfigCarga, gerar_carga
+
+TAMANHOS_PADRAO = [1_000, 10_000, 100_000]
+RUIDO_MIN_S = 0.005      # diferenças abaixo disso não contam como regressão
+TETO_REPETICAO_S = 5.0   # caso que já passa disso roda uma vez só
+CENARIOS_PARIDADE = [(60, 0.0, 0), (30, 5.0, 10), (90, -3.0, 7)]  # (h, g, LT)
+
+
+def _casos(c: CargaSintetica) -> dict:
+    cat_app = lambda: app.Catalogo(catalogo_simples=c.catalogo_df, kits_reais=c.kits_df)
+    kits_efetivo = app.construir_kits_efetivo(cat_app())
+    return {
+        "referencia.calcular": lambda: referencia.calcular(
+            c.full_df, c.fisico_df, c.vendas_df, c.catalogo_df, c.kits_df
+        ),
+        "motor.calcular_compra": lambda: motor.calcular_compra(
+            c.full_df, c.fisico_df, c.vendas_df, c.catalogo_df, c.kits_df
+        ),
+        "motor.calcular_compra[numpy]": lambda: motor.calcular_compra(
+            c.full_df, c.fisico_df, c.vendas_df, c.catalogo_df, c.kits_df, engine="numpy"
+        ),
+        "motor.explodir_por_kits": lambda: motor.explodir_por_kits(
+            c.full_df, kits_efetivo, "SKU", "Vendas_Qtd_60d"
+        ),
+        "app.construir_kits_efetivo": lambda: app.construir_kits_efetivo(cat_app()),
+        "app.load_any_table_from_bytes[FULL]": lambda: app.load_any_table_from_bytes("full.csv", c.full_csv),
+        "app.load_any_table_from_bytes[FISICO]": lambda: app.load_any_table_from_bytes("estoque.csv", c.fisico_csv),
+        "app.load_any_table_from_bytes[VENDAS]": lambda: app.load_any_table_from_bytes("pedidos.csv", c.vendas_csv),
+        "app._carregar_padrao_de_content": lambda: app._carregar_padrao_de_content(c.padrao_xlsx),
+    }
+
+
+def _medir(fn, repeticoes: int) -> dict:
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+        if tempos[-1] > TETO_REPETICAO_S:
+            break
+    tracemalloc.start()
+    fn()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"tempo_s": round(min(tempos), 5), "pico_mb": round(pico / 1e6, 2), "execucoes": len(tempos)}
+
+
+def _etapas(c: CargaSintetica, repeticoes: int) -> dict:
+    """Melhor tempo (ms) de cada etapa do motor em `repeticoes` execuções."""
+    melhor = {}
+    for _ in range(repeticoes):
+        _, painel = motor.calcular_compra(
+            c.full_df, c.fisico_df, c.vendas_df, c.catalogo_df, c.kits_df, medir_etapas=True
+        )
+        for etapa, ms in painel["etapas_ms"].items():
+            melhor[etapa] = min(melhor.get(etapa, ms), ms)
+    return melhor
+
+
+def _paridade_referencia(c: CargaSintetica) -> dict:
+    """Motor (pandas e numpy) x referência congelada, em alguns (h, g, LT)."""
+    tabelas = (c.full_df, c.fisico_df, c.vendas_df, c.catalogo_df, c.kits_df)
+    for h, g, LT in CENARIOS_PARIDADE:
+        r, pr = referencia.calcular(*tabelas, h=h, g=g, LT=LT)
+        try:
+            for engine in ("pandas", "numpy"):
+                m, pm = motor.calcular_compra(*tabelas, h=h, g=g, LT=LT, engine=engine)
+                pd.testing.assert_frame_equal(r, m)
+                if pr != pm:
+                    raise AssertionError(f"painel diferente: {pr} x {pm}")
+        except AssertionError as e:
+            return {"ok": False, "cenario": [h, g, LT], "engine": engine, "erro": str(e)}
+    return {"ok": True, "linhas": int(len(r)), "cenarios": len(CENARIOS_PARIDADE)}
+
+
+def comparar(atual: dict, baseline: dict, tolerancia: float) -> list:
+    """Lista de regressões (tamanho, caso, tempo base, tempo atual)."""
+    regressoes = []
+    for tam, res in atual["resultados"].items():
+        base_casos = baseline.get("resultados", {}).get(tam, {}).get("casos", {})
+        for caso, m in res["casos"].items():
+            b = base_casos.get(caso)
+            if b is None:
+                continue
+            limite = b["tempo_s"] * (1.0 + tolerancia)
+            if m["tempo_s"] > limite and m["tempo_s"] - b["tempo_s"] > RUIDO_MIN_S:
+                regressoes.append({"tamanho": tam, "caso": caso,
+                                   "base_s": b["tempo_s"], "atual_s": m["tempo_s"],
+                                   "razao": round(m["tempo_s"] / b["tempo_s"], 2)})
+    return regressoes
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark do motor de reposição (cargas sintéticas).")
+    ap.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO, help="nº de SKUs do catálogo")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--saida", help="grava o JSON neste arquivo (padrão: stdout)")
+    ap.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    ap.add_argument("--tolerancia", type=float, default=0.25, help="folga relativa antes de acusar regressão")
+    args = ap.parse_args(argv)
+
+    saida = {
+        "ambiente": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "maquina": platform.machine(),
+        },
+        "resultados": {},
+    }
+    falhou = False
+    for n in args.tamanhos:
+        cfg = ConfigCarga(n_skus=n, seed=args.seed)
+        t0 = time.perf_counter()
+        carga = gerar_carga(cfg)
+        print(f"[{n:>7} SKUs] carga gerada em {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+        casos = {}
+        for nome, fn in _casos(carga).items():
+            casos[nome] = _medir(fn, args.repeticoes)
+            print(f"[{n:>7} SKUs] {nome:<40} {casos[nome]['tempo_s']:>9.4f}s {casos[nome]['pico_mb']:>9.1f} MB",
+                  file=sys.stderr)
+        paridade = _paridade_referencia(carga)
+        falhou |= not paridade["ok"]
+        saida["resultados"][str(n)] = {
+            "config": asdict(cfg),
+            "linhas": {"catalogo": len(carga.catalogo_df), "kits": len(carga.kits_df),
+                       "full": len(carga.full_df), "fisico": len(carga.fisico_df),
+                       "pedidos": len(carga.vendas_df)},
+            "casos": casos,
+            "etapas_ms": _etapas(carga, args.repeticoes),
+            "paridade_referencia": paridade,
+        }
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressoes = comparar(saida, json.load(f), args.tolerancia)
+        saida["regressoes"] = regressoes
+        for r in regressoes:
+            print(f"REGRESSÃO [{r['tamanho']} SKUs] {r['caso']}: {r['base_s']:.4f}s -> {r['atual_s']:.4f}s "
+                  f"({r['razao']}x)", file=sys.stderr)
+        falhou |= bool(regressoes)
+
+    texto = json.dumps(saida, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+    return 1 if falhou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
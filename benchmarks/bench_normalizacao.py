@@ -0,0 +1,83 @@
+# benchmarks/bench_normalizacao.py
+# Micro-benchmark: br_to_float / norm_sku escalares (.map) x versões vetorizadas.
+#
+# Uso (a partir da raiz do repo):
+#   python -m benchmarks.bench_normalizacao [n_linhas]
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from v4_api.engine_compras import br_to_float, norm_sku, br_to_float_series, norm_sku_series
+
+try:
+    from unidecode import unidecode
+except ImportError:  # o motor não depende de unidecode; o app sim
+    unidecode = None
+
+
+def _amostra(n: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    valores = rng.integers(0, 500_000, n) / 100
+    precos = pd.Series(
+        [f"R$ {v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") for v in valores],
+        dtype=object,
+    )
+    # sujeira típica de export: NBSP, vazio, "-"
+    precos.iloc[::97] = " R$ 12,50 "
+    precos.iloc[::101] = ""
+    precos.iloc[::499] = "-"
+
+    base = np.array([f" sku-{i:05d} " for i in range(n // 20 + 1)] + ["Calção-01", "coração 2 "], dtype=object)
+    skus = pd.Series(base[rng.integers(0, len(base), n)], dtype=object)
+    skus.iloc[::211] = None
+
+    qtds = pd.Series(rng.zipf(2.0, n).clip(max=5000).astype(str), dtype=object)
+    qtds.iloc[::307] = ""
+    return precos, skus, qtds
+
+
+def _melhor(fn, repeticoes: int = 3) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+    return min(tempos)
+
+
+def main(n: int = 100_000):
+    precos, skus, qtds = _amostra(n)
+    numerico = pd.Series(np.arange(n, dtype=np.int64))
+
+    casos = [
+        ("br_to_float (preço BR)", lambda: precos.map(br_to_float), lambda: br_to_float_series(precos)),
+        ("br_to_float (quantidade)", lambda: qtds.map(br_to_float), lambda: br_to_float_series(qtds)),
+        ("br_to_float (já numérico)", lambda: numerico.map(br_to_float), lambda: br_to_float_series(numerico)),
+        ("norm_sku", lambda: skus.map(norm_sku), lambda: norm_sku_series(skus)),
+    ]
+    if unidecode is not None:
+        def app_norm(x):
+            return "" if pd.isna(x) else unidecode(str(x)).strip().upper()
+        casos.append((
+            "norm_sku + unidecode (app)",
+            lambda: skus.map(app_norm),
+            lambda: norm_sku_series(skus, translit=unidecode),
+        ))
+
+    print(f"{n:,} linhas".replace(",", "."))
+    print(f"{'caso':<30}{'escalar (s)':>14}{'vetorizado (s)':>16}{'ganho':>9}")
+    for nome, escalar, vetorizado in casos:
+        a, b = escalar(), vetorizado()
+        if a.dtype == object:
+            assert a.tolist() == b.tolist(), f"divergência em {nome}"
+        else:
+            assert np.array_equal(a.to_numpy(float), b.to_numpy(float), equal_nan=True), f"divergência em {nome}"
+        t_e, t_v = _melhor(escalar), _melhor(vetorizado)
+        print(f"{nome:<30}{t_e:>14.4f}{t_v:>16.4f}{t_e / t_v:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
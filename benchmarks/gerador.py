@@ -0,0 +1,156 @@
+# benchmarks/gerador.py
+# Gerador de cargas sintéticas (catálogo, kits, FULL, físico, pedidos) para
+# os benchmarks do motor. Determinístico pela seed.
+#
+# Devolve as tabelas já no formato canônico (o que calcular/calcular_compra
+# recebem) e também os arquivos "como chegam" (CSV ';' com números BR,
+# preço "R$ 1.234,56" e o XLSX do Padrão) para medir a leitura.
+
+import io
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class ConfigCarga:
+    n_skus: int = 10_000          # componentes no catálogo
+    kits_por_sku: float = 0.4     # nº de kits reais = n_skus * kits_por_sku
+    fanout_max: int = 4           # componentes por kit: 1..fanout_max
+    fracao_alias: float = 0.6     # anúncios que são SKU simples (alias) e não kit
+    zipf_a: float = 1.3           # concentração das vendas (maior = mais concentrada)
+    pedidos_por_sku: float = 3.0  # linhas do export de pedidos por SKU do catálogo
+    fracao_nao_repor: float = 0.03
+    seed: int = 42
+
+
+@dataclass
+class CargaSintetica:
+    cfg: ConfigCarga
+    catalogo_df: pd.DataFrame   # component_sku, fornecedor, status_reposicao (já sem "nao_repor")
+    kits_df: pd.DataFrame       # kit_sku, component_sku, qty
+    full_df: pd.DataFrame       # SKU, Vendas_Qtd_60d, Estoque_Full, Em_Transito
+    fisico_df: pd.DataFrame     # SKU, Estoque_Fisico, Preco
+    vendas_df: pd.DataFrame     # SKU, Quantidade (uma linha por pedido)
+    catalogo_bruto_df: pd.DataFrame = None  # como está na planilha (com "nao_repor")
+    full_csv: bytes = b""
+    fisico_csv: bytes = b""
+    vendas_csv: bytes = b""
+    padrao_xlsx: bytes = b""
+
+
+def _br(valores: np.ndarray, moeda: bool = False) -> list:
+    pref = "R$ " if moeda else ""
+    return [pref + f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") for v in valores]
+
+
+def _skew(rng: np.random.Generator, n_itens: int, n: int, a: float) -> np.ndarray:
+    """Índices em [0, n_itens) com popularidade zipf, embaralhados (o top não é sempre o id 0)."""
+    perm = rng.permutation(n_itens)
+    return perm[(rng.zipf(a, n) - 1) % n_itens]
+
+
+def gerar_carga(cfg: ConfigCarga, com_arquivos: bool = True) -> CargaSintetica:
+    rng = np.random.default_rng(cfg.seed)
+    n = cfg.n_skus
+
+    # CATÁLOGO
+    comps = np.array([f"CMP-{i:06d}" for i in range(n)], dtype=object)
+    fornecedores = np.array([f"Fornecedor {c} Ltda" for c in
+                             ["São João", "Ação", "Irmãos Müller", "Coração", "Alfa", "Beta", "Gama", "Ômega"]],
+                            dtype=object)
+    status = np.where(rng.random(n) < cfg.fracao_nao_repor, "nao_repor", "ativo").astype(object)
+    catalogo_bruto = pd.DataFrame({
+        "component_sku": comps,
+        "fornecedor": fornecedores[rng.integers(0, len(fornecedores), n)],
+        "status_reposicao": status,
+    })
+
+    # KITS (fan-out 1..fanout_max, qty 1..4)
+    n_kits = max(1, int(n * cfg.kits_por_sku))
+    fan = rng.integers(1, cfg.fanout_max + 1, n_kits)
+    kit_ids = np.repeat(np.arange(n_kits), fan)
+    kits = pd.DataFrame({
+        "kit_sku": np.array([f"KIT-{i:06d}" for i in range(n_kits)], dtype=object)[kit_ids],
+        "component_sku": comps[rng.integers(0, n, len(kit_ids))],
+        "qty": rng.integers(1, 5, len(kit_ids)),
+    }).drop_duplicates(["kit_sku", "component_sku"]).reset_index(drop=True)
+
+    # ANÚNCIOS: SKU simples (alias) ou kit
+    kit_skus = kits["kit_sku"].unique()
+    n_anuncios = n
+    n_alias = int(n_anuncios * cfg.fracao_alias)
+    anuncios = np.concatenate([
+        comps[rng.choice(n, min(n_alias, n), replace=False)],
+        kit_skus[rng.integers(0, len(kit_skus), n_anuncios - n_alias)],
+    ])
+    anuncios = pd.unique(anuncios)
+
+    # FULL: ~60% dos anúncios, vendas 60d com skew
+    n_full = max(1, int(len(anuncios) * 0.6))
+    full_skus = anuncios[rng.choice(len(anuncios), n_full, replace=False)]
+    vendas60 = np.bincount(_skew(rng, n_full, n_full * 20, cfg.zipf_a), minlength=n_full)
+    full = pd.DataFrame({
+        "SKU": full_skus,
+        "Vendas_Qtd_60d": vendas60.astype(int),
+        "Estoque_Full": rng.integers(0, 120, n_full),
+        "Em_Transito": np.where(rng.random(n_full) < 0.2, rng.integers(1, 50, n_full), 0),
+    })
+
+    # FÍSICO: ~90% dos componentes
+    n_fis = int(n * 0.9)
+    preco = np.round(rng.lognormal(3.0, 0.9, n_fis), 2)
+    fisico = pd.DataFrame({
+        "SKU": comps[rng.choice(n, n_fis, replace=False)],
+        "Estoque_Fisico": rng.integers(0, 400, n_fis),
+        "Preco": preco,
+    })
+
+    # PEDIDOS (Shopee/MT): uma linha por pedido, SKU com skew e sujeira de digitação
+    n_ped = max(1, int(n * cfg.pedidos_por_sku))
+    ped_skus = anuncios[_skew(rng, len(anuncios), n_ped, cfg.zipf_a)].astype(object)
+    sujos = rng.random(n_ped) < 0.05
+    ped_skus[sujos] = [" " + s.lower() + " " for s in ped_skus[sujos]]
+    vendas = pd.DataFrame({"SKU": ped_skus, "Quantidade": rng.integers(1, 4, n_ped)})
+
+    catalogo = catalogo_bruto[catalogo_bruto["status_reposicao"] != "nao_repor"].reset_index(drop=True)
+    carga = CargaSintetica(cfg, catalogo, kits, full, fisico, vendas, catalogo_bruto)
+    if com_arquivos:
+        _gerar_arquivos(carga, rng)
+    return carga
+
+
+def _gerar_arquivos(carga: CargaSintetica, rng: np.random.Generator):
+    f, e, v = carga.full_df, carga.fisico_df, carga.vendas_df
+    carga.full_csv = pd.DataFrame({
+        "SKU": f["SKU"],
+        "Vendas 60d": f["Vendas_Qtd_60d"].astype(str),
+        "Estoque Full": f["Estoque_Full"].astype(str),
+        "Em trânsito": f["Em_Transito"].astype(str),
+    }).to_csv(index=False, sep=";").encode("utf-8")
+
+    carga.fisico_csv = pd.DataFrame({
+        "Codigo": e["SKU"],
+        "Descrição": "Produto de teste com acentuação",
+        "Estoque Atual": e["Estoque_Fisico"].astype(str),
+        "Preço": _br(e["Preco"].to_numpy(), moeda=True),
+    }).to_csv(index=False, sep=";").encode("latin-1")
+
+    n = len(v)
+    carga.vendas_csv = pd.DataFrame({
+        "ID do pedido": [f"2405{i:010d}" for i in range(n)],
+        "Status do pedido": rng.choice(["Concluído", "Enviado"], n),
+        "Número de referência SKU": v["SKU"],
+        "Quantidade": v["Quantidade"].astype(str),
+        "Preço acordado": _br(rng.integers(990, 19990, n) / 100),
+    }).to_csv(index=False, sep=";").encode("utf-8")
+
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf) as xw:
+        carga.kits_df.rename(columns={"kit_sku": "Kit SKU", "component_sku": "Componente", "qty": "Qtd por kit"}) \
+            .to_excel(xw, sheet_name="KITS", index=False)
+        carga.catalogo_bruto_df.rename(columns={"component_sku": "SKU", "fornecedor": "Fornecedor",
+                                                "status_reposicao": "Status"}) \
+            .to_excel(xw, sheet_name="CATALOGO_SIMPLES", index=False)
+    carga.padrao_xlsx = buf.getvalue()
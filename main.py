@@ -1,27 +1,4 @@
-from typing import Any
-from fastapi import FastAPI, Body
-from fastapi.middleware.cors import CORSMiddleware
+# main.py
+# Ponto de entrada alternativo (uvicorn main:app). A API real vive em v4_api/api_compras.py.
 
-app = FastAPI(title="API Reposição Alivvia v4 (debug)")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.get("/health")
-def health():
-    print(">> /health foi chamado")
-    return {"status": "ok"}
-
-@app.post("/calcular-compra")
-async def api_calcular_compra(body: dict = Body(...)) -> Any:
-    print("\n===============================")
-    print("PAYLOAD RECEBIDO EM /calcular-compra:")
-    print(body)
-    print("===============================\n")
-
-    return body
+from v4_api.api_compras import app  # noqa: F401
@@ -4,10 +4,13 @@
 
 import io
 import re
+import csv
+import codecs
 import hashlib
+import json
 import datetime as dt
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 import os 
 import time
 
@@ -18,6 +21,13 @@ import streamlit as st
 import requests
 from requests.adapters import HTTPAdapter, Retry
 
+from v4_api.engine_compras import (
+    COL_EMPRESA, BaseCalculo, KitExplosionIndex, achatar_kits, aplicar_parametros, br_to_float_series,
+    descrever_ciclos, hash_tabelas, preparar_base_calculo,
+)
+from v4_api.engine_compras import norm_sku_series as _norm_sku_series
+from v4_api import armazem_uploads, cubo_vendas, historico_compras, memo_resultados, ocs_compras
+
 # ===================== CONFIG BÁSICA =====================
 st.set_page_config(page_title="Reposição Logística — Alivvia", layout="wide")
 
@@ -27,6 +37,9 @@ DEFAULT_SHEET_LINK = (
 )
 DEFAULT_SHEET_ID = "1cTLARjq-B5g50dL6tcntg7lb_Iu0ta43"  # fixo
 
+# Empresas (CNPJs): uploads, estado e cálculo percorrem esta lista
+EMPRESAS = ["ALIVVIA", "JCA"]
+
 # NOVO V3.2: Arquivo local para carregamento prioritário
 LOCAL_PADRAO_FILENAME = "Padrao_produtos.xlsx" 
 
@@ -35,62 +48,169 @@ STORAGE_DIR = ".streamlit/uploaded_files_cache"
 if not os.path.exists(STORAGE_DIR):
     os.makedirs(STORAGE_DIR, exist_ok=True)
 
-# Helper function para caminho determinístico no disco
+# Uploads ficam no armazém endereçado por conteúdo (v4_api/armazem_uploads.py):
+# a sessão guarda só o digest, os bytes são lidos (mmap) quando o cálculo precisa
+ARMAZEM = armazem_uploads.ArmazemUploads(os.path.join(STORAGE_DIR, "armazem"))
+
+# Layout antigo ({empresa}_{tipo}.bin + _name.txt): migrado para o armazém na 1ª leitura
 def get_local_file_path(empresa: str, tipo: str) -> str:
     return os.path.join(STORAGE_DIR, f"{empresa}_{tipo}.bin")
 
-# Helper function para caminho determinístico do nome original
 def get_local_name_path(empresa: str, tipo: str) -> str:
     return os.path.join(STORAGE_DIR, f"{empresa}_{tipo}_name.txt")
 
+def _migrar_upload_legado(empresa: str, tipo: str) -> Optional[dict]:
+    path_bin, path_name = get_local_file_path(empresa, tipo), get_local_name_path(empresa, tipo)
+    if not (os.path.exists(path_bin) and os.path.exists(path_name)):
+        return None
+    with open(path_bin, 'rb') as f_bin:
+        conteudo = f_bin.read()
+    with open(path_name, 'r', encoding='utf-8') as f_name:
+        nome = f_name.read().strip()
+    ARMAZEM.publicar(empresa, tipo, nome, conteudo)
+    os.remove(path_bin); os.remove(path_name)
+    return ARMAZEM.referencia(empresa, tipo)
+
 
 # ===================== ESTADO =====================
 def _ensure_state():
     st.session_state.setdefault("catalogo_df", None)
     st.session_state.setdefault("kits_df", None)
+    st.session_state.setdefault("kits_efetivo_df", None)
     st.session_state.setdefault("loaded_at", None)
     st.session_state.setdefault("alt_sheet_link", DEFAULT_SHEET_LINK)
 
-    st.session_state.setdefault("resultado_ALIVVIA", None)
-    st.session_state.setdefault("resultado_JCA", None)
+    for emp in EMPRESAS:
+        st.session_state.setdefault(f"resultado_{emp}", None)
+        # Etapa do cálculo independente de h/g/LT (BaseCalculo); a mesma base
+        # fica em várias empresas quando elas foram calculadas juntas
+        st.session_state.setdefault(f"base_{emp}", None)
+    st.session_state.setdefault("padrao_versao", None)
     st.session_state.setdefault("carrinho_compras", [])
 
-    # FIX V3.2.2: Estado de seleção armazenado como dicionário {SKU: True/False}
-    st.session_state.setdefault('sel_A', {})
-    st.session_state.setdefault('sel_J', {})
+    # Seleção por empresa: máscara booleana alinhada às linhas de resultado_<emp>
+    # (ver SELEÇÃO / CARRINHO abaixo)
+    for emp in EMPRESAS:
+        st.session_state.setdefault(f"sel_{emp}", {
+            "df": None, "mask": np.zeros(0, dtype=bool), "versao": 0, "vista": None, "carrinho": None,
+        })
+    st.session_state.setdefault("carrinho_versao", 0)
 
     # uploads por empresa
-    for emp in ["ALIVVIA", "JCA"]:
+    for emp in EMPRESAS:
         st.session_state.setdefault(emp, {})
         for file_type in ["FULL", "VENDAS", "ESTOQUE"]:
-            state = st.session_state[emp].setdefault(file_type, {"name": None, "bytes": None})
-            
-            # Tenta carregar do disco na inicialização
+            state = st.session_state[emp].setdefault(file_type, {"name": None, "digest": None})
+
+            # Aponta para o upload atual no armazém (só a referência, sem ler os bytes)
             if not state["name"]:
-                path_bin = get_local_file_path(emp, file_type)
-                path_name = get_local_name_path(emp, file_type)
-                
-                if os.path.exists(path_bin) and os.path.exists(path_name):
-                    try:
-                        with open(path_bin, 'rb') as f_bin:
-                            state["bytes"] = f_bin.read()
-                        with open(path_name, 'r', encoding='utf-8') as f_name:
-                            state["name"] = f_name.read().strip()
-                        state['is_cached'] = True
-                    except Exception:
-                        state["name"] = None; state["bytes"] = None
+                try:
+                    ref = ARMAZEM.referencia(emp, file_type) or _migrar_upload_legado(emp, file_type)
+                except Exception:
+                    ref = None
+                if ref:
+                    state["name"], state["digest"] = ref["nome"], ref["digest"]
+                    state['is_cached'] = True
 
 
 _ensure_state()
 
-# FIX V3.2.1/V3.2.2: Função única de reset para ser chamada em todos os filtros
+# ===================== SELEÇÃO / CARRINHO =====================
+# sel_<emp>: "mask" marca as linhas de resultado_<emp> ("df") selecionadas. O editor
+# da aba 2 mostra uma vista filtrada ("vista" = posições dessas linhas no resultado)
+# e o callback só aplica o delta dele (edited_rows). "versao" entra na key do editor:
+# muda quando a vista muda (filtro, resultado novo), para o delta acumulado do widget
+# nunca cair em linhas trocadas. "carrinho" acompanha a máscara (índice = posição):
+# só entram/saem as linhas que mudaram e a Qtd_Ajustada editada fica.
+COLS_CARRINHO = ["Empresa", "SKU", "Fornecedor", "Preco_Custo", "Qtd_Sugerida", "Valor_Sugerido_R$", "Qtd_Ajustada"]
+
+def mascara_selecao(emp: str) -> Optional[np.ndarray]:
+    """Máscara alinhada ao resultado atual (None sem resultado); resultado novo herda a seleção pelo SKU."""
+    df = st.session_state.get(f"resultado_{emp}")
+    sel = st.session_state[f"sel_{emp}"]
+    if df is None:
+        sel.update(df=None, mask=np.zeros(0, dtype=bool), vista=None, carrinho=None)
+        return None
+    if sel["df"] is not df:
+        mask = np.zeros(len(df), dtype=bool)
+        if sel["df"] is not None and sel["mask"].any():
+            mask = df["SKU"].isin(sel["df"]["SKU"].to_numpy()[sel["mask"]]).to_numpy()
+        sel.update(df=df, mask=mask, versao=sel["versao"] + 1, vista=None, carrinho=None)
+    return sel["mask"]
+
+def aplicar_delta_selecao(emp: str, key: str, versao: int):
+    """Callback do editor: só as linhas que o usuário mudou (posição na vista -> posição no resultado)."""
+    sel = st.session_state[f"sel_{emp}"]
+    if sel["versao"] != versao or sel["vista"] is None:
+        return
+    delta = {int(p): bool(m["Selecionar"]) for p, m in st.session_state[key].get("edited_rows", {}).items()
+             if "Selecionar" in m}
+    if delta:
+        pos = np.fromiter(delta.keys(), dtype=np.int64, count=len(delta))
+        sel["mask"][sel["vista"][pos]] = np.fromiter(delta.values(), dtype=bool, count=len(delta))
+
 def reset_selection():
-    """Zera o estado de seleção do carrinho (dicionário) quando um filtro muda."""
-    st.session_state.sel_A = {}
-    st.session_state.sel_J = {}
+    """Zera a seleção quando um filtro muda (a vista muda, então a versão do editor também)."""
+    for emp in EMPRESAS:
+        sel = st.session_state[f"sel_{emp}"]
+        sel["mask"] = np.zeros(len(sel["mask"]), dtype=bool)
+        sel["versao"] += 1
+
+def _linhas_carrinho(emp: str, df: pd.DataFrame, pos: np.ndarray) -> pd.DataFrame:
+    linhas = df.iloc[pos]
+    parte = pd.DataFrame({
+        "Empresa": emp, "SKU": linhas["SKU"].to_numpy(), "Fornecedor": linhas["fornecedor"].to_numpy(),
+        "Preco_Custo": linhas["Preco"].to_numpy(), "Qtd_Sugerida": linhas["Compra_Sugerida"].to_numpy(),
+        "Valor_Sugerido_R$": linhas["Valor_Compra_R$"].to_numpy(),
+    }, index=pos)
+    parte["Qtd_Ajustada"] = parte["Qtd_Sugerida"]
+    return enforce_numeric_types(parte)
+
+def sincronizar_carrinho() -> pd.DataFrame:
+    """
+    Carrinho = linhas selecionadas com Compra_Sugerida > 0, todas as empresas.
+    Só as linhas que entraram ou saíram desde a última chamada são tocadas;
+    se a composição mudou, a versão do editor do carrinho muda junto.
+    """
+    partes = []
+    for emp in EMPRESAS:
+        mask = mascara_selecao(emp)
+        if mask is None:
+            continue
+        sel = st.session_state[f"sel_{emp}"]
+        df = sel["df"]
+        desejado = np.flatnonzero(mask & (pd.to_numeric(df["Compra_Sugerida"], errors="coerce").fillna(0).to_numpy() > 0))
+        parte = sel["carrinho"]
+        if parte is None:
+            parte = _linhas_carrinho(emp, df, desejado)
+            st.session_state.carrinho_versao += 1
+        else:
+            atuais = parte.index.to_numpy()
+            manter = np.isin(atuais, desejado)
+            novos = np.setdiff1d(desejado, atuais, assume_unique=True)
+            if len(novos) or not manter.all():
+                parte = pd.concat([parte[manter], _linhas_carrinho(emp, df, novos)]).sort_index()
+                st.session_state.carrinho_versao += 1
+        sel["carrinho"] = parte
+        partes.append(parte)
+    if not partes:
+        return pd.DataFrame(columns=COLS_CARRINHO)
+    return pd.concat(partes, ignore_index=True)[COLS_CARRINHO]
+
+def gravar_qtd_ajustada(qtd: np.ndarray):
+    """Devolve às partes do carrinho a Qtd_Ajustada editada (mesma ordem de sincronizar_carrinho)."""
+    ini = 0
+    for emp in EMPRESAS:
+        parte = st.session_state[f"sel_{emp}"]["carrinho"]
+        if parte is None:
+            continue
+        parte["Qtd_Ajustada"] = qtd[ini:ini + len(parte)]
+        ini += len(parte)
 
 # ===================== HTTP / GOOGLE SHEETS =====================
+@st.cache_resource(show_spinner=False)
 def _requests_session() -> requests.Session:
+    """Sessão HTTP única do processo (pool de conexões reaproveitado entre reruns e usuários)."""
     s = requests.Session()
     retries = Retry(total=3, backoff_factor=0.6, status_forcelist=[429,500,502,503,504], allowed_methods=["GET"])
     s.mount("https://", HTTPAdapter(max_retries=retries))
@@ -105,27 +225,6 @@ def extract_sheet_id_from_url(url: str) -> Optional[str]:
     m = re.search(r"/d/([a-zA-Z0-9\-_]+)/", url)
     return m.group(1) if m else None
 
-def baixar_xlsx_por_link_google(url: str) -> bytes:
-    s = _requests_session()
-    if "export?format=xlsx" in url:
-        r = s.get(url, timeout=30); r.raise_for_status(); return r.content
-    sid = extract_sheet_id_from_url(url)
-    if not sid: raise RuntimeError("Link inválido do Google Sheets (esperado .../d/<ID>/...).")
-    r = s.get(gs_export_xlsx_url(sid), timeout=30); r.raise_for_status(); return r.content
-
-def baixar_xlsx_do_sheets(sheet_id: str) -> bytes:
-    s = _requests_session()
-    url = gs_export_xlsx_url(sheet_id)
-    try:
-        r = s.get(url, timeout=30)
-        r.raise_for_status()
-    except requests.HTTPError as e:
-        sc = getattr(e.response, "status_code", "?")
-        raise RuntimeError(
-            f"Falha ao baixar XLSX (HTTP {sc}). Verifique: compartilhamento 'Qualquer pessoa com link – Leitor'.\nURL: {url}"
-        )
-    return r.content
-
 # ===================== UTILS DE DADOS =====================
 def norm_header(s: str) -> str:
     s = (s or "").strip()
@@ -154,6 +253,11 @@ def norm_sku(x: str) -> str:
     if pd.isna(x): return ""
     return unidecode(str(x)).strip().upper()
 
+# Versão vetorizada de norm_sku (coluna inteira); unidecode só roda nos SKUs não-ASCII.
+# br_to_float_series (vetorizada) vem do motor: mesma regra do br_to_float acima.
+def norm_sku_series(s: pd.Series) -> pd.Series:
+    return _norm_sku_series(s, translit=unidecode)
+
 def exige_colunas(df: pd.DataFrame, obrig: list, nome: str):
     faltam = [c for c in obrig if c not in df.columns]
     if faltam:
@@ -179,82 +283,212 @@ def enforce_numeric_types(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 # ===================== LEITURA DE ARQUIVOS =====================
-def load_any_table(uploaded_file) -> Optional[pd.DataFrame]:
-    if uploaded_file is None:
-        return None
-    name = uploaded_file.name.lower()
+# Leitura em duas etapas: uma amostra de poucas linhas decide o cabeçalho (linha 0 ou
+# linha 2, caso FULL Magiic) e as colunas; o arquivo então é lido UMA vez só, já com o
+# cabeçalho certo e, quando o tipo é conhecido, só com as colunas que mapear_colunas usa.
+# CSV: separador/encoding/aspas saem de uma amostra de bytes (csv.Sniffer) e o parse é
+# feito pelo engine C do pandas, em blocos, para exports grandes não estourarem memória.
+SNIFF_NROWS = 5
+TOTAL_RE = r"^TOTALS?$|^TOTAIS?$"
+CSV_SNIFF_BYTES = 64 * 1024
+CSV_CHUNK_ROWS = 100_000
+
+def _tem_col_sku(cols) -> bool:
+    return any(c in cols for c in ["sku","codigo","codigo_sku"]) or any("sku" in c for c in cols)
+
+def _sniff_csv(fonte) -> dict:
+    """Detecta encoding (utf-8/latin-1 de ERP), separador e aspas; devolve kwargs do read_csv."""
+    fonte.seek(0)
+    amostra = fonte.read(CSV_SNIFF_BYTES)
+    enc = "utf-8-sig" if amostra.startswith(codecs.BOM_UTF8) else "utf-8"
+    # utf-8 se a amostra decodifica; senão latin-1, o padrão dos ERPs. O decoder
+    # incremental (sem final) aceita um caractere multibyte cortado no fim da amostra.
+    # Byte inválido depois da amostra: a leitura relê como latin-1 (_com_fallback_latin1).
     try:
-        if name.endswith(".csv"):
-            uploaded_file.seek(0)
-            df = pd.read_csv(uploaded_file, dtype=str, keep_default_na=False, sep=None, engine="python")
-        else:
-            df = pd.read_excel(uploaded_file, dtype=str, keep_default_na=False)
-    except Exception as e:
-        raise RuntimeError(f"Não consegui ler o arquivo '{uploaded_file.name}': {e}")
-
-    df.columns = [norm_header(c) for c in df.columns]
-
-    # fallback header=2 (FULL Magiic)
-    tem_col_sku = any(c in df.columns for c in ["sku","codigo","codigo_sku"]) or any("sku" in c for c in df.columns)
-    if (not tem_col_sku) and (len(df) > 0):
-        try:
-            uploaded_file.seek(0)
-            if name.endswith(".csv"):
-                df = pd.read_csv(uploaded_file, dtype=str, keep_default_na=False, header=2)
-            else:
-                df = pd.read_excel(uploaded_file, dtype=str, keep_default_na=False, header=2)
-            df.columns = [norm_header(c) for c in df.columns]
-        except Exception:
-            pass
-
-    # limpeza
+        codecs.getincrementaldecoder("utf-8")().decode(amostra)
+    except UnicodeDecodeError:
+        enc = "latin-1"
+    fonte.seek(0)
+    texto = amostra.decode(enc, errors="ignore")
+    if len(amostra) == CSV_SNIFF_BYTES and "\n" in texto:
+        texto = texto[: texto.rfind("\n")]  # só linhas completas
+    try:
+        d = csv.Sniffer().sniff(texto, delimiters=";,\t|")
+        return {"encoding": enc, "sep": d.delimiter, "quotechar": d.quotechar or '"',
+                "skipinitialspace": d.skipinitialspace}
+    except csv.Error:
+        primeira = texto.splitlines()[0] if texto else ""
+        sep = max(";,\t|", key=primeira.count)
+        return {"encoding": enc, "sep": sep if primeira.count(sep) else ","}
+
+def _read_raw(fonte, name: str, chunks: bool = False, opts: Optional[dict] = None, **kw):
+    """
+    Lê CSV/Excel como texto. Com chunks=True (CSV) devolve um iterador de blocos.
+    `opts` (CSV): kwargs já detectados por _sniff_csv; sem eles, a amostra é lida aqui.
+    """
+    if hasattr(fonte, "seek"): fonte.seek(0)
+    if name.endswith(".csv"):
+        if opts is None: opts = _sniff_csv(fonte)
+        if chunks: kw["chunksize"] = CSV_CHUNK_ROWS
+        return pd.read_csv(fonte, dtype=str, keep_default_na=False, engine="c", **opts, **kw)
+    df = pd.read_excel(fonte, dtype=str, keep_default_na=False, **kw)
+    return [df] if chunks else df
+
+def _com_fallback_latin1(ler, opts: Optional[dict]):
+    """
+    ler(opts) com o encoding detectado; se o CSV tinha cara de utf-8 na amostra
+    mas tem byte inválido mais adiante, lê tudo de novo como latin-1.
+    """
+    try:
+        return ler(opts)
+    except UnicodeDecodeError:
+        if opts is None:
+            raise
+        return ler({**opts, "encoding": "latin-1"})
+
+def _sniff_layout(fonte, name: str) -> Tuple[Optional[dict], int, list]:
+    """
+    Detecta o CSV (_sniff_csv, uma vez por arquivo), decide a linha de cabeçalho e
+    devolve as colunas normalizadas, lendo só amostras. Retorna (opts do CSV ou
+    None, header, colunas): o `layout` que _ler_tabela repassa a _read_raw.
+    """
+    def cabecalho(opts):
+        amostra = _read_raw(fonte, name, opts=opts, nrows=SNIFF_NROWS)
+        cols = [norm_header(c) for c in amostra.columns]
+        # fallback header=2 (FULL Magiic)
+        if (not _tem_col_sku(cols)) and (len(amostra) > 0):
+            try:
+                amostra2 = _read_raw(fonte, name, opts=opts, nrows=SNIFF_NROWS, header=2)
+                return opts, 2, [norm_header(c) for c in amostra2.columns]
+            except Exception:
+                pass
+        return opts, 0, cols
+
+    # o pandas decodifica um buffer maior que as poucas linhas pedidas: byte
+    # inválido logo depois da amostra de bytes já aparece aqui
+    return _com_fallback_latin1(cabecalho, _sniff_csv(fonte) if name.endswith(".csv") else None)
+
+def _limpar_tabela(df: pd.DataFrame) -> pd.DataFrame:
+    """Normaliza a coluna de SKU, tira SKU vazio e linhas de TOTAL (uma máscara só)."""
     cols = set(df.columns)
     sku_col = next((c for c in ["sku","codigo","codigo_sku"] if c in cols), None)
     if sku_col:
-        df[sku_col] = df[sku_col].map(norm_sku)
+        df[sku_col] = norm_sku_series(df[sku_col])
         df = df[df[sku_col] != ""]
-    for c in list(df.columns):
-        df = df[~df[c].astype(str).str.contains(r"^TOTALS?$|^TOTAIS?$", case=False, na=False)]
+    if len(df) and len(df.columns):
+        # coluna a coluna (já são texto: dtype=str), sem cópia n x m do bloco
+        eh_total = np.logical_or.reduce([
+            df.iloc[:, j].str.contains(TOTAL_RE, case=False, na=False).to_numpy()
+            for j in range(df.shape[1])
+        ])
+        df = df[~eh_total]
     return df.reset_index(drop=True)
 
+def _ler_tabela(fonte, file_name: str, usecols_fn=None,
+                layout: Optional[Tuple[Optional[dict], int, list]] = None) -> pd.DataFrame:
+    """
+    Núcleo de load_any_table*: sniff do layout e leitura única.
+    `usecols_fn(colunas_normalizadas) -> posições` restringe as colunas lidas.
+    `layout`: (opts do CSV, header, colunas) já detectados pelo chamador.
+    """
+    name = (file_name or "").lower()
+    opts, header, cols = layout if layout is not None else _sniff_layout(fonte, name)
+    kw = {"header": header} if header else {}
+    usecols = None
+    if usecols_fn is not None:
+        usecols = sorted(set(usecols_fn(cols)))
+        kw["usecols"] = usecols
+
+    def ler(opts_leitura):
+        partes = []
+        for df in _read_raw(fonte, name, chunks=True, opts=opts_leitura, **kw):
+            df.columns = [cols[i] for i in usecols] if usecols is not None else [norm_header(c) for c in df.columns]
+            partes.append(_limpar_tabela(df))
+        return partes
+
+    partes = _com_fallback_latin1(ler, opts)
+    if len(partes) == 1:
+        return partes[0]
+    return pd.concat(partes, ignore_index=True)
+
+def load_any_table(uploaded_file) -> Optional[pd.DataFrame]:
+    if uploaded_file is None:
+        return None
+    try:
+        return _ler_tabela(uploaded_file, uploaded_file.name)
+    except Exception as e:
+        raise RuntimeError(f"Não consegui ler o arquivo '{uploaded_file.name}': {e}")
+
 def load_any_table_from_bytes(file_name: str, blob: bytes) -> pd.DataFrame:
     """Leitura a partir de bytes salvos na sessão (com fallback header=2)."""
-    bio = io.BytesIO(blob); name = (file_name or "").lower()
     try:
-        if name.endswith(".csv"):
-            df = pd.read_csv(bio, dtype=str, keep_default_na=False, sep=None, engine="python")
-        else:
-            df = pd.read_excel(bio, dtype=str, keep_default_na=False)
+        return _ler_tabela(io.BytesIO(blob), file_name)
     except Exception as e:
         raise RuntimeError(f"Não consegui ler o arquivo salvo '{file_name}': {e}")
 
-    df.columns = [norm_header(c) for c in df.columns]
-    tem_col_sku = any(c in df.columns for c in ["sku","codigo","codigo_sku"]) or any("sku" in c for c in df.columns)
-    if (not tem_col_sku) and (len(df) > 0):
-        try:
-            bio.seek(0)
-            if name.endswith(".csv"):
-                df = pd.read_csv(bio, dtype=str, keep_default_na=False, header=2)
-            else:
-                df = pd.read_excel(bio, dtype=str, keep_default_na=False, header=2)
-            df.columns = [norm_header(c) for c in df.columns]
-        except Exception:
-            pass
+def ingerir_pedidos_no_cubo(empresa: str, file_name: str, blob: bytes) -> Optional[dict]:
+    """
+    Export de pedidos (uma linha por item, com data) -> cubo diário de vendas,
+    lido em blocos. None se o arquivo não tem colunas de SKU/quantidade/data.
+    """
+    name = (file_name or "").lower()
+    bio = io.BytesIO(blob)
+    opts, header, cols = _sniff_layout(bio, name)
+    kw = {"header": header} if header else {}
+
+    def blocos(opts_leitura):
+        for df in _read_raw(bio, name, chunks=True, opts=opts_leitura, **kw):
+            df.columns = cols
+            yield df
+
+    # o cubo só é gravado no fim da ingestão: erro no meio não deixa nada pela metade
+    return _com_fallback_latin1(
+        lambda o: cubo_vendas.ingerir_blocos(blocos(o), empresa, arquivo=file_name), opts
+    )
+
+def load_mapped_table_from_bytes(file_name: str, blob, tipo_esperado: str) -> Tuple[str, Optional[pd.DataFrame]]:
+    """
+    Como load_any_table_from_bytes + mapear_tipo + mapear_colunas, mas o tipo sai só do
+    cabeçalho e o corpo é lido apenas com as colunas usadas no mapeamento (mais a 1ª
+    coluna, onde costuma vir o rótulo TOTAL). `blob`: bytes ou arquivo binário
+    com seek (ex.: ARMAZEM.abrir). Retorna (tipo, df mapeado ou None).
+
+    O filtro de TOTAL só vê as colunas lidas: linha com SKU preenchido e "TOTAL"
+    apenas numa coluna não usada (ex.: observação) fica, ao contrário da leitura
+    completa. Linha de total de verdade (SKU vazio, ou rótulo na 1ª coluna) sai igual.
+    """
+    bio = blob if hasattr(blob, "read") else io.BytesIO(blob)
+    name = (file_name or "").lower()
+    try:
+        layout = _sniff_layout(bio, name)
+    except Exception as e:
+        raise RuntimeError(f"Não consegui ler o arquivo salvo '{file_name}': {e}")
+    cols = layout[2]
+    tipo = mapear_tipo(pd.DataFrame(columns=cols))
+    if tipo != tipo_esperado:
+        return tipo, None
 
-    cols = set(df.columns)
-    sku_col = next((c for c in ["sku","codigo","codigo_sku"] if c in cols), None)
-    if sku_col:
-        df[sku_col] = df[sku_col].map(norm_sku)
-        df = df[df[sku_col] != ""]
-    for c in list(df.columns):
-        df = df[~df[c].astype(str).str.contains(r"^TOTALS?$|^TOTAIS?$", case=False, na=False)]
-    return df.reset_index(drop=True)
+    def usecols_fn(cs):
+        escolha = colunas_mapeamento(cs, tipo)
+        usadas = [c for c in escolha.values() if c is not None]
+        usadas += [c for c in ["sku","codigo","codigo_sku"] if c in cs]  # coluna limpa em _limpar_tabela
+        return [0] + [cs.index(c) for c in usadas]
+
+    try:
+        raw = _ler_tabela(bio, file_name, usecols_fn=usecols_fn, layout=layout)
+    except RuntimeError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Não consegui ler o arquivo salvo '{file_name}': {e}")
+    return tipo, mapear_colunas(raw, tipo)
 
 # ===================== PADRÃO KITS/CAT =====================
 @dataclass
 class Catalogo:
     catalogo_simples: pd.DataFrame  # component_sku, fornecedor, status_reposicao
     kits_reais: pd.DataFrame        # kit_sku, component_sku, qty
+    kits_efetivo: Optional[pd.DataFrame] = None  # construir_kits_efetivo já calculado (cache do Padrão)
+    ciclos_kits: Optional[List[List[str]]] = None  # kits em ciclo, do mesmo achatar_kits (cache do Padrão)
 
 def _carregar_padrao_de_content(content: bytes) -> Catalogo:
     try:
@@ -286,9 +520,9 @@ def _carregar_padrao_de_content(content: bytes) -> Catalogo:
     df_kits = df_kits.rename(columns=rename_k)
     exige_colunas(df_kits, ["kit_sku","component_sku","qty"], "KITS")
     df_kits = df_kits[["kit_sku","component_sku","qty"]].copy()
-    df_kits["kit_sku"] = df_kits["kit_sku"].map(norm_sku)
-    df_kits["component_sku"] = df_kits["component_sku"].map(norm_sku)
-    df_kits["qty"] = df_kits["qty"].map(br_to_float).fillna(0).astype(int)
+    df_kits["kit_sku"] = norm_sku_series(df_kits["kit_sku"])
+    df_kits["component_sku"] = norm_sku_series(df_kits["component_sku"])
+    df_kits["qty"] = br_to_float_series(df_kits["qty"]).fillna(0).astype(int)
     # Garante que não há kits/componentes duplicados
     df_kits = df_kits[df_kits["qty"] >= 1].drop_duplicates(subset=["kit_sku","component_sku"], keep="first")
 
@@ -311,7 +545,7 @@ def _carregar_padrao_de_content(content: bytes) -> Catalogo:
         df_cat["fornecedor"] = ""
     if "status_reposicao" not in df_cat.columns:
         df_cat["status_reposicao"] = ""
-    df_cat["component_sku"] = df_cat["component_sku"].map(norm_sku)
+    df_cat["component_sku"] = norm_sku_series(df_cat["component_sku"])
     df_cat["fornecedor"] = df_cat["fornecedor"].fillna("").astype(str)
     df_cat["status_reposicao"] = df_cat["status_reposicao"].fillna("").astype(str)
     
@@ -325,13 +559,125 @@ def _carregar_padrao_de_content(content: bytes) -> Catalogo:
 
     return Catalogo(catalogo_simples=df_cat, kits_reais=df_kits)
 
+# ===================== CACHE DO PADRÃO (KITS/CAT) =====================
+# O Padrão parseado (catálogo, kits e kits efetivos) fica em Parquet no disco, junto com
+# o hash do XLSX e os validadores HTTP (ETag/Last-Modified). Downloads usam GET
+# condicional: 304 ou mesmo hash => lê o Parquet, sem reabrir o Excel. Reiniciar o
+# servidor também só lê o Parquet.
+PADRAO_CACHE_DIR = os.path.join(STORAGE_DIR, "padrao")
+PADRAO_CACHE_VERSAO = "2"  # 2: kits_efetivo com kits de kits achatados
+
+def _padrao_cache_base(chave: str) -> str:
+    return os.path.join(PADRAO_CACHE_DIR, chave)
+
+def _padrao_cache_ler_meta(chave: str) -> dict:
+    try:
+        with open(_padrao_cache_base(chave) + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return meta if meta.get("versao") == PADRAO_CACHE_VERSAO else {}
+    except (OSError, ValueError):
+        return {}
+
+def _padrao_cache_ler(chave: str, meta: dict) -> Optional[Catalogo]:
+    if not meta.get("sha1"): return None
+    base = f"{_padrao_cache_base(chave)}_{meta['sha1']}"
+    try:
+        return Catalogo(
+            catalogo_simples=pd.read_parquet(base + "_catalogo.parquet"),
+            kits_reais=pd.read_parquet(base + "_kits.parquet"),
+            kits_efetivo=pd.read_parquet(base + "_kits_efetivo.parquet"),
+            ciclos_kits=meta.get("ciclos_kits"),
+        )
+    except Exception:
+        return None
+
+def _padrao_cache_gravar(chave: str, cat: Catalogo, meta: dict):
+    """Grava os Parquet do hash novo e só então troca o .json (atomicamente); apaga o hash antigo."""
+    os.makedirs(PADRAO_CACHE_DIR, exist_ok=True)
+    anterior = _padrao_cache_ler_meta(chave).get("sha1")
+    base = f"{_padrao_cache_base(chave)}_{meta['sha1']}"
+    try:
+        for sufixo, df in [("_catalogo", cat.catalogo_simples), ("_kits", cat.kits_reais), ("_kits_efetivo", cat.kits_efetivo)]:
+            tmp = f"{base}{sufixo}.parquet.{os.getpid()}.tmp"
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, f"{base}{sufixo}.parquet")
+        tmp = f"{_padrao_cache_base(chave)}.json.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**meta, "versao": PADRAO_CACHE_VERSAO}, f)
+        os.replace(tmp, _padrao_cache_base(chave) + ".json")
+    except Exception:
+        return  # cache é só otimização
+    if anterior and anterior != meta["sha1"]:
+        for sufixo in ["_catalogo", "_kits", "_kits_efetivo"]:
+            try: os.remove(f"{_padrao_cache_base(chave)}_{anterior}{sufixo}.parquet")
+            except OSError: pass
+
+def padrao_de_bytes_com_cache(chave: str, content: bytes, http_meta: Optional[dict] = None) -> Tuple[Catalogo, bool]:
+    """Parse do XLSX do Padrão, pulado se o mesmo conteúdo (hash) já está no cache. Retorna (cat, veio_do_cache)."""
+    digest = hashlib.sha1(content).hexdigest()
+    meta = _padrao_cache_ler_meta(chave)
+    if meta.get("sha1") == digest:
+        cat = _padrao_cache_ler(chave, meta)
+        if cat is not None:
+            if http_meta:  # atualiza validadores (ETag novo para o mesmo conteúdo)
+                _padrao_cache_gravar(chave, cat, {**meta, **http_meta})
+            return cat, True
+    cat = _carregar_padrao_de_content(content)
+    achatados, cat.ciclos_kits = achatar_kits(cat.kits_reais)  # fecho dos kits uma vez só
+    cat.kits_efetivo = construir_kits_efetivo(cat, achatados)
+    _padrao_cache_gravar(chave, cat, {"sha1": digest, **(http_meta or {}), "ciclos_kits": cat.ciclos_kits})
+    return cat, False
+
+def padrao_de_url_com_cache(url: str, session: Optional[requests.Session] = None) -> Tuple[Catalogo, bool]:
+    """
+    Baixa o XLSX do Padrão com GET condicional (If-None-Match / If-Modified-Since).
+    304 ou conteúdo igual ao do cache => Padrão lido do Parquet. Servidor fora do ar
+    (conexão/timeout/5xx) com cópia no disco => usa a cópia. Retorna (cat, veio_do_cache).
+    """
+    s = session or _requests_session()
+    chave = "url_" + hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    meta = _padrao_cache_ler_meta(chave)
+    headers = {}
+    if meta.get("etag"):          headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        r = s.get(url, headers=headers, timeout=30)
+        if r.status_code >= 500:
+            r.raise_for_status()
+    except requests.RequestException:
+        cat = _padrao_cache_ler(chave, meta)
+        if cat is None:
+            raise
+        return cat, True
+    if r.status_code == 304:
+        cat = _padrao_cache_ler(chave, meta)
+        if cat is not None:
+            return cat, True
+        r = s.get(url, timeout=30)  # cache sumiu do disco: baixa de novo, sem condicional
+    r.raise_for_status()
+    http_meta = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+    return padrao_de_bytes_com_cache(chave, r.content, http_meta)
+
+def _padrao_do_sheets_com_cache(sheet_id: str) -> Tuple[Catalogo, bool]:
+    url = gs_export_xlsx_url(sheet_id)
+    try:
+        return padrao_de_url_com_cache(url)
+    except requests.HTTPError as e:
+        sc = getattr(e.response, "status_code", "?")
+        raise RuntimeError(
+            f"Falha ao baixar XLSX (HTTP {sc}). Verifique: compartilhamento 'Qualquer pessoa com link – Leitor'.\nURL: {url}"
+        )
+
 def carregar_padrao_do_xlsx(sheet_id: str) -> Catalogo:
-    content = baixar_xlsx_do_sheets(sheet_id)
-    return _carregar_padrao_de_content(content)
+    return _padrao_do_sheets_com_cache(sheet_id)[0]
 
 def carregar_padrao_do_link(url: str) -> Catalogo:
-    content = baixar_xlsx_por_link_google(url)
-    return _carregar_padrao_de_content(content)
+    if "export?format=xlsx" not in url:
+        sid = extract_sheet_id_from_url(url)
+        if not sid: raise RuntimeError("Link inválido do Google Sheets (esperado .../d/<ID>/...).")
+        url = gs_export_xlsx_url(sid)
+    return padrao_de_url_com_cache(url)[0]
 
 # NOVO V3.2: Função para tentar carregar localmente ou do Sheets
 def carregar_padrao_local_ou_sheets(sheet_link: str) -> Tuple[Catalogo, str]:
@@ -340,7 +686,8 @@ def carregar_padrao_local_ou_sheets(sheet_link: str) -> Tuple[Catalogo, str]:
         try:
             with open(LOCAL_PADRAO_FILENAME, 'rb') as f:
                 content = f.read()
-            return _carregar_padrao_de_content(content), "local"
+            cat, do_cache = padrao_de_bytes_com_cache("local", content)
+            return cat, "local-cache" if do_cache else "local"
         except Exception as e:
             st.warning(f"Falha ao ler arquivo local '{LOCAL_PADRAO_FILENAME}'. Tentando baixar do Google Sheets. Erro: {e}")
             time.sleep(0.5)
@@ -351,17 +698,19 @@ def carregar_padrao_local_ou_sheets(sheet_link: str) -> Tuple[Catalogo, str]:
         if not sid:
             raise RuntimeError("Link inválido do Google Sheets.")
         
-        content = baixar_xlsx_do_sheets(sid)
-        return _carregar_padrao_de_content(content), "sheets"
+        cat, do_cache = _padrao_do_sheets_com_cache(sid)
+        return cat, "sheets-cache" if do_cache else "sheets"
     except Exception as e:
         raise RuntimeError(f"Falha ao carregar o Padrão do Google Sheets. Erro: {e}")
 
-def construir_kits_efetivo(cat: Catalogo) -> pd.DataFrame:
-    kits = cat.kits_reais.copy()
+def construir_kits_efetivo(cat: Catalogo, achatados: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    # Kits de kits (ex.: combo de dois 3-packs) viram componentes simples; kits em ciclo ficam de fora.
+    # `achatados`: achatar_kits(cat.kits_reais) já calculado por quem chama.
+    kits = achatados if achatados is not None else achatar_kits(cat.kits_reais)[0]
     
     # Obtém os SKUs únicos no catálogo de itens que DEVEM ser repostos
     componentes_validos = set(cat.catalogo_simples["component_sku"].unique())
-    kits_validos = set(kits["kit_sku"].unique())
+    kits_validos = set(cat.kits_reais["kit_sku"].unique())
     
     # 1. Filtra kits e componentes no kits_reais para garantir que só contenha componentes válidos
     kits = kits[kits["component_sku"].isin(componentes_validos)].copy()
@@ -382,6 +731,11 @@ def construir_kits_efetivo(cat: Catalogo) -> pd.DataFrame:
     kits = kits.drop_duplicates(subset=["kit_sku","component_sku"], keep="first")
     return kits
 
+def avisar_ciclos_kits(cat: Catalogo):
+    ciclos = cat.ciclos_kits if cat.ciclos_kits is not None else achatar_kits(cat.kits_reais)[1]
+    if ciclos:
+        st.warning(f"{descrever_ciclos(ciclos)} — ignorados no cálculo, corrija a planilha.")
+
 # ===================== MAPEAMENTO FULL/FISICO/VENDAS =====================
 def mapear_tipo(df: pd.DataFrame) -> str:
     cols = [c.lower() for c in df.columns]
@@ -403,57 +757,46 @@ def mapear_tipo(df: pd.DataFrame) -> str:
         return "VENDAS"
     return "DESCONHECIDO"
 
-def mapear_colunas(df: pd.DataFrame, tipo: str) -> pd.DataFrame:
+def colunas_mapeamento(cols, tipo: str) -> dict:
+    """
+    Escolhe, pelos nomes (normalizados), a coluna de origem de cada campo que
+    mapear_colunas produz. Usado também para ler só essas colunas do arquivo.
+    """
+    cols = list(cols)
     if tipo == "FULL":
-        if "sku" in df.columns:           df["SKU"] = df["sku"].map(norm_sku)
-        elif "codigo" in df.columns:      df["SKU"] = df["codigo"].map(norm_sku)
-        elif "codigo_sku" in df.columns:  df["SKU"] = df["codigo_sku"].map(norm_sku)
-        else: raise RuntimeError("FULL inválido: precisa de coluna SKU/codigo.")
+        sku = next((c for c in ["sku","codigo","codigo_sku"] if c in cols), None)
+        if sku is None: raise RuntimeError("FULL inválido: precisa de coluna SKU/codigo.")
 
-        c_v = [c for c in df.columns if c in ["vendas_qtd_60d","vendas_60d","vendas 60d"] or c.startswith("vendas_60d")]
+        c_v = [c for c in cols if c in ["vendas_qtd_60d","vendas_60d","vendas 60d"] or c.startswith("vendas_60d")]
         if not c_v: raise RuntimeError("FULL inválido: faltou Vendas_60d.")
-        df["Vendas_Qtd_60d"] = df[c_v[0]].map(br_to_float).fillna(0).astype(int)
 
-        c_e = [c for c in df.columns if c in ["estoque_full","estoque_atual"] or ("estoque" in c and "full" in c)]
+        c_e = [c for c in cols if c in ["estoque_full","estoque_atual"] or ("estoque" in c and "full" in c)]
         if not c_e: raise RuntimeError("FULL inválido: faltou Estoque_Full/estoque_atual.")
-        df["Estoque_Full"] = df[c_e[0]].map(br_to_float).fillna(0).astype(int)
 
-        c_t = [c for c in df.columns if c in ["em_transito","em transito","em_transito_full","em_transito_do_anuncio"] or ("transito" in c)]
-        # FIX V3.0: Garante que a coluna Em_Transito exista, mesmo que seja 0.
-        df["Em_Transito"] = df[c_t[0]].map(br_to_float).fillna(0).astype(int) if c_t else 0 
-
-        return df[["SKU","Vendas_Qtd_60d","Estoque_Full","Em_Transito"]].copy()
+        c_t = [c for c in cols if c in ["em_transito","em transito","em_transito_full","em_transito_do_anuncio"] or ("transito" in c)]
+        # FIX V3.0: Garante que a coluna Em_Transito exista, mesmo que seja 0 (None => 0).
+        return {"SKU": sku, "Vendas_Qtd_60d": c_v[0], "Estoque_Full": c_e[0], "Em_Transito": c_t[0] if c_t else None}
 
     if tipo == "FISICO":
-        sku_series = (
-            df["sku"] if "sku" in df.columns else
-            (df["codigo"] if "codigo" in df.columns else
-             (df["codigo_sku"] if "codigo_sku" in df.columns else None))
-        )
-        if sku_series is None:
-            cand = next((c for c in df.columns if "sku" in c.lower()), None)
-            if cand is None: raise RuntimeError("FÍSICO inválido: não achei coluna de SKU.")
-            sku_series = df[cand]
-        df["SKU"] = sku_series.map(norm_sku)
+        sku = next((c for c in ["sku","codigo","codigo_sku"] if c in cols), None)
+        if sku is None:
+            sku = next((c for c in cols if "sku" in c.lower()), None)
+            if sku is None: raise RuntimeError("FÍSICO inválido: não achei coluna de SKU.")
 
-        c_q = [c for c in df.columns if c in ["estoque_atual","qtd","quantidade"] or ("estoque" in c)]
+        c_q = [c for c in cols if c in ["estoque_atual","qtd","quantidade"] or ("estoque" in c)]
         if not c_q: raise RuntimeError("FÍSICO inválido: faltou Estoque.")
-        df["Estoque_Fisico"] = df[c_q[0]].map(br_to_float).fillna(0).astype(int)
 
-        c_p = [c for c in df.columns if c in ["preco","preco_compra","custo","custo_medio","preco_medio","preco_unitario"]]
+        c_p = [c for c in cols if c in ["preco","preco_compra","custo","custo_medio","preco_medio","preco_unitario"]]
         if not c_p: raise RuntimeError("FÍSICO inválido: faltou Preço/Custo.")
-        df["Preco"] = df[c_p[0]].map(br_to_float).fillna(0.0)
-
-        return df[["SKU","Estoque_Fisico","Preco"]].copy()
+        return {"SKU": sku, "Estoque_Fisico": c_q[0], "Preco": c_p[0]}
 
     if tipo == "VENDAS":
-        sku_col = next((c for c in df.columns if "sku" in c.lower()), None)
-        if sku_col is None:
+        sku = next((c for c in cols if "sku" in c.lower()), None)
+        if sku is None:
             raise RuntimeError("VENDAS inválido: não achei coluna de SKU.")
-        df["SKU"] = df[sku_col].map(norm_sku)
 
         cand_qty = []
-        for c in df.columns:
+        for c in cols:
             cl = c.lower(); score = 0
             if "qtde" in cl: score += 3
             if "quant" in cl: score += 2
@@ -463,121 +806,167 @@ def mapear_colunas(df: pd.DataFrame, tipo: str) -> pd.DataFrame:
         if not cand_qty:
             raise RuntimeError("VENDAS inválido: não achei coluna de Quantidade.")
         cand_qty.sort(reverse=True)
-        qcol = cand_qty[0][1]
-        df["Quantidade"] = df[qcol].map(br_to_float).fillna(0).astype(int)
-        return df[["SKU","Quantidade"]].copy()
+        return {"SKU": sku, "Quantidade": cand_qty[0][1]}
 
     raise RuntimeError("Tipo de arquivo desconhecido.")
 
-# ===================== KITS (EXPLOSÃO) =====================
-def explodir_por_kits(df: pd.DataFrame, kits: pd.DataFrame, sku_col: str, qtd_col: str) -> pd.DataFrame:
-    base = df.copy()
-    base["kit_sku"] = base[sku_col].map(norm_sku)
-    base["qtd"]     = base[qtd_col].astype(int)
-    merged   = base.merge(kits, on="kit_sku", how="left")
-    exploded = merged.dropna(subset=["component_sku"]).copy()
-    exploded["qty"] = exploded["qty"].astype(int)
-    exploded["quantidade_comp"] = exploded["qtd"] * exploded["qty"]
-    out = exploded.groupby("component_sku", as_index=False)["quantidade_comp"].sum()
-    out = out.rename(columns={"component_sku":"SKU","quantidade_comp":"Quantidade"})
-    return out
-
-# ===================== COMPRA AUTOMÁTICA (LÓGICA ORIGINAL) =====================
-def calcular(full_df, fisico_df, vendas_df, cat: Catalogo, h=60, g=0.0, LT=0):
-    kits = construir_kits_efetivo(cat)
-    full = full_df.copy()
-    full["SKU"] = full["SKU"].map(norm_sku)
-    full["Vendas_Qtd_60d"] = full["Vendas_Qtd_60d"].astype(int)
-    full["Estoque_Full"]   = full["Estoque_Full"].astype(int)
-    full["Em_Transito"]    = full["Em_Transito"].astype(int) 
-
-    shp = vendas_df.copy()
-    shp["SKU"] = shp["SKU"].map(norm_sku)
-    shp["Quantidade_60d"] = shp["Quantidade"].astype(int)
-
-    # 1. Explode Vendas de FULL/Shopee para nível componente
-    ml_comp = explodir_por_kits(
-        full[["SKU","Vendas_Qtd_60d"]].rename(columns={"SKU":"kit_sku","Vendas_Qtd_60d":"Qtd"}),
-        kits,"kit_sku","Qtd").rename(columns={"Quantidade":"ML_60d"})
-    shopee_comp = explodir_por_kits(
-        shp[["SKU","Quantidade_60d"]].rename(columns={"SKU":"kit_sku","Quantidade_60d":"Qtd"}),
-        kits,"kit_sku","Qtd").rename(columns={"Quantidade":"Shopee_60d"})
-
-    cat_df = cat.catalogo_simples[["component_sku","fornecedor","status_reposicao"]].rename(columns={"component_sku":"SKU"})
-
-    # 2. Mescla Catálogo com Demandas (apenas SKUs do catálogo que DEVEM ser repostos)
-    demanda = cat_df.merge(ml_comp, on="SKU", how="left").merge(shopee_comp, on="SKU", how="left")
-    demanda[["ML_60d","Shopee_60d"]] = demanda[["ML_60d","Shopee_60d"]].fillna(0).astype(int)
-    demanda["TOTAL_60d"] = np.maximum(demanda["ML_60d"] + demanda["Shopee_60d"], demanda["ML_60d"]).astype(int)
-    demanda["Vendas_Total_60d"] = demanda["ML_60d"] + demanda["Shopee_60d"] 
-
-    fis = fisico_df.copy()
-    fis["SKU"] = fis["SKU"].map(norm_sku)
-    fis["Estoque_Fisico"] = fis["Estoque_Fisico"].fillna(0).astype(int)
-    fis["Preco"] = fis["Preco"].fillna(0.0)
-
-    # 3. Mescla com Estoque Físico e FULL
-    base = demanda.merge(fis, on="SKU", how="left")
-    base["Estoque_Fisico"] = base["Estoque_Fisico"].fillna(0).astype(int)
-    base["Preco"] = base["Preco"].fillna(0.0)
-    
-    # FIX V3.0/V3.1: Merge com Full. Garantir que todas as colunas sejam mantidas e preenchidas
-    # Cria um DF de full simplificado para merge
-    full_simple = full[["SKU", "Estoque_Full", "Em_Transito"]].copy()
-    
-    base = base.merge(full_simple, on="SKU", how="left", suffixes=('_base', '_full'))
-    
-    # Se merge do Full falhar, preenche com 0.
-    base["Estoque_Full"] = base["Estoque_Full"].fillna(0).astype(int)
-    base["Em_Transito"] = base["Em_Transito"].fillna(0).astype(int) 
-    # Remove qualquer coluna extra de merge, garantindo que as que precisam ser exibidas estejam lá
-    base = base.drop(columns=[col for col in base.columns if col.endswith('_full') or col.endswith('_base')], errors='ignore')
-
-    
-    # 4. Cálculo de Necessidade (Target)
-    fator = (1.0 + g/100.0) ** (h/30.0)
-    fk = full.copy()
-    fk["vendas_dia"] = fk["Vendas_Qtd_60d"] / 60.0
-    fk["alvo"] = np.round(fk["vendas_dia"] * (LT + h) * fator).astype(int)
-    fk["oferta"] = (full["Estoque_Full"] + full["Em_Transito"]).astype(int) # Usar full_df original (que já tem as colunas garantidas)
-    fk["envio_desejado"] = (fk["alvo"] - fk["oferta"]).clip(lower=0).astype(int)
-
-    necessidade = explodir_por_kits(
-        fk[["SKU","envio_desejado"]].rename(columns={"SKU":"kit_sku","envio_desejado":"Qtd"}),
-        kits,"kit_sku","Qtd").rename(columns={"Quantidade":"Necessidade"})
+def mapear_colunas(df: pd.DataFrame, tipo: str) -> pd.DataFrame:
+    escolha = colunas_mapeamento(df.columns, tipo)
+    df["SKU"] = norm_sku_series(df[escolha["SKU"]])
+    campos = [c for c in escolha if c != "SKU"]
+    for campo in campos:
+        origem = escolha[campo]
+        if origem is None:
+            df[campo] = 0
+        elif campo == "Preco":
+            df[campo] = br_to_float_series(df[origem]).fillna(0.0)
+        else:
+            df[campo] = br_to_float_series(df[origem]).fillna(0).astype(int)
+    return df[["SKU"] + campos].copy()
+
+# ===================== CACHE DE TABELAS MAPEADAS (POR HASH DO CONTEÚDO) =====================
+# Guarda o resultado de load_any_table_from_bytes + mapear_tipo + mapear_colunas em
+# Parquet ao lado dos .bin, com nome pelo hash dos bytes. Recalcular com os mesmos
+# uploads (ex.: mudou só o horizonte) não reabre o Excel. Bump da versão invalida tudo.
+PARSED_CACHE_VERSAO = "1"
+PARSED_CACHE_MAX_BYTES = 256 * 1024 * 1024
+PARSED_CACHE_PREFIX = "parsed_"
+
+def _parsed_cache_digest(digest: str) -> str:
+    """Chave do cache pelo digest do armazém (o conteúdo já está hasheado lá)."""
+    return hashlib.sha1(f"{PARSED_CACHE_VERSAO}:{digest}".encode()).hexdigest()
+
+def _parsed_cache_evict(max_bytes: int = PARSED_CACHE_MAX_BYTES):
+    """LRU por mtime (o acerto faz touch): remove os mais antigos até caber no limite."""
+    entradas = []
+    for nome in os.listdir(STORAGE_DIR):
+        if nome.startswith(PARSED_CACHE_PREFIX) and nome.endswith(".parquet"):
+            path = os.path.join(STORAGE_DIR, nome)
+            try:
+                stt = os.stat(path)
+            except OSError:
+                continue
+            entradas.append((stt.st_mtime, stt.st_size, path))
+    total = sum(e[1] for e in entradas)
+    for _, size, path in sorted(entradas):
+        if total <= max_bytes: break
+        try:
+            os.remove(path); total -= size
+        except OSError:
+            pass
 
-    base = base.merge(necessidade, on="SKU", how="left")
-    base["Necessidade"] = base["Necessidade"].fillna(0).astype(int)
+def ler_tabela_mapeada(file_name: str, digest_upload: str, tipo_esperado: str) -> Tuple[str, Optional[pd.DataFrame]]:
+    """
+    Lê e mapeia um upload do armazém, usando o cache em disco quando o conteúdo já foi visto.
+    Retorna (tipo detectado, df mapeado); df é None se o tipo não for o esperado.
+    """
+    digest = _parsed_cache_digest(digest_upload)
+    for tipo in ["FULL", "FISICO", "VENDAS"]:
+        path = os.path.join(STORAGE_DIR, f"{PARSED_CACHE_PREFIX}{digest}_{tipo}.parquet")
+        if os.path.exists(path):
+            if tipo != tipo_esperado:
+                return tipo, None
+            try:
+                df = pd.read_parquet(path)
+                os.utime(path, None)
+                return tipo, df
+            except Exception:
+                break  # arquivo corrompido/ilegível: refaz a leitura abaixo
 
-    base["Demanda_dia"]  = base["TOTAL_60d"] / 60.0
-    base["Reserva_30d"]  = np.round(base["Demanda_dia"] * 30).astype(int)
-    base["Folga_Fisico"] = (base["Estoque_Fisico"] - base["Reserva_30d"]).clip(lower=0).astype(int)
+    try:
+        fonte = ARMAZEM.abrir(digest_upload)
+    except FileNotFoundError:
+        raise RuntimeError(f"O arquivo salvo '{file_name}' saiu do cache do servidor; faça o upload de novo.")
+    with fonte:
+        tipo, df = load_mapped_table_from_bytes(file_name, fonte, tipo_esperado)
+    if df is None:
+        return tipo, None
+
+    path = os.path.join(STORAGE_DIR, f"{PARSED_CACHE_PREFIX}{digest}_{tipo}.parquet")
+    tmp  = f"{path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        _parsed_cache_evict()
+    except Exception:
+        # cache é só otimização: falha de escrita não pode derrubar o cálculo
+        if os.path.exists(tmp): os.remove(tmp)
+    return tipo, df
 
-    base["Compra_Sugerida"] = (base["Necessidade"] - base["Folga_Fisico"]).clip(lower=0).astype(int)
+# ===================== COMPRA AUTOMÁTICA (LÓGICA ORIGINAL) =====================
+# O cálculo roda no motor (v4_api/engine_compras.py) em duas etapas: a base
+# (independente de h/g/LT) fica em sessão por empresa, e mudar os parâmetros
+# no sidebar só refaz a etapa paramétrica (aplicar_parametros).
+def preparar_calculo(full_df, fisico_df, vendas_df, cat: Catalogo, chave: str = "", por_empresa: bool = False,
+                     ocs_abertas: Optional[pd.DataFrame] = None) -> BaseCalculo:
+    kits = cat.kits_efetivo if cat.kits_efetivo is not None else construir_kits_efetivo(cat)
+    # compilado uma vez, usado em todas as explosões (dicionário de SKUs inclui o catálogo)
+    kidx = KitExplosionIndex.de_kits(kits, skus_extra=cat.catalogo_simples["component_sku"])
+    # SKUs normalizados aqui (com unidecode); o motor só reaplica strip/upper
+    full = full_df.assign(SKU=norm_sku_series(full_df["SKU"]))
+    fis  = fisico_df.assign(SKU=norm_sku_series(fisico_df["SKU"]))
+    shp  = vendas_df.assign(SKU=norm_sku_series(vendas_df["SKU"]))
+    return preparar_base_calculo(
+        full, fis, shp, cat.catalogo_simples, cat.kits_reais, kidx=kidx, chave=chave, por_empresa=por_empresa,
+        ocs_abertas=ocs_abertas,
+    )
 
-    base["Valor_Compra_R$"] = (base["Compra_Sugerida"].astype(float) * base["Preco"].astype(float)).round(2)
-    
-    # ATENÇÃO: Seleção das colunas finais
-    df_final = base[[
-        "SKU","fornecedor",
-        "Vendas_Total_60d",
-        "Estoque_Full",
-        "Estoque_Fisico","Preco","Compra_Sugerida","Valor_Compra_R$",
-        "ML_60d","Shopee_60d","TOTAL_60d","Reserva_30d","Folga_Fisico","Necessidade", "Em_Transito"
-    ]].reset_index(drop=True)
-
-    # Painel (mantido o original para métricas)
-    fis_unid  = int(fis["Estoque_Fisico"].sum())
-    fis_valor = float((fis["Estoque_Fisico"] * fis["Preco"]).sum())
-    full_stock_comp = explodir_por_kits(
-        full[["SKU","Estoque_Full"]].rename(columns={"SKU":"kit_sku","Estoque_Full":"Qtd"}),
-        kits,"kit_sku","Qtd")
-    full_stock_comp = full_stock_comp.merge(fis[["SKU","Preco"]], on="SKU", how="left")
-    full_unid  = int(full["Estoque_Full"].sum())
-    full_valor = float((full_stock_comp["Quantidade"].fillna(0) * full_stock_comp["Preco"].fillna(0.0)).sum())
-
-    painel = {"full_unid": full_unid, "full_valor": full_valor, "fisico_unid": fis_unid, "fisico_valor": fis_valor}
-    return df_final, painel
+def calcular(full_df, fisico_df, vendas_df, cat: Catalogo, h=60, g=0.0, LT=0):
+    return aplicar_parametros(preparar_calculo(full_df, fisico_df, vendas_df, cat), h=h, g=g, LT=LT)
+
+@st.cache_resource(show_spinner=False)
+def _memo_resultados() -> memo_resultados.MemoResultados:
+    """
+    Memo do processo (todas as sessões): ("base", chave) -> BaseCalculo e
+    ("resultado", chave, h, g, LT) -> {empresa: df_final}. Os valores são
+    compartilhados e só lidos; a tela filtra sobre cópias.
+    """
+    return memo_resultados.MemoResultados()
+
+def aplicar_e_distribuir(prep: BaseCalculo, empresas: list):
+    """Etapa paramétrica com os h/g/LT do sidebar; grava resultado_<empresa> de cada empresa da base."""
+    h, g, LT = st.session_state.param_h, st.session_state.param_g, st.session_state.param_lt
+    memo = _memo_resultados()
+    chave = ("resultado", prep.chave, h, g, LT)
+    partes = memo.obter(chave) if prep.chave else None
+    if partes is None:
+        df_final, _ = aplicar_parametros(prep, h=h, g=g, LT=LT)
+        if not prep.por_empresa:
+            partes = {empresas[0]: df_final}
+        else:
+            grupos = dict(tuple(df_final.groupby(COL_EMPRESA, sort=False)))
+            partes = {
+                emp: grupos.get(emp, df_final.iloc[:0]).drop(columns=COL_EMPRESA).reset_index(drop=True)
+                for emp in empresas  # empresa sem nenhuma linha nas entradas => df vazio
+            }
+        if prep.chave:
+            memo.guardar(chave, partes)
+    for emp in empresas:
+        st.session_state[f"resultado_{emp}"] = partes[emp]
+
+def gravar_historico(prep: BaseCalculo, empresas: list):
+    """Snapshot (v4_api/historico_compras) do resultado de cada empresa; falha só gera aviso."""
+    try:
+        for emp in empresas:
+            historico_compras.gravar_snapshot(
+                st.session_state[f"resultado_{emp}"], emp,
+                st.session_state.param_h, st.session_state.param_g, st.session_state.param_lt,
+                versao_padrao=str(st.session_state.padrao_versao), chave_entradas=prep.chave,
+                extra={"origem": "app", "ocs_abertas": prep.oc_aberta is not None},
+            )
+    except Exception as e:
+        st.warning(f"Histórico não gravado: {e}")
+
+def reaplicar_parametros():
+    """Callback do sidebar: refaz só a etapa paramétrica dos resultados já gerados."""
+    grupos = {}  # id da base -> (base, empresas que a usam)
+    for emp in EMPRESAS:
+        prep = st.session_state.get(f"base_{emp}")
+        if prep is None or st.session_state.get(f"resultado_{emp}") is None:
+            continue
+        grupos.setdefault(id(prep), (prep, []))[1].append(emp)
+    for prep, emps in grupos.values():
+        aplicar_e_distribuir(prep, emps)
 
 # ===================== EXPORT CSV / STYLER =====================
 def exportar_carrinho_csv(df: pd.DataFrame) -> bytes:
@@ -642,9 +1031,18 @@ def style_df_compra(df: pd.DataFrame):
 # ===================== UI: SIDEBAR (PADRÃO) =====================
 with st.sidebar:
     st.subheader("Parâmetros")
-    h  = st.selectbox("Horizonte (dias)", [30, 60, 90], index=1, key="param_h")
-    g  = st.number_input("Crescimento % ao mês", value=0.0, step=1.0, key="param_g")
-    LT = st.number_input("Lead time (dias)", value=0, step=1, min_value=0, key="param_lt")
+    h  = st.selectbox("Horizonte (dias)", [30, 60, 90], index=1, key="param_h", on_change=reaplicar_parametros)
+    g  = st.number_input("Crescimento % ao mês", value=0.0, step=1.0, key="param_g", on_change=reaplicar_parametros)
+    LT = st.number_input("Lead time (dias)", value=0, step=1, min_value=0, key="param_lt", on_change=reaplicar_parametros)
+    st.checkbox("Descontar OCs em aberto", value=True, key="param_ocs",
+                help="Soma ao Em_Transito o que já foi pedido (controle_ocs.db) e não chegou, "
+                     "e desconta da compra. Vale no próximo 'Gerar Compra'.")
+    st.checkbox("Vendas 60d do cubo diário", value=False, key="param_vendas_cubo",
+                help="Usa os últimos 60 dias do cubo de vendas (acumulado dos exports de pedidos "
+                     "enviados) no lugar do arquivo Shopee/MT atual. Vale no próximo 'Gerar Compra'.")
+    _memo = _memo_resultados().estatisticas()
+    st.caption(f"Cache de cálculos (servidor): {_memo['acertos']} acertos / {_memo['erros']} erros · "
+               f"{_memo['entradas']} itens, {_memo['bytes'] / 1e6:.0f} de {_memo['max_bytes'] / 1e6:.0f} MB")
 
     st.markdown("---")
     st.subheader("Padrão (KITS/CAT)")
@@ -665,10 +1063,13 @@ with st.sidebar:
                 
                 st.session_state.catalogo_df = cat.catalogo_simples.rename(columns={"component_sku":"sku"})
                 st.session_state.kits_df = cat.kits_reais
+                st.session_state.kits_efetivo_df = cat.kits_efetivo
+                st.session_state.padrao_versao = hash_tabelas(cat.catalogo_simples, cat.kits_reais)
                 st.session_state.loaded_at = dt.datetime.now().strftime(f"%Y-%m-%d %H:%M:%S {origem}")
                 st.success(f"Padrão carregado com sucesso (Origem: {origem}).")
+                avisar_ciclos_kits(cat)
             except Exception as e:
-                st.session_state.catalogo_df = None; st.session_state.kits_df = None; st.session_state.loaded_at = None
+                st.session_state.catalogo_df = None; st.session_state.kits_df = None; st.session_state.kits_efetivo_df = None; st.session_state.loaded_at = None
                 st.error(str(e))
     with colB:
         st.link_button("🔗 Abrir no Drive (editar)", DEFAULT_SHEET_LINK, use_container_width=True)
@@ -681,10 +1082,13 @@ with st.sidebar:
             cat = carregar_padrao_do_link(st.session_state.alt_sheet_link.strip())
             st.session_state.catalogo_df = cat.catalogo_simples.rename(columns={"component_sku":"sku"})
             st.session_state.kits_df = cat.kits_reais
+            st.session_state.kits_efetivo_df = cat.kits_efetivo
+            st.session_state.padrao_versao = hash_tabelas(cat.catalogo_simples, cat.kits_reais)
             st.session_state.loaded_at = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S alt_sheets")
             st.success("Padrão carregado (link alternativo).")
+            avisar_ciclos_kits(cat)
         except Exception as e:
-            st.session_state.catalogo_df = None; st.session_state.kits_df = None; st.session_state.loaded_at = None
+            st.session_state.catalogo_df = None; st.session_state.kits_df = None; st.session_state.kits_efetivo_df = None; st.session_state.loaded_at = None
             st.error(str(e))
 
 # ===================== TÍTULO =====================
@@ -711,22 +1115,30 @@ with tab1:
         
         # Funções para upload e persistência
         def handle_upload(up_file, file_type):
-            if up_file is not None:
-                up_bytes = up_file.read()
-                path_bin = get_local_file_path(emp, file_type)
-                path_name = get_local_name_path(emp, file_type)
-                
-                # Salva no disco (bytes e nome)
-                with open(path_bin, 'wb') as f_bin:
-                    f_bin.write(up_bytes)
-                with open(path_name, 'w', encoding='utf-8') as f_name:
-                    f_name.write(up_file.name)
-                    
-                # Salva metadados na sessão
-                st.session_state[emp][file_type]["name"]  = up_file.name
-                st.session_state[emp][file_type]["bytes"] = up_bytes
-                st.session_state[emp][file_type]['is_cached'] = True
+            state = st.session_state[emp][file_type]
+            # o uploader devolve o mesmo arquivo a cada rerun: grava só uma vez
+            if up_file is not None and state.get("upload_id") != up_file.file_id:
+                up_bytes = up_file.getvalue()
+                # Salva no armazém (objeto pelo hash + referência, gravação atômica)
+                digest = ARMAZEM.publicar(emp, file_type, up_file.name, up_bytes)
+
+                # Sessão guarda só a referência
+                state["name"]   = up_file.name
+                state["digest"] = digest
+                state["upload_id"] = up_file.file_id
+                state['is_cached'] = True
                 st.success(f"{file_type} carregado e salvo: {up_file.name}")
+
+                if file_type == "VENDAS":
+                    try:
+                        resumo = ingerir_pedidos_no_cubo(emp, up_file.name, up_bytes)
+                    except Exception as e:
+                        st.warning(f"Vendas não entraram no cubo diário: {e}")
+                    else:
+                        if resumo and resumo["dia_ini"]:
+                            st.caption(f"Cubo diário: {resumo['pares']} pares SKU/dia de "
+                                       f"{resumo['dia_ini']} a {resumo['dia_fim']} "
+                                       f"({resumo['linhas_ignoradas']} linhas sem data/SKU ignoradas).")
         
         def display_status(file_type):
             if st.session_state[emp][file_type]["name"]:
@@ -761,22 +1173,25 @@ with tab1:
             if st.button(f"Limpar {emp} e Cache", use_container_width=True, key=f"clr_{emp}"):
                 # Limpa os arquivos do disco
                 for file_type in ["FULL", "VENDAS", "ESTOQUE"]:
+                    ARMAZEM.remover_referencia(emp, file_type)
                     if os.path.exists(get_local_file_path(emp, file_type)):
                         os.remove(get_local_file_path(emp, file_type))
                     if os.path.exists(get_local_name_path(emp, file_type)):
                         os.remove(get_local_name_path(emp, file_type))
-                
+                ARMAZEM.podar()
+
                 # Limpa a sessão
-                st.session_state[emp] = {"FULL":{"name":None,"bytes":None},
-                                         "VENDAS":{"name":None,"bytes":None},
-                                         "ESTOQUE":{"name":None,"bytes":None}}
+                st.session_state[emp] = {"FULL":{"name":None,"digest":None},
+                                         "VENDAS":{"name":None,"digest":None},
+                                         "ESTOQUE":{"name":None,"digest":None}}
                 st.session_state[f"resultado_{emp}"] = None
+                st.session_state[f"base_{emp}"] = None
                 st.info(f"{emp} limpo e cache de disco apagado.")
 
         st.divider()
 
-    bloco_empresa("ALIVVIA")
-    bloco_empresa("JCA")
+    for emp in EMPRESAS:
+        bloco_empresa(emp)
 
 # ---------- TAB 2: ANÁLISE DE COMPRA (CONSOLIDADO) ----------
 with tab2:
@@ -787,283 +1202,217 @@ with tab2:
     else:
         
         # --- Cálculo/Persistência ---
-        def run_calculo(empresa: str):
+        def ler_entradas(empresa: str):
             dados = st.session_state[empresa]
+            # leitura pelo armazém + tipagem (cache em disco pelo hash do conteúdo)
+            t_full, full_df   = ler_tabela_mapeada(dados["FULL"]["name"], dados["FULL"]["digest"], "FULL")
+            if t_full != "FULL":   raise RuntimeError(f"FULL inválido ({empresa}): precisa de SKU e Vendas_60d/Estoque_full.")
+            if usar_cubo_vendas(empresa):
+                vendas_df = cubo_vendas.vendas_janela(empresa, 60)
+            else:
+                t_v, vendas_df = ler_tabela_mapeada(dados["VENDAS"]["name"], dados["VENDAS"]["digest"], "VENDAS")
+                if t_v != "VENDAS": raise RuntimeError(f"Vendas inválido ({empresa}): não achei coluna de quantidade.")
+            t_f, fisico_df    = ler_tabela_mapeada(dados["ESTOQUE"]["name"], dados["ESTOQUE"]["digest"], "FISICO")
+            if t_f    != "FISICO": raise RuntimeError(f"Estoque inválido ({empresa}): precisa de Estoque e Preço.")
+            return full_df, fisico_df, vendas_df
+
+        def usar_cubo_vendas(empresa: str) -> bool:
+            """Vendas da empresa saem do cubo diário (opção ligada e cubo com dados)?"""
+            if not st.session_state.get("param_vendas_cubo", False):
+                return False
             try:
-                # valida presença
-                for k, rot in [("FULL","FULL"),("VENDAS","Shopee/MT"),("ESTOQUE","Estoque")]:
-                    if not (dados[k]["name"] and dados[k]["bytes"]):
-                        raise RuntimeError(f"Arquivo '{rot}' não foi salvo para {empresa}. Vá em **Dados das Empresas** e salve.")
-
-                # leitura pelos BYTES
-                full_raw   = load_any_table_from_bytes(dados["FULL"]["name"], dados["FULL"]["bytes"])
-                vendas_raw = load_any_table_from_bytes(dados["VENDAS"]["name"], dados["VENDAS"]["bytes"])
-                fisico_raw = load_any_table_from_bytes(dados["ESTOQUE"]["name"], dados["ESTOQUE"]["bytes"])
-
-                # tipagem
-                t_full = mapear_tipo(full_raw)
-                t_v    = mapear_tipo(vendas_raw)
-                t_f    = mapear_tipo(fisico_raw)
-                if t_full != "FULL":   raise RuntimeError("FULL inválido: precisa de SKU e Vendas_60d/Estoque_full.")
-                if t_v    != "VENDAS": raise RuntimeError("Vendas inválido: não achei coluna de quantidade.")
-                if t_f    != "FISICO": raise RuntimeError("Estoque inválido: precisa de Estoque e Preço.")
-
-                full_df   = mapear_colunas(full_raw, t_full)
-                vendas_df = mapear_colunas(vendas_raw, t_v)
-                fisico_df = mapear_colunas(fisico_raw, t_f)
+                return cubo_vendas.ultimo_dia(empresa) is not None
+            except Exception as e:
+                st.warning(f"Cubo de vendas indisponível ({empresa}); usando o arquivo Shopee/MT: {e}")
+                return False
 
-                cat = Catalogo(
-                    catalogo_simples=st.session_state.catalogo_df.rename(columns={"sku":"component_sku"}),
-                    kits_reais=st.session_state.kits_df
-                )
-                df_final, painel = calcular(full_df, fisico_df, vendas_df, cat, h=st.session_state.param_h, g=st.session_state.param_g, LT=st.session_state.param_lt)
-                
-                # NOVO: Persiste o resultado
-                st.session_state[f"resultado_{empresa}"] = df_final
-                st.success(f"Cálculo para {empresa} concluído.")
+        def ler_ocs_abertas(empresas: list) -> Optional[pd.DataFrame]:
+            """Em aberto por (Empresa, SKU) das empresas do cálculo; None se desligado ou sem banco."""
+            if not st.session_state.get("param_ocs", True):
+                return None
+            try:
+                ocs_df = ocs_compras.em_aberto_por_sku()
+            except Exception as e:
+                st.warning(f"OCs em aberto ignoradas (controle_ocs.db indisponível): {e}")
+                return None
+            return ocs_df[ocs_df[COL_EMPRESA].isin(empresas)].reset_index(drop=True)
+
+        def run_calculo(empresas: list):
+            rotulo = " + ".join(empresas)
+            try:
+                # valida presença
+                for empresa in empresas:
+                    dados = st.session_state[empresa]
+                    for k, rot in [("FULL","FULL"),("VENDAS","Shopee/MT"),("ESTOQUE","Estoque")]:
+                        if not (dados[k]["name"] and dados[k]["digest"]):
+                            raise RuntimeError(f"Arquivo '{rot}' não foi salvo para {empresa}. Vá em **Dados das Empresas** e salve.")
+
+                ocs_df = ler_ocs_abertas(empresas)
+
+                # Base independente de h/g/LT: reaproveitada enquanto arquivos, Padrão e OCs não mudarem
+                chave = hashlib.sha1("|".join(
+                    [f"{emp}:{st.session_state[emp][k]['digest']}"
+                     for emp in empresas for k in ["FULL", "VENDAS", "ESTOQUE"]]
+                    + [f"{emp}:cubo-{cubo_vendas.versao_cubo(emp)}" for emp in empresas if usar_cubo_vendas(emp)]
+                    + [str(st.session_state.padrao_versao),
+                       hash_tabelas(ocs_df) if ocs_df is not None else "sem-ocs"]
+                ).encode()).hexdigest()[:16]
+                prep = st.session_state[f"base_{empresas[0]}"]
+                if prep is None or prep.chave != chave:
+                    # outra sessão pode já ter preparado a mesma base
+                    prep = _memo_resultados().obter(("base", chave))
+                if prep is None:
+                    cat = Catalogo(
+                        catalogo_simples=st.session_state.catalogo_df.rename(columns={"sku":"component_sku"}),
+                        kits_reais=st.session_state.kits_df,
+                        kits_efetivo=st.session_state.kits_efetivo_df
+                    )
+                    if len(empresas) == 1:
+                        prep = preparar_calculo(
+                            *ler_entradas(empresas[0]), cat, chave=chave,
+                            ocs_abertas=ocs_df.drop(columns=COL_EMPRESA) if ocs_df is not None else None,
+                        )
+                    else:
+                        # Todas as empresas empilhadas: uma passada só sobre os mesmos kits
+                        entradas = [[df.assign(**{COL_EMPRESA: emp}) for df in ler_entradas(emp)] for emp in empresas]
+                        full_df, fisico_df, vendas_df = [pd.concat(dfs, ignore_index=True) for dfs in zip(*entradas)]
+                        prep = preparar_calculo(full_df, fisico_df, vendas_df, cat, chave=chave, por_empresa=True,
+                                                ocs_abertas=ocs_df)
+                    _memo_resultados().guardar(("base", chave), prep)
+                for emp in empresas:
+                    st.session_state[f"base_{emp}"] = prep
+
+                # NOVO: Persiste o resultado (sessão + snapshot no histórico)
+                aplicar_e_distribuir(prep, empresas)
+                gravar_historico(prep, empresas)
+                st.success(f"Cálculo para {rotulo} concluído.")
                 
             except Exception as e:
-                st.error(f"Erro ao calcular {empresa}: {str(e)}")
+                st.error(f"Erro ao calcular {rotulo}: {str(e)}")
 
-        colC, colD = st.columns(2)
-        with colC:
-            if st.button("Gerar Compra — ALIVVIA", type="primary"):
-                run_calculo("ALIVVIA")
-        with colD:
-            if st.button("Gerar Compra — JCA", type="primary"):
-                run_calculo("JCA")
+        cols_btn = st.columns(len(EMPRESAS) + 1)
+        for col_btn, emp in zip(cols_btn, EMPRESAS):
+            with col_btn:
+                if st.button(f"Gerar Compra — {emp}", type="primary"):
+                    run_calculo([emp])
+        with cols_btn[-1]:
+            if st.button("Gerar Compra — Todas", type="primary"):
+                run_calculo(EMPRESAS)
 
         # --- Filtros e Visualização ---
         st.markdown("---")
         st.subheader("Filtros de Análise (Aplicado em Ambas Empresas)")
         
-        df_A = st.session_state.resultado_ALIVVIA
-        df_J = st.session_state.resultado_JCA
-        
-        if df_A is None and df_J is None:
+        resultados = {emp: st.session_state[f"resultado_{emp}"] for emp in EMPRESAS}
+
+        if all(df is None for df in resultados.values()):
             st.info("Gere o cálculo para pelo menos uma empresa acima para visualizar e filtrar.")
         else:
-            df_full = pd.concat([df for df in [df_A, df_J] if df is not None], ignore_index=True)
-            
             # Filtros dinâmicos
             c1, c2 = st.columns(2)
             with c1:
                 # FIX V3.2.1: Adiciona o callback on_change para resetar a seleção ao filtrar por SKU
                 sku_filter = st.text_input("Filtro por SKU (contém)", key="filt_sku", on_change=reset_selection).upper().strip()
             with c2:
-                fornecedor_opc = df_full["fornecedor"].unique().tolist() if df_full is not None else []
+                fornecedor_opc = pd.concat(
+                    [df["fornecedor"] for df in resultados.values() if df is not None], ignore_index=True
+                ).unique().tolist()
                 fornecedor_opc.insert(0, "TODOS")
                 # FIX V3.2.1: Adiciona o callback on_change para resetar a seleção ao filtrar por Fornecedor
                 fornecedor_filter = st.selectbox("Filtro por Fornecedor", fornecedor_opc, key="filt_forn", on_change=reset_selection)
-            
-            # Aplica filtros
-            def aplicar_filtro(df: pd.DataFrame) -> pd.DataFrame:
-                if df is None: return None
-                df_filt = df.copy()
+
+            # Aplica filtros: posições (no resultado) das linhas visíveis
+            def posicoes_filtradas(df: pd.DataFrame) -> np.ndarray:
+                m = np.ones(len(df), dtype=bool)
                 if sku_filter:
-                    df_filt = df_filt[df_filt["SKU"].str.contains(sku_filter, na=False)]
+                    m &= df["SKU"].str.contains(sku_filter, na=False).to_numpy()
                 if fornecedor_filter != "TODOS":
-                    df_filt = df_filt[df_filt["fornecedor"] == fornecedor_filter]
-                return df_filt
-
-            df_A_filt = aplicar_filtro(df_A)
-            df_J_filt = aplicar_filtro(df_J)
+                    m &= (df["fornecedor"] == fornecedor_filter).to_numpy()
+                return np.flatnonzero(m)
 
             # --- Adicionar ao Carrinho ---
             st.markdown("---")
             st.subheader("Seleção de Itens para Compra (Carrinho)")
 
             if st.button("🛒 Adicionar Itens Selecionados ao Pedido", type="secondary"):
-                carrinho = []
-                
-                # FIX V3.2.2: Filtra o DataFrame COMPLETO (resultado) usando o dicionário de SKUs selecionados
-                
-                # 1. Processa ALIVVIA
-                selected_skus_A = {sku for sku, selected in st.session_state.sel_A.items() if selected}
-                selec_A = df_A[df_A["SKU"].isin(selected_skus_A)] if df_A is not None else pd.DataFrame()
-                
-                if not selec_A.empty:
-                    selec_A = selec_A[selec_A["Compra_Sugerida"] > 0].copy()
-                    selec_A["Empresa"] = "ALIVVIA"
-                    carrinho.append(selec_A)
-                
-                # 2. Processa JCA
-                selected_skus_J = {sku for sku, selected in st.session_state.sel_J.items() if selected}
-                selec_J = df_J[df_J["SKU"].isin(selected_skus_J)] if df_J is not None else pd.DataFrame()
-
-                if not selec_J.empty:
-                    selec_J = selec_J[selec_J["Compra_Sugerida"] > 0].copy()
-                    selec_J["Empresa"] = "JCA"
-                    carrinho.append(selec_J)
-                
-                if carrinho:
-                    # Remove colunas de auditoria para o carrinho
-                    cols_carrinho = ["Empresa", "SKU", "fornecedor", "Preco", "Compra_Sugerida", "Valor_Compra_R$"]
-                    carrinho_df = pd.concat(carrinho)[cols_carrinho]
-                    carrinho_df.columns = ["Empresa", "SKU", "Fornecedor", "Preco_Custo", "Qtd_Sugerida", "Valor_Sugerido_R$"]
-                    carrinho_df["Qtd_Ajustada"] = carrinho_df["Qtd_Sugerida"]
-                    
-                    # Força a tipagem antes de salvar no carrinho (CRUCIAL)
-                    carrinho_df = enforce_numeric_types(carrinho_df)
-
-                    st.session_state.carrinho_compras = [carrinho_df.reset_index(drop=True)]
+                # O carrinho acompanha a seleção (sincronizar_carrinho); aqui só confirma
+                carrinho_df = sincronizar_carrinho()
+                if len(carrinho_df):
                     st.success(f"Adicionado {len(carrinho_df)} itens ao Pedido de Compra. Vá para a aba '🛒 Pedido de Compra' para finalizar.")
                 else:
                     st.warning("Nenhum item com Compra Sugerida > 0 foi selecionado.")
-            
-                     # --- Visualização de Resultados ---
+
+            # --- Visualização de Resultados ---
             col_order = ["Selecionar", "SKU", "fornecedor", "Vendas_Total_60d",
                          "Estoque_Full", "Estoque_Fisico", "Preco",
                          "Compra_Sugerida", "Valor_Compra_R$", "Em_Transito"]
-            
-            # -------- ALIVVIA --------
-            if df_A_filt is not None and not df_A_filt.empty:
-                st.markdown("### ALIVVIA")
-                
-                # Força a tipagem antes de estilizar
-                df_A_filt_typed = enforce_numeric_types(df_A_filt)
-                
-                # Popula a coluna 'Selecionar' a partir do dicionário global
-                df_A_filt_typed["Selecionar"] = df_A_filt_typed["SKU"].apply(
-                    lambda sku: st.session_state.sel_A.get(sku, False)
-                )
 
-                # EDITOR interativo (agora sim os checkboxes funcionam)
-                edited_df_A = st.data_editor(
-                    df_A_filt_typed[col_order],
+            for emp in EMPRESAS:
+                df = resultados[emp]
+                pos = posicoes_filtradas(df) if df is not None else np.zeros(0, dtype=np.int64)
+                if len(pos) == 0:
+                    st.info(f"{emp}: Nenhum item corresponde aos filtros.")
+                    continue
+                st.markdown(f"### {emp}")
+
+                # Vista: só as linhas filtradas e as colunas exibidas; 'Selecionar' sai da máscara
+                mask = mascara_selecao(emp)
+                sel = st.session_state[f"sel_{emp}"]
+                vista = enforce_numeric_types(df.iloc[pos][col_order[1:]])
+                vista.insert(0, "Selecionar", mask[pos])
+                sel["vista"] = pos
+
+                key = f"df_view_{emp}_{sel['versao']}"
+                st.data_editor(
+                    vista,
                     use_container_width=True,
                     column_order=col_order,
                     column_config={
                         "Selecionar": st.column_config.CheckboxColumn("Comprar", default=False)
                     },
                     disabled=[c for c in col_order if c != "Selecionar"],
-                    key="df_view_A"
-                )
-                
-                # Atualiza o dicionário global com base no que o usuário marcou
-                if isinstance(edited_df_A, pd.DataFrame) and "Selecionar" in edited_df_A.columns:
-                    for _, row in edited_df_A.iterrows():
-                        sku = row["SKU"]
-                        is_selected = bool(row["Selecionar"])
-                        if is_selected:
-                            st.session_state.sel_A[sku] = True
-                        elif sku in st.session_state.sel_A:
-                            st.session_state.sel_A[sku] = False
-            else:
-                st.info("ALIVVIA: Nenhum item corresponde aos filtros.")
-
-            # -------- JCA --------
-            if df_J_filt is not None and not df_J_filt.empty:
-                st.markdown("### JCA")
-                
-                # Força a tipagem antes de estilizar
-                df_J_filt_typed = enforce_numeric_types(df_J_filt)
-
-                # Popula a coluna 'Selecionar' a partir do dicionário global
-                df_J_filt_typed["Selecionar"] = df_J_filt_typed["SKU"].apply(
-                    lambda sku: st.session_state.sel_J.get(sku, False)
+                    key=key,
+                    on_change=aplicar_delta_selecao,
+                    args=(emp, key, sel["versao"]),
                 )
-                
-                edited_df_J = st.data_editor(
-                    df_J_filt_typed[col_order],
-                    use_container_width=True,
-                    column_order=col_order,
-                    column_config={
-                        "Selecionar": st.column_config.CheckboxColumn("Comprar", default=False)
-                    },
-                    disabled=[c for c in col_order if c != "Selecionar"],
-                    key="df_view_J"
-                )
-                
-                # Atualiza o dicionário global com base no que o usuário marcou
-                if isinstance(edited_df_J, pd.DataFrame) and "Selecionar" in edited_df_J.columns:
-                    for _, row in edited_df_J.iterrows():
-                        sku = row["SKU"]
-                        is_selected = bool(row["Selecionar"])
-                        if is_selected:
-                            st.session_state.sel_J[sku] = True
-                        elif sku in st.session_state.sel_J:
-                            st.session_state.sel_J[sku] = False
-            else:
-                st.info("JCA: Nenhum item corresponde aos filtros.")
-
 
-
-            if df_J_filt is not None and not df_J_filt.empty:
-                st.markdown("### JCA")
-                # Força a tipagem antes de estilizar (CORREÇÃO DE ERRO)
-                df_J_filt_typed = enforce_numeric_types(df_J_filt)
-
-                # FIX V3.2.2: Popula a coluna 'Selecionar' do DF FILTRADO a partir do Dicionário global
-                df_J_filt_typed["Selecionar"] = df_J_filt_typed["SKU"].apply(
-                    lambda sku: st.session_state.sel_J.get(sku, False)
-                )
-                
-                edited_df_J = st.dataframe(
-                    style_df_compra(df_J_filt_typed[col_order]),
-                    use_container_width=True,
-                    column_order=col_order,
-                    column_config={"Selecionar": st.column_config.CheckboxColumn("Comprar", default=False)},
-                    key="df_view_J"
-                )
-                
-                # FIX V3.2.2: Processa o output do dataframe para atualizar o Dicionário global (SKU-base)
-                if isinstance(edited_df_J, pd.DataFrame) and "Selecionar" in edited_df_J.columns:
-                    for index, row in edited_df_J.iterrows():
-                        sku = row["SKU"]
-                        is_selected = row["Selecionar"]
-                        
-                        if is_selected:
-                            st.session_state.sel_J[sku] = True
-                        elif sku in st.session_state.sel_J:
-                            st.session_state.sel_J[sku] = False
+    # --- Histórico: o que mudou entre duas execuções ---
+    st.markdown("---")
+    with st.expander("📜 Histórico de cálculos (comparar execuções)"):
+        emp_hist = st.selectbox("Empresa", EMPRESAS, key="hist_emp")
+        snaps = historico_compras.listar_snapshots(empresa=emp_hist, limite=400)
+        if len(snaps) < 2:
+            st.info("São necessárias ao menos duas execuções gravadas desta empresa.")
+        else:
+            rotulos = {
+                r.RUN_ID: f"{dt.datetime.fromtimestamp(r.CRIADO_EM):%d/%m/%Y %H:%M} — h={r.H} g={r.G:g} LT={r.LT}"
+                for r in snaps.itertuples()
+            }
+            ids_hist = list(rotulos)
+            c1, c2 = st.columns(2)
+            with c1:
+                run_de = st.selectbox("De", ids_hist, index=1, format_func=rotulos.get, key="hist_de")
+            with c2:
+                run_para = st.selectbox("Para", ids_hist, index=0, format_func=rotulos.get, key="hist_para")
+            diff = historico_compras.diff_snapshots(run_de, run_para)
+            if diff is None:
+                st.warning("Snapshot não encontrado no histórico.")
             else:
-                st.info("JCA: Nenhum item corresponde aos filtros.")
+                res = historico_compras.resumo_diff(diff)
+                st.caption(f"Novos: {res['novo']} · Removidos: {res['removido']} · Alterados: {res['alterado']}")
+                st.dataframe(diff, use_container_width=True, hide_index=True)
 
 # ---------- TAB 3: PEDIDO DE COMPRA ----------
 with tab3:
     st.subheader("🛒 Revisão e Finalização do Pedido de Compra")
     
-    # FIX V3.2.2: Agora o carrinho usa o dicionário de seleção global para filtrar o resultado COMPLETO.
-    
-    # Lógica para popular o carrinho (reutilizada e ajustada)
-    selected_skus_A = {sku for sku, selected in st.session_state.sel_A.items() if selected}
-    selected_skus_J = {sku for sku, selected in st.session_state.sel_J.items() if selected}
-    
-    df_A = st.session_state.resultado_ALIVVIA
-    df_J = st.session_state.resultado_JCA
-    
-    carrinho_items = []
-    if df_A is not None:
-        selec_A = df_A[df_A["SKU"].isin(selected_skus_A)].copy()
-        if not selec_A.empty:
-            selec_A = selec_A[selec_A["Compra_Sugerida"] > 0].copy()
-            selec_A["Empresa"] = "ALIVVIA"
-            carrinho_items.append(selec_A)
-            
-    if df_J is not None:
-        selec_J = df_J[df_J["SKU"].isin(selected_skus_J)].copy()
-        if not selec_J.empty:
-            selec_J = selec_J[selec_J["Compra_Sugerida"] > 0].copy()
-            selec_J["Empresa"] = "JCA"
-            carrinho_items.append(selec_J)
-
-    if not carrinho_items:
+    # Carrinho = vista incremental sobre a seleção (sel_<emp>) das linhas com Compra_Sugerida > 0
+    df_carrinho = sincronizar_carrinho()
+    st.session_state.carrinho_compras = [df_carrinho] if len(df_carrinho) else []
+
+    if df_carrinho.empty:
         st.info("O carrinho de compras está vazio. Adicione itens na aba **Análise de Compra (Consolidado)**.")
-        # Garante que o estado do carrinho é limpo se não houver itens selecionados
-        st.session_state.carrinho_compras = []
     else:
-        # Constroi o carrinho final (lógica copiada do botão "Adicionar")
-        cols_carrinho = ["Empresa", "SKU", "fornecedor", "Preco", "Compra_Sugerida", "Valor_Compra_R$"]
-        carrinho_df = pd.concat(carrinho_items)[cols_carrinho]
-        carrinho_df.columns = ["Empresa", "SKU", "Fornecedor", "Preco_Custo", "Qtd_Sugerida", "Valor_Sugerido_R$"]
-        carrinho_df["Qtd_Ajustada"] = carrinho_df["Qtd_Sugerida"]
-        carrinho_df = enforce_numeric_types(carrinho_df)
-
-        # Atualiza o estado do carrinho para ser usado pelo data_editor (se for a primeira vez ou se a seleção mudou)
-        st.session_state.carrinho_compras = [carrinho_df.reset_index(drop=True)]
-        df_carrinho = st.session_state.carrinho_compras[0].copy()
-        
         # Auditoria/Detalhes da OC
         st.markdown("---")
         c1, c2 = st.columns(2)
@@ -1071,6 +1420,12 @@ with tab3:
             st.text_input("Fornecedor Principal do Pedido:", key="oc_fornecedor", value=df_carrinho["Fornecedor"].iloc[0] if not df_carrinho.empty else "")
         with c2:
             st.text_input("Número da Ordem de Compra (OC):", key="oc_num")
+        c5, c6 = st.columns(2)
+        with c5:
+            st.date_input("Previsão de entrega:", key="oc_previsao",
+                          value=dt.date.today() + dt.timedelta(days=int(st.session_state.get("param_lt", 0) or 0)))
+        with c6:
+            st.text_input("Condição de pagamento:", key="oc_condicao")
         st.text_area("Nota/Observação:", key="oc_obs")
         st.markdown("---")
 
@@ -1087,18 +1442,20 @@ with tab3:
             )
         }
         
-        # Exibe o editor de dados
+        # Exibe o editor de dados (key muda quando entram/saem linhas do carrinho)
         edited_carrinho = st.data_editor(
             style_df_compra(df_carrinho), # Usa a função de estilo na edição
             use_container_width=True,
             column_config=col_config,
-            disabled=["Empresa", "SKU", "Fornecedor", "Preco_Custo", "Qtd_Sugerida", "Valor_Sugerido_R$"]
+            disabled=["Empresa", "SKU", "Fornecedor", "Preco_Custo", "Qtd_Sugerida", "Valor_Sugerido_R$"],
+            key=f"carrinho_editor_{st.session_state.carrinho_versao}",
         )
         
         # Recalcula o valor total com a quantidade ajustada (já são float devido ao enforce_numeric_types)
         edited_carrinho["Valor_Ajustado_R$"] = (edited_carrinho["Qtd_Ajustada"] * edited_carrinho["Preco_Custo"]).round(2)
         
-        # Atualiza o estado para persistir as alterações
+        # Atualiza o estado para persistir as alterações (Qtd_Ajustada volta para as partes do carrinho)
+        gravar_qtd_ajustada(edited_carrinho["Qtd_Ajustada"].to_numpy())
         st.session_state.carrinho_compras[0] = edited_carrinho
 
         # Métricas Finais
@@ -1111,12 +1468,24 @@ with tab3:
 
         st.markdown("---")
         
-        # Botão de Exportação Final (CSV)
+        # Botão de Exportação Final (grava a OC em controle_ocs.db + CSV)
         if st.button("📥 Exportar Pedido Final (CSV)", type="primary"):
+            oc_ids = []
+            try:
+                oc_ids = ocs_compras.gravar_oc_do_carrinho(
+                    edited_carrinho,
+                    oc_numero=st.session_state.oc_num,
+                    fornecedor=st.session_state.oc_fornecedor,
+                    data_prevista=st.session_state.oc_previsao.isoformat() if st.session_state.oc_previsao else None,
+                    condicao_pgto=st.session_state.oc_condicao,
+                )
+                st.success(f"OC gravada em controle_ocs.db: {', '.join(oc_ids)}")
+            except Exception as e:
+                st.error(f"Falha ao gravar a OC no controle_ocs.db: {e}")
             df_export = edited_carrinho.copy()
             # Adiciona colunas de auditoria
             df_export["OC_Fornecedor"] = st.session_state.oc_fornecedor
-            df_export["OC_Numero"] = st.session_state.oc_num
+            df_export["OC_Numero"] = st.session_state.oc_num or ", ".join(oc_ids)
             df_export["OC_Obs"] = st.session_state.oc_obs
             
             csv = exportar_carrinho_csv(df_export)
@@ -1142,24 +1511,23 @@ with tab4:
 
         if st.button("Calcular alocação proporcional"):
             try:
-                # precisa de FULL e VENDAS salvos para AMBAS as empresas
+                # precisa de FULL e VENDAS salvos para TODAS as empresas
                 missing = []
-                for emp in ["ALIVVIA","JCA"]:
-                    if not (st.session_state[emp]["FULL"]["name"] and st.session_state[emp]["FULL"]["bytes"]):
+                for emp in EMPRESAS:
+                    if not (st.session_state[emp]["FULL"]["name"] and st.session_state[emp]["FULL"]["digest"]):
                         missing.append(f"{emp} FULL")
-                    if not (st.session_state[emp]["VENDAS"]["name"] and st.session_state[emp]["VENDAS"]["bytes"]):
+                    if not (st.session_state[emp]["VENDAS"]["name"] and st.session_state[emp]["VENDAS"]["digest"]):
                         missing.append(f"{emp} Shopee/MT")
                 if missing:
                     raise RuntimeError("Faltam arquivos salvos: " + ", ".join(missing) + ". Use a aba **Dados das Empresas**.")
 
                 # leitura BYTES
                 def read_pair(emp: str) -> Tuple[pd.DataFrame,pd.DataFrame]:
-                    fa = load_any_table_from_bytes(st.session_state[emp]["FULL"]["name"],   st.session_state[emp]["FULL"]["bytes"])
-                    sa = load_any_table_from_bytes(st.session_state[emp]["VENDAS"]["name"], st.session_state[emp]["VENDAS"]["bytes"])
-                    tfa = mapear_tipo(fa); tsa = mapear_tipo(sa)
+                    tfa, fa = ler_tabela_mapeada(st.session_state[emp]["FULL"]["name"],   st.session_state[emp]["FULL"]["digest"], "FULL")
                     if tfa != "FULL":   raise RuntimeError(f"FULL inválido ({emp}): precisa de SKU e Vendas_60d/Estoque_full.")
+                    tsa, sa = ler_tabela_mapeada(st.session_state[emp]["VENDAS"]["name"], st.session_state[emp]["VENDAS"]["digest"], "VENDAS")
                     if tsa != "VENDAS": raise RuntimeError(f"Vendas inválido ({emp}): não achei coluna de quantidade.")
-                    return mapear_colunas(fa, tfa), mapear_colunas(sa, tsa)
+                    return fa, sa
 
                 full_A, shp_A = read_pair("ALIVVIA")
                 full_J, shp_J = read_pair("JCA")
@@ -1167,15 +1535,14 @@ with tab4:
                 # explode por kits --> demanda 60d por componente
                 cat = Catalogo(
                     catalogo_simples=CATALOGO.rename(columns={"sku":"component_sku"}),
-                    kits_reais=st.session_state.kits_df
+                    kits_reais=st.session_state.kits_df,
+                    kits_efetivo=st.session_state.kits_efetivo_df
                 )
-                kits = construir_kits_efetivo(cat)
+                kidx = KitExplosionIndex.de_kits(cat.kits_efetivo if cat.kits_efetivo is not None else construir_kits_efetivo(cat))
 
                 def vendas_componente(full_df, shp_df) -> pd.DataFrame:
-                    a = explodir_por_kits(full_df[["SKU","Vendas_Qtd_60d"]].rename(columns={"SKU":"kit_sku","Vendas_Qtd_60d":"Qtd"}), kits,"kit_sku","Qtd")
-                    a = a.rename(columns={"Quantidade":"ML_60d"})
-                    b = explodir_por_kits(shp_df[["SKU","Quantidade"]].rename(columns={"SKU":"kit_sku","Quantidade":"Qtd"}), kits,"kit_sku","Qtd")
-                    b = b.rename(columns={"Quantidade":"Shopee_60d"})
+                    a = kidx.explodir_df(full_df, "SKU", ["Vendas_Qtd_60d"]).rename(columns={"Vendas_Qtd_60d":"ML_60d"})
+                    b = kidx.explodir_df(shp_df, "SKU", ["Quantidade"]).rename(columns={"Quantidade":"Shopee_60d"})
                     out = pd.merge(a, b, on="SKU", how="outer").fillna(0)
                     out["Demanda_60d"] = out["ML_60d"].astype(int) + out["Shopee_60d"].astype(int)
                     return out[["SKU","Demanda_60d"]]
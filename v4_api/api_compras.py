@@ -1,8 +1,30 @@
-from typing import Any
-from fastapi import FastAPI, Request, Body
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+
+import pandas as pd
+from fastapi import FastAPI, Body, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from v4_api import historico_compras, jobs_compras, metricas, ocs_compras
+
+from v4_api.engine_compras import (
+    COL_EMPRESA,
+    BaseCalculo,
+    PadraoPreparado,
+    aplicar_cenarios,
+    aplicar_parametros,
+    etapas_ms,
+    hash_tabelas,
+    preparar_base_calculo,
+    preparar_padrao,
+)
 
-app = FastAPI(title="API Reposição Alivvia v4 (debug)")
+app = FastAPI(title="API Reposição Alivvia v4")
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,23 +35,505 @@ app.add_middleware(
 )
 
 
+# ===================== MÉTRICAS (/metrics) =====================
+# Latência por rota (o template, ex.: /jobs/{job_id}, não a URL), tamanho do
+# corpo, linhas dos blocos, duração das etapas do motor e hit/miss de cache.
+# A latência vai até o último byte da resposta: em NDJSON/CSV o corpo é
+# gerado durante o envio, então ela só é registrada quando o stream termina.
+# Só com API_METRICAS=1; sem isso nada é registrado e /metrics responde 404.
+def _rota(request: Request) -> str:
+    # o roteador grava a rota casada no scope (lido depois de call_next)
+    return getattr(request.scope.get("route"), "path", "outros")
+
+
+if metricas.ATIVAS:
+    @app.middleware("http")
+    async def _medir_requisicao(request: Request, call_next):
+        t0 = time.perf_counter()
+        resposta = await call_next(request)
+        rota = _rota(request)
+        tamanho = request.headers.get("content-length")
+        if tamanho and tamanho.isdigit():
+            metricas.REQ_BYTES.observar(float(tamanho), rota)
+
+        corpo = resposta.body_iterator
+
+        async def _corpo_medido():
+            try:
+                async for parte in corpo:
+                    yield parte
+            finally:  # fim do stream (ou cliente desconectou)
+                metricas.REQ_DURACAO.observar(
+                    time.perf_counter() - t0, request.method, rota, str(resposta.status_code)
+                )
+
+        resposta.body_iterator = _corpo_medido()
+        return resposta
+
+
+@app.get("/metrics")
+def api_metricas() -> Any:
+    if not metricas.ATIVAS:
+        raise HTTPException(404, "Métricas desligadas (ligue com API_METRICAS=1).")
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _etapas(body: dict) -> Optional[Dict[str, float]]:
+    """Dict para o motor cronometrar as etapas, ou None (sem medição nenhuma)."""
+    return {} if metricas.ATIVAS or body.get("medir_etapas") else None
+
+
+def _fechar_etapas(body: dict, etapas: Optional[Dict[str, float]], painel: Dict) -> Dict:
+    """Registra as etapas em /metrics e, com "medir_etapas": true, devolve-as no painel."""
+    if etapas is None:
+        return painel
+    if metricas.ATIVAS:
+        metricas.registrar_etapas(etapas)
+    if body.get("medir_etapas"):
+        painel = {**painel, "etapas_ms": etapas_ms(etapas)}
+    return painel
+
+
+def _medir_payload(**blocos: pd.DataFrame):
+    if metricas.ATIVAS:
+        for nome, df in blocos.items():
+            metricas.PAYLOAD_LINHAS.observar(len(df), nome)
+
+
+# ===================== PADRÃO RESIDENTE EM MEMÓRIA =====================
+# O Padrão (catálogo + kits) é enviado uma vez em /padrao e fica normalizado
+# e compilado aqui; cada /calcular-compra manda só FULL, Vendas e Físico.
+_PADRAO: Optional[PadraoPreparado] = None
+_PADRAO_LOCK = threading.Lock()
+
+
+def _df_colunar(body: dict, chave: str, obrig: list) -> pd.DataFrame:
+    """Converte o bloco colunar {coluna: [valores]} do payload em DataFrame."""
+    bloco = body.get(chave)
+    if not isinstance(bloco, dict):
+        raise HTTPException(422, f"'{chave}' deve ser um objeto colunar {{coluna: [valores]}}.")
+    try:
+        df = pd.DataFrame(bloco)
+    except ValueError as e:
+        raise HTTPException(422, f"'{chave}' inválido: {e}")
+    faltam = [c for c in obrig if c not in df.columns]
+    if faltam:
+        raise HTTPException(422, f"Colunas obrigatórias ausentes em '{chave}': {faltam}")
+    return df
+
+
+def _padrao_info(p: PadraoPreparado) -> Dict[str, Any]:
+    return {
+        "versao": p.versao,
+        "skus_catalogo": int(len(p.catalogo_df)),
+        "linhas_kits": int(len(p.kits_df)),
+        "ciclos_kits": p.ciclos_kits,
+    }
+
+
+def _padrao_atual(versao: Optional[str]) -> PadraoPreparado:
+    padrao = _PADRAO
+    if padrao is None:
+        raise HTTPException(409, "Padrão (KITS/CAT) não carregado. Envie primeiro para /padrao.")
+    if versao and versao != padrao.versao:
+        raise HTTPException(
+            409, f"Versão do Padrão divergente: servidor={padrao.versao}, requisição={versao}."
+        )
+    return padrao
+
+
+# ===================== BASES DE CÁLCULO (INDEPENDENTES DE h/g/LT) =====================
+# Mesmas planilhas + mesmo Padrão => mesma base; chamadas que só mudam h/g/LT
+# refazem apenas aplicar_parametros. LRU pequeno, por hash do conteúdo.
+# Backend do motor: "numpy" (padrão na API, menor latência) ou "pandas".
+API_ENGINE = os.environ.get("API_ENGINE", "numpy")
+_BASES: "OrderedDict[str, BaseCalculo]" = OrderedDict()
+_BASES_MAX = 8
+_BASES_LOCK = threading.Lock()
+
+
+def _chave_base(padrao: PadraoPreparado, full_df: pd.DataFrame, fisico_df: pd.DataFrame,
+                vendas_df: pd.DataFrame, por_empresa: bool, ocs_df: Optional[pd.DataFrame]) -> str:
+    tabelas = (full_df, fisico_df, vendas_df) + ((ocs_df,) if ocs_df is not None else ())
+    return hash_tabelas(*tabelas, extra=f"{padrao.versao}|{por_empresa}|{API_ENGINE}")
+
+
+def _base_calculo(
+    padrao: PadraoPreparado,
+    full_df: pd.DataFrame,
+    fisico_df: pd.DataFrame,
+    vendas_df: pd.DataFrame,
+    por_empresa: bool = False,
+    etapas: Optional[Dict[str, float]] = None,
+    ocs_df: Optional[pd.DataFrame] = None,
+) -> BaseCalculo:
+    chave = _chave_base(padrao, full_df, fisico_df, vendas_df, por_empresa, ocs_df)
+    with _BASES_LOCK:
+        prep = _BASES.get(chave)
+        if prep is not None:
+            _BASES.move_to_end(chave)
+    if metricas.ATIVAS:
+        metricas.CACHE.inc("bases", "hit" if prep is not None else "miss")
+    if prep is not None:
+        return prep
+
+    prep = preparar_base_calculo(
+        full_df, fisico_df, vendas_df,
+        padrao.catalogo_df, padrao.kits_df,
+        kidx=padrao.kidx, chave=chave, por_empresa=por_empresa, etapas=etapas, engine=API_ENGINE,
+        ocs_abertas=ocs_df,
+    )
+    with _BASES_LOCK:
+        _BASES[chave] = prep
+        while len(_BASES) > _BASES_MAX:
+            _BASES.popitem(last=False)
+    return prep
+
+
+def _ocs_abertas(body: dict, por_empresa: bool = False) -> Optional[pd.DataFrame]:
+    """
+    OCs em aberto a descontar (opcional):
+      "ocs_abertas": true                            => lidas do controle_ocs.db, da
+                                                        "empresa" do payload (obrigatória
+                                                        fora do cálculo por empresa: 422)
+      "ocs_abertas": {"SKU": [...], "Qtd_Aberta": [...]}   => enviadas no payload
+    """
+    ocs = body.get("ocs_abertas")
+    if not ocs:
+        return None
+    obrig = ([COL_EMPRESA] if por_empresa else []) + ["SKU", "Qtd_Aberta"]
+    if isinstance(ocs, dict):
+        return _df_colunar(body, "ocs_abertas", obrig)
+    if ocs is not True:
+        raise HTTPException(422, "'ocs_abertas' deve ser true ou um objeto colunar {coluna: [valores]}.")
+    if por_empresa:
+        return ocs_compras.em_aberto_por_sku()
+    empresa = body.get("empresa")
+    if empresa is None:
+        # somar as OCs de todas as empresas baixaria a compra com pedidos de outra empresa
+        raise HTTPException(422, "'ocs_abertas': true exige \"empresa\" (ou \"por_empresa\": true).")
+    return ocs_compras.em_aberto_por_sku(str(empresa))
+
+
+# ===================== RESPOSTA DO RESULTADO (JSON / NDJSON / CSV) =====================
+# Com Accept: application/x-ndjson ou text/csv o resultado sai em streaming,
+# em blocos de linhas gerados direto das colunas (sem montar o documento
+# inteiro em memória). Versão do Padrão e painel(éis) vão nos cabeçalhos.
+STREAM_LINHAS_POR_BLOCO = 5000
+MIME_NDJSON = "application/x-ndjson"
+MIME_CSV = "text/csv"
+
+
+def _blocos_ndjson(df: pd.DataFrame) -> Iterator[bytes]:
+    cols = list(df.columns)
+    for ini in range(0, len(df), STREAM_LINHAS_POR_BLOCO):
+        bloco = df.iloc[ini:ini + STREAM_LINHAS_POR_BLOCO]
+        valores = zip(*[bloco[c].tolist() for c in cols])
+        yield "".join(
+            json.dumps(dict(zip(cols, linha)), ensure_ascii=False) + "\n" for linha in valores
+        ).encode("utf-8")
+
+
+def _blocos_csv(df: pd.DataFrame) -> Iterator[bytes]:
+    yield df.iloc[:0].to_csv(index=False).encode("utf-8")
+    for ini in range(0, len(df), STREAM_LINHAS_POR_BLOCO):
+        yield df.iloc[ini:ini + STREAM_LINHAS_POR_BLOCO].to_csv(index=False, header=False).encode("utf-8")
+
+
+def _responder_resultado(request: Request, df_final: pd.DataFrame, meta: Dict[str, Any]) -> Any:
+    """
+    Resposta padrão dos endpoints de resultado: `meta` + "resultado" colunar em
+    JSON, ou o df_final em streaming (NDJSON/CSV) conforme o Accept.
+    """
+    accept = request.headers.get("accept", "")
+    if MIME_NDJSON in accept:
+        blocos, mime = _blocos_ndjson(df_final), MIME_NDJSON
+    elif MIME_CSV in accept:
+        blocos, mime = _blocos_csv(df_final), f"{MIME_CSV}; charset=utf-8"
+    else:
+        return {**meta, "resultado": {c: df_final[c].tolist() for c in df_final.columns}}
+
+    cabecalhos = {f"X-{k.replace('_', '-').title()}": json.dumps(v) if isinstance(v, dict) else str(v)
+                  for k, v in meta.items()}
+    return StreamingResponse(blocos, media_type=mime, headers=cabecalhos)
+
+
 @app.get("/health")
 def health():
-    print(">> /health foi chamado")
     return {"status": "ok"}
 
 
+@app.post("/padrao")
+def api_carregar_padrao(body: dict = Body(...)) -> Any:
+    """
+    Recebe o Padrão em formato colunar:
+      {"catalogo": {"component_sku": [...], "fornecedor": [...], "status_reposicao": [...]},
+       "kits":     {"kit_sku": [...], "component_sku": [...], "qty": [...]},
+       "aceitar_ciclos": false}   # true: kits em ciclo ficam de fora (senão 422)
+    """
+    global _PADRAO
+    cat_df = _df_colunar(body, "catalogo", ["component_sku"])
+    kits_df = _df_colunar(body, "kits", ["kit_sku", "component_sku", "qty"])
+    try:
+        padrao = preparar_padrao(cat_df, kits_df, aceitar_ciclos=bool(body.get("aceitar_ciclos")))
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    with _PADRAO_LOCK:
+        _PADRAO = padrao
+    return _padrao_info(padrao)
+
+
+@app.get("/padrao")
+def api_padrao_info() -> Any:
+    return _padrao_info(_padrao_atual(None))
+
+
 @app.post("/calcular-compra")
-async def api_calcular_compra(body: dict = Body(...)) -> Any:
+def api_calcular_compra(request: Request, body: dict = Body(...)) -> Any:
+    """
+    Payload (colunar, sem catálogo):
+      {"versao_padrao": "...",   # opcional; se vier, precisa bater com o servidor
+       "full":   {"SKU": [...], "Vendas_Qtd_60d": [...], "Estoque_Full": [...], "Em_Transito": [...]},
+       "vendas": {"SKU": [...], "Quantidade": [...]},
+       "fisico": {"SKU": [...], "Estoque_Fisico": [...], "Preco": [...]},
+       "h": 60, "g": 0.0, "LT": 0,
+       "medir_etapas": false,   # opcional; true => painel["etapas_ms"]
+       "ocs_abertas": true,     # opcional; ver _ocs_abertas (exige "empresa": "JCA")
+       "gravar_historico": true,  # opcional; grava snapshot do resultado (ver /historico)
+       "empresa": "JCA"}
+
+    Accept: application/x-ndjson ou text/csv => resultado em streaming.
+    """
+    padrao = _padrao_atual(body.get("versao_padrao"))
+    full_df = _df_colunar(body, "full", ["SKU", "Vendas_Qtd_60d", "Estoque_Full", "Em_Transito"])
+    vendas_df = _df_colunar(body, "vendas", ["SKU", "Quantidade"])
+    fisico_df = _df_colunar(body, "fisico", ["SKU", "Estoque_Fisico", "Preco"])
+    _medir_payload(full=full_df, vendas=vendas_df, fisico=fisico_df)
+    ocs_df = _ocs_abertas(body)
+
+    etapas = _etapas(body)
+    try:
+        prep = _base_calculo(padrao, full_df, fisico_df, vendas_df, etapas=etapas, ocs_df=ocs_df)
+        df_final, painel = aplicar_parametros(
+            prep,
+            h=int(body.get("h", 60)),
+            g=float(body.get("g", 0.0)),
+            LT=int(body.get("LT", 0)),
+            etapas=etapas,
+        )
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(422, f"Falha no cálculo: {e}")
+    painel = _fechar_etapas(body, etapas, painel)
+    meta = {"versao_padrao": padrao.versao, "painel": painel}
+    if body.get("gravar_historico"):
+        meta["snapshots"] = _gravar_historico(body, df_final, prep, padrao)
+
+    return _responder_resultado(request, df_final, meta)
+
+
+@app.post("/calcular-compra/empresas")
+def api_calcular_compra_empresas(request: Request, body: dict = Body(...)) -> Any:
+    """
+    Várias empresas numa passada só. Mesmo payload de /calcular-compra, mas
+    cada bloco (full, vendas, fisico) traz também a coluna "Empresa".
+
+    Resposta: resultado longo (com "Empresa") e "paineis" = {empresa: painel}.
+    Com "medir_etapas": true, as etapas (da passada única) vão em paineis["etapas_ms"].
+    "ocs_abertas" colunar também precisa da coluna "Empresa".
+    """
+    padrao = _padrao_atual(body.get("versao_padrao"))
+    full_df = _df_colunar(body, "full", ["Empresa", "SKU", "Vendas_Qtd_60d", "Estoque_Full", "Em_Transito"])
+    vendas_df = _df_colunar(body, "vendas", ["Empresa", "SKU", "Quantidade"])
+    fisico_df = _df_colunar(body, "fisico", ["Empresa", "SKU", "Estoque_Fisico", "Preco"])
+    _medir_payload(full=full_df, vendas=vendas_df, fisico=fisico_df)
+    ocs_df = _ocs_abertas(body, por_empresa=True)
+
+    etapas = _etapas(body)
+    try:
+        prep = _base_calculo(padrao, full_df, fisico_df, vendas_df, por_empresa=True, etapas=etapas, ocs_df=ocs_df)
+        df_final, paineis = aplicar_parametros(
+            prep,
+            h=int(body.get("h", 60)),
+            g=float(body.get("g", 0.0)),
+            LT=int(body.get("LT", 0)),
+            etapas=etapas,
+        )
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(422, f"Falha no cálculo: {e}")
+    paineis = _fechar_etapas(body, etapas, paineis)
+    meta = {"versao_padrao": padrao.versao, "paineis": paineis}
+    if body.get("gravar_historico"):
+        meta["snapshots"] = _gravar_historico(body, df_final, prep, padrao)
+
+    return _responder_resultado(request, df_final, meta)
+
+
+def _cenarios(body: dict) -> list:
+    """Lê a grade de cenários: [{"h": 30, "g": 0.0, "LT": 0}, ...]."""
+    bruto = body.get("cenarios")
+    if not isinstance(bruto, list) or not bruto:
+        raise HTTPException(422, "'cenarios' deve ser uma lista não vazia de {h, g, LT}.")
+    try:
+        return [(int(c.get("h", 60)), float(c.get("g", 0.0)), int(c.get("LT", 0))) for c in bruto]
+    except (AttributeError, TypeError, ValueError) as e:
+        raise HTTPException(422, f"Cenário inválido: {e}")
+
+
+@app.post("/calcular-compra/cenarios")
+def api_calcular_cenarios(body: dict = Body(...)) -> Any:
+    """
+    Mesmo payload de /calcular-compra, trocando h/g/LT por uma grade:
+      {"cenarios": [{"h": 30, "g": 0.0, "LT": 0}, {"h": 60, "g": 5.0, "LT": 10}, ...], ...}
+
+    Resposta: matrizes SKU x cenário (linhas na ordem do "SKU", colunas na
+    ordem de "cenarios") de Compra_Sugerida e Valor_Compra_R$.
+    """
+    padrao = _padrao_atual(body.get("versao_padrao"))
+    cenarios = _cenarios(body)
+    full_df = _df_colunar(body, "full", ["SKU", "Vendas_Qtd_60d", "Estoque_Full", "Em_Transito"])
+    vendas_df = _df_colunar(body, "vendas", ["SKU", "Quantidade"])
+    fisico_df = _df_colunar(body, "fisico", ["SKU", "Estoque_Fisico", "Preco"])
+    _medir_payload(full=full_df, vendas=vendas_df, fisico=fisico_df)
+    ocs_df = _ocs_abertas(body)
+
+    etapas = _etapas(body)
+    try:
+        prep = _base_calculo(padrao, full_df, fisico_df, vendas_df, etapas=etapas, ocs_df=ocs_df)
+        compra, valor = aplicar_cenarios(prep, cenarios, etapas=etapas)
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(422, f"Falha no cálculo: {e}")
+
+    rotulos = list(compra.columns[1:])
+    return {
+        "versao_padrao": padrao.versao,
+        "painel": _fechar_etapas(body, etapas, prep.painel),
+        "cenarios": [
+            {"rotulo": r, "h": h, "g": g, "LT": LT} for r, (h, g, LT) in zip(rotulos, cenarios)
+        ],
+        "SKU": compra["SKU"].tolist(),
+        "Compra_Sugerida": compra[rotulos].to_numpy().tolist(),
+        "Valor_Compra_R$": valor[rotulos].to_numpy().tolist(),
+    }
+
+
+# ===================== HISTÓRICO (SNAPSHOTS + DIFF) =====================
+# Snapshots gravados com "gravar_historico": true (e pelo app a cada "Gerar
+# Compra"); o diff compara dois snapshots pelo SKU e devolve só o que mudou.
+
+def _gravar_historico(body: dict, df_final: pd.DataFrame, prep: BaseCalculo,
+                      padrao: PadraoPreparado) -> Dict[str, str]:
+    """Um snapshot por empresa do resultado; retorna {empresa: run_id}."""
+    h, g, LT = int(body.get("h", 60)), float(body.get("g", 0.0)), int(body.get("LT", 0))
+    return historico_compras.gravar_resultado(
+        df_final, prep.por_empresa, body.get("empresa"), h, g, LT,
+        versao_padrao=padrao.versao, chave_entradas=prep.chave,
+        extra={"origem": "api", "ocs_abertas": prep.oc_aberta is not None},
+    )
+
+
+@app.get("/historico")
+def api_historico(empresa: Optional[str] = None, desde: Optional[str] = None,
+                  ate: Optional[str] = None, limite: int = 100) -> Any:
+    """Snapshots (mais recentes primeiro); desde/ate no formato AAAA-MM-DD."""
+    df = historico_compras.listar_snapshots(empresa=empresa, desde=desde, ate=ate, limite=limite)
+    return {"snapshots": {c: df[c].tolist() for c in df.columns}}
+
+
+@app.get("/historico/diff")
+def api_historico_diff(request: Request, de: str, para: str, colunas: Optional[str] = None) -> Any:
+    """
+    Linhas que mudaram entre os snapshots `de` e `para` (RUN_IDs).
+    `colunas`: lista separada por vírgula (padrão: historico_compras.COLUNAS_DIFF).
+    Accept: application/x-ndjson ou text/csv => resultado em streaming.
     """
-    MODO DEBUG:
-    - não faz cálculo
-    - só mostra no terminal o que chegar
-    - devolve o mesmo JSON de volta
+    cols = [c.strip() for c in colunas.split(",") if c.strip()] if colunas else historico_compras.COLUNAS_DIFF
+    infos = {}
+    for run_id in (de, para):
+        infos[run_id] = historico_compras.info_snapshot(run_id)
+        if infos[run_id] is None:
+            raise HTTPException(404, f"Snapshot '{run_id}' não encontrado.")
+    diff = historico_compras.diff_snapshots(de, para, cols)
+    if diff is None:  # está no índice, mas o Parquet sumiu do disco
+        raise HTTPException(404, f"Arquivo do snapshot '{de}' ou '{para}' não encontrado.")
+    mudancas = historico_compras.resumo_diff(diff)
+    diff = diff.astype(object).where(diff.notna(), None)  # lado ausente => null (JSON não aceita NaN)
+    return _responder_resultado(request, diff, {
+        "de": {k: v for k, v in infos[de].items() if k != "ARQUIVO"},
+        "para": {k: v for k, v in infos[para].items() if k != "ARQUIVO"},
+        "mudancas": mudancas,
+    })
+
+
+# ===================== JOBS (CÁLCULO EM SEGUNDO PLANO) =====================
+# O POST só valida o payload e devolve o job_id; o cálculo roda no pool de
+# processos (jobs_compras) e o resultado fica no SQLite até o TTL vencer.
+
+@app.on_event("shutdown")
+def _encerrar_jobs():
+    jobs_compras.encerrar_pool()
+
+
+@app.post("/jobs/calcular-compra", status_code=202)
+def api_job_calcular_compra(body: dict = Body(...)) -> Any:
+    """
+    Mesmo payload de /calcular-compra (inclusive "ocs_abertas", "medir_etapas"
+    e "gravar_historico"). Com "por_empresa": true, segue o formato de
+    /calcular-compra/empresas (coluna "Empresa" nos três blocos).
+    Os run_ids do histórico saem em GET /jobs/{id} e no resultado ("snapshots").
     """
-    print("\n===============================")
-    print("PAYLOAD RECEBIDO EM /calcular-compra:")
-    print(body)
-    print("===============================\n")
+    padrao = _padrao_atual(body.get("versao_padrao"))
+    por_empresa = bool(body.get("por_empresa", False))
+    emp = ["Empresa"] if por_empresa else []
+    full_df = _df_colunar(body, "full", emp + ["SKU", "Vendas_Qtd_60d", "Estoque_Full", "Em_Transito"])
+    vendas_df = _df_colunar(body, "vendas", emp + ["SKU", "Quantidade"])
+    fisico_df = _df_colunar(body, "fisico", emp + ["SKU", "Estoque_Fisico", "Preco"])
+    _medir_payload(full=full_df, vendas=vendas_df, fisico=fisico_df)
+    ocs_df = _ocs_abertas(body, por_empresa=por_empresa)
+    try:
+        h, g, LT = int(body.get("h", 60)), float(body.get("g", 0.0)), int(body.get("LT", 0))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(422, f"Parâmetros inválidos: {e}")
+
+    historico = None
+    if body.get("gravar_historico"):
+        historico = {
+            "empresa": body.get("empresa"),
+            "chave_entradas": _chave_base(padrao, full_df, fisico_df, vendas_df, por_empresa, ocs_df),
+        }
+    job_id = jobs_compras.submeter_calculo(
+        padrao, full_df, fisico_df, vendas_df, h=h, g=g, LT=LT, por_empresa=por_empresa,
+        ocs_abertas=ocs_df, medir_etapas=bool(body.get("medir_etapas")), historico=historico,
+        engine=API_ENGINE,
+    )
+    return {"job_id": job_id, "status": jobs_compras.STATUS_PENDENTE}
+
+
+def _job_ou_404(job_id: str) -> Dict[str, Any]:
+    info = jobs_compras.status_job(job_id)
+    if info is None:
+        raise HTTPException(404, f"Job '{job_id}' não encontrado (ou expirado).")
+    return info
+
+
+@app.get("/jobs/{job_id}")
+def api_job_status(job_id: str) -> Any:
+    return _job_ou_404(job_id)
+
 
-    return body
+@app.get("/jobs/{job_id}/resultado")
+def api_job_resultado(job_id: str, request: Request) -> Any:
+    info = _job_ou_404(job_id)
+    if info["status"] == jobs_compras.STATUS_ERRO:
+        raise HTTPException(422, info["erro"] or "Job terminou com erro.")
+    res = jobs_compras.resultado_job(job_id)
+    if res is None:
+        raise HTTPException(409, f"Job ainda não terminou (status: {info['status']}).")
+    df_final, painel = res
+    meta = {
+        "job_id": job_id,
+        "versao_padrao": info["versao_padrao"],
+        "paineis" if "Empresa" in df_final.columns else "painel": painel,
+    }
+    if info["snapshots"] is not None:
+        meta["snapshots"] = info["snapshots"]
+    return _responder_resultado(request, df_final, meta)
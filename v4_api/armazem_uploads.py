@@ -0,0 +1,256 @@
+# v4_api/armazem_uploads.py
+# Armazém dos uploads (FULL, Shopee/MT, Estoque) endereçado por conteúdo:
+#
+#   <raiz>/objetos/3f/3fa9...e1            arquivo como veio (lido via mmap)
+#   <raiz>/objetos/3f/3fa9...e1.zlib       idem, comprimido (codec opcional)
+#   <raiz>/refs/JCA_VENDAS.json            {"digest", "nome", ...} do upload atual
+#
+# O nome do objeto é o SHA-256 do conteúdo: o mesmo export enviado de novo (ou
+# pelas duas empresas) vira um arquivo só. Objetos e refs são gravados num
+# temporário do mesmo diretório e publicados com os.replace, então leitores
+# concorrentes nunca veem arquivo pela metade. A sessão guarda só o digest;
+# os bytes saem do disco quando o cálculo precisa (mmap: páginas compartilhadas
+# entre sessões pelo cache do SO). Objetos sem ref são podados por LRU (mtime,
+# o acesso faz touch) quando o armazém passa do limite de tamanho.
+
+import bz2
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
+import re
+import tempfile
+import time
+import zlib
+from typing import Dict, Optional
+
+# ===================== CONFIG =====================
+ARMAZEM_MAX_BYTES = 1024 * 1024 * 1024
+# Codec opcional para objetos novos ("" = sem compressão; o mmap só vale sem codec)
+ARMAZEM_CODEC = os.environ.get("UPLOADS_CODEC", "")
+GANHO_MINIMO = 0.9  # só guarda comprimido se ficar abaixo de 90% do original (XLSX já é zip)
+TMP_ABANDONADO_S = 3600
+
+_CODECS = {
+    "zlib": (lambda b: zlib.compress(b, 6), zlib.decompress),
+    "bz2": (bz2.compress, bz2.decompress),
+    "xz": (lzma.compress, lzma.decompress),
+}
+_DIGEST_RE = re.compile(r"[0-9a-f]{64}$")
+
+
+class _LeitorMmap(io.RawIOBase):
+    """Arquivo binário (read/seek/tell) sobre um mmap, para pandas/openpyxl."""
+
+    def __init__(self, m: mmap.mmap):
+        self._m = m
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, n: int = -1) -> bytes:
+        return self._m.read(None if n is None or n < 0 else n)
+
+    def readinto(self, b) -> int:
+        dados = self.read(len(b))
+        b[:len(dados)] = dados
+        return len(dados)
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        self._m.seek(pos, whence)
+        return self._m.tell()
+
+    def tell(self) -> int:
+        return self._m.tell()
+
+    def close(self):
+        if not self.closed:
+            self._m.close()
+        super().close()
+
+
+class ArmazemUploads:
+    def __init__(self, raiz: str, max_bytes: int = ARMAZEM_MAX_BYTES, codec: str = ARMAZEM_CODEC):
+        if codec and codec not in _CODECS:
+            raise ValueError(f"codec desconhecido: {codec!r} (use {', '.join(_CODECS)} ou vazio)")
+        self.raiz = raiz
+        self.max_bytes = max_bytes
+        self.codec = codec
+        self._objetos = os.path.join(raiz, "objetos")
+        self._refs = os.path.join(raiz, "refs")
+        os.makedirs(self._objetos, exist_ok=True)
+        os.makedirs(self._refs, exist_ok=True)
+
+    # ---------- objetos ----------
+    def _caminho(self, digest: str, codec: str = "") -> str:
+        if not _DIGEST_RE.match(digest or ""):
+            raise ValueError(f"digest inválido: {digest!r}")
+        nome = f"{digest}.{codec}" if codec else digest
+        return os.path.join(self._objetos, digest[:2], nome)
+
+    def _localizar(self, digest: str) -> Optional[tuple]:
+        """(caminho, codec) do objeto, ou None se não está no armazém."""
+        for codec in ["", *_CODECS]:
+            path = self._caminho(digest, codec)
+            if os.path.exists(path):
+                return path, codec
+        return None
+
+    def existe(self, digest: str) -> bool:
+        return self._localizar(digest) is not None
+
+    def gravar(self, conteudo: bytes) -> str:
+        """Guarda o conteúdo (se ainda não existe) e devolve o digest."""
+        digest = hashlib.sha256(conteudo).hexdigest()
+        achado = self._localizar(digest)
+        if achado is not None:
+            _tocar(achado[0])
+            return digest
+
+        codec, dados = "", conteudo
+        if self.codec:
+            comp = _CODECS[self.codec][0](conteudo)
+            if len(comp) < GANHO_MINIMO * len(conteudo):
+                codec, dados = self.codec, comp
+        path = self._caminho(digest, codec)
+        _gravar_atomico(path, dados)
+        return digest
+
+    def publicar(self, empresa: str, tipo: str, nome: str, conteudo: bytes) -> str:
+        """gravar + apontar + podar: o upload novo vira o atual de (empresa, tipo)."""
+        digest = self.gravar(conteudo)
+        self.apontar(empresa, tipo, digest, nome)
+        self.podar()
+        return digest
+
+    def abrir(self, digest: str) -> io.RawIOBase:
+        """
+        Arquivo binário só-leitura com o conteúdo (use com `with`). Sem codec é
+        um mmap do objeto; comprimido, descomprime em memória.
+        FileNotFoundError se o objeto foi podado.
+        """
+        achado = self._localizar(digest)
+        if achado is None:
+            raise FileNotFoundError(f"upload {digest[:12]} não está mais no armazém")
+        path, codec = achado
+        _tocar(path)
+        if codec:
+            with open(path, "rb") as f:
+                return io.BytesIO(_CODECS[codec][1](f.read()))
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO(b"")
+            return _LeitorMmap(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def ler(self, digest: str) -> bytes:
+        with self.abrir(digest) as f:
+            return f.read()
+
+    # ---------- refs (upload atual de cada empresa/tipo) ----------
+    def _caminho_ref(self, empresa: str, tipo: str) -> str:
+        nome = re.sub(r"[^0-9A-Za-z_.-]", "_", f"{empresa}_{tipo}")
+        return os.path.join(self._refs, f"{nome}.json")
+
+    def apontar(self, empresa: str, tipo: str, digest: str, nome: str):
+        """Marca `digest` como o upload atual de (empresa, tipo)."""
+        ref = {"digest": digest, "nome": nome, "gravado_em": time.time()}
+        _gravar_atomico(self._caminho_ref(empresa, tipo), json.dumps(ref).encode("utf-8"))
+
+    def referencia(self, empresa: str, tipo: str) -> Optional[Dict]:
+        """{"digest", "nome", "gravado_em"} do upload atual, ou None."""
+        try:
+            with open(self._caminho_ref(empresa, tipo), "r", encoding="utf-8") as f:
+                ref = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return ref if self.existe(ref.get("digest", "")) else None
+
+    def remover_referencia(self, empresa: str, tipo: str):
+        try:
+            os.remove(self._caminho_ref(empresa, tipo))
+        except FileNotFoundError:
+            pass
+
+    def _digests_referenciados(self) -> set:
+        usados = set()
+        for nome in os.listdir(self._refs):
+            if not nome.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self._refs, nome), "r", encoding="utf-8") as f:
+                    usados.add(json.load(f).get("digest"))
+            except (OSError, ValueError):
+                continue
+        return usados
+
+    # ---------- poda ----------
+    def podar(self, max_bytes: Optional[int] = None) -> int:
+        """
+        LRU por mtime: remove objetos sem ref, dos mais antigos para os mais
+        novos, até o armazém caber em `max_bytes`. Devolve os bytes liberados.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        usados = self._digests_referenciados()
+        entradas, total = [], 0
+        for sub in os.listdir(self._objetos):
+            pasta = os.path.join(self._objetos, sub)
+            if not os.path.isdir(pasta):
+                continue
+            for nome in os.listdir(pasta):
+                path = os.path.join(pasta, nome)
+                try:
+                    stt = os.stat(path)
+                except OSError:
+                    continue
+                if nome.endswith(".tmp"):
+                    if time.time() - stt.st_mtime > TMP_ABANDONADO_S:  # gravação interrompida
+                        _remover(path)
+                    continue
+                total += stt.st_size
+                if nome.split(".")[0] not in usados:
+                    entradas.append((stt.st_mtime, stt.st_size, path))
+        liberados = 0
+        for _, size, path in sorted(entradas):
+            if total <= max_bytes:
+                break
+            if not _remover(path):  # quem já tem o mmap aberto continua lendo (POSIX)
+                continue
+            total -= size
+            liberados += size
+        return liberados
+
+
+def _tocar(path: str):
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def _remover(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def _gravar_atomico(path: str, dados: bytes):
+    """Grava num temporário do mesmo diretório e publica com os.replace."""
+    pasta = os.path.dirname(path)
+    os.makedirs(pasta, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=pasta, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dados)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
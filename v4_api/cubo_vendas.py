@@ -0,0 +1,352 @@
+# v4_api/cubo_vendas.py
+# Cubo diário de vendas por SKU, alimentado pelos exports de pedidos
+# (Shopee/MT: uma linha por item de pedido, com data).
+#
+# A ingestão é em streaming: cada bloco do arquivo é agregado por (SKU, dia)
+# e os parciais são compactados de tempos em tempos, então a memória fica
+# limitada pelo tamanho do bloco + nº de pares (SKU, dia), não pelo arquivo.
+# O resultado vai para vendas_dia (SQLite): uma linha por (empresa, origem,
+# dia) com dois vetores int32 colados (ids de SKU do dicionário `skus` e
+# quantidades). Um export substitui apenas os dias que ele cobre, então
+# reenviar janelas sobrepostas não duplica vendas.
+#
+# Janelas (30/60/90 dias, ou qualquer outra) saem de somas acumuladas sobre
+# as linhas ordenadas por (SKU, dia), sem reler nem reprocessar arquivos.
+
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from v4_api.engine_compras import br_to_float_series, norm_sku_series
+
+
+# ===================== CONFIG =====================
+RAIZ_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CUBO_DB_PATH = os.environ.get("CUBO_DB_PATH", os.path.join(RAIZ_DIR, "cubo_vendas.db"))
+ORIGEM_PADRAO = "pedidos"
+ACUMULADOR_MAX_LINHAS = 500_000  # pares (SKU, dia) parciais antes de compactar
+
+_EPOCA = np.datetime64("1970-01-01", "D")
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS skus (
+        ID  INTEGER PRIMARY KEY,
+        SKU TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS vendas_dia (
+        EMPRESA TEXT NOT NULL,
+        DIA     INTEGER NOT NULL,   -- dias desde 1970-01-01
+        ORIGEM  TEXT NOT NULL,
+        PARES   INTEGER NOT NULL,
+        SKU_IDS BLOB NOT NULL,      -- int32, crescente
+        QTDS    BLOB NOT NULL,      -- int32, alinhado a SKU_IDS
+        PRIMARY KEY (EMPRESA, DIA, ORIGEM)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ingestoes (
+        ID        INTEGER PRIMARY KEY AUTOINCREMENT,
+        EMPRESA   TEXT NOT NULL,
+        ORIGEM    TEXT NOT NULL,
+        ARQUIVO   TEXT,
+        DIA_INI   INTEGER,
+        DIA_FIM   INTEGER,
+        LINHAS    INTEGER,
+        PARES     INTEGER,
+        QTD_TOTAL INTEGER,
+        CRIADO_EM REAL
+    )
+    """,
+]
+
+
+def _conectar(db_path: str) -> sqlite3.Connection:
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    with con:
+        for ddl in _SCHEMA:
+            con.execute(ddl)
+    return con
+
+
+def dia_para_data(dia: int) -> str:
+    """Dia do cubo (inteiro) -> "AAAA-MM-DD"."""
+    return str(_EPOCA + np.timedelta64(int(dia), "D"))
+
+
+def data_para_dia(data) -> int:
+    """"AAAA-MM-DD" / date / Timestamp -> dia do cubo (inteiro)."""
+    return int((np.datetime64(pd.Timestamp(data).date(), "D") - _EPOCA).astype(np.int64))
+
+
+# ===================== MAPEAMENTO DAS COLUNAS =====================
+def colunas_pedidos(cols: Sequence[str]) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Escolhe, pelos nomes normalizados (norm_header), SKU, Quantidade, Data e
+    Status (opcional) de um export de pedidos. None se faltar SKU, quantidade
+    ou data (ex.: planilha já totalizada de 60 dias).
+    """
+    cols = list(cols)
+    sku = next((c for c in cols if "sku" in c), None)
+
+    cand_qty = []
+    for c in cols:
+        score = 3 * ("qtde" in c) + 2 * ("quant" in c) + ("venda" in c) + ("order" in c)
+        if score > 0 and "data" not in c:
+            cand_qty.append((score, c))
+
+    cand_data = []
+    for c in cols:
+        if "data" not in c and "date" not in c:
+            continue
+        score = 3 * ("criacao" in c) + 2 * ("pedido" in c) + 2 * ("venda" in c) + ("pagamento" in c)
+        score -= 3 * any(p in c for p in ["envio", "entrega", "prevista", "limite", "cancel", "devolu"])
+        cand_data.append((score, c))
+
+    if sku is None or not cand_qty or not cand_data:
+        return None
+    cand_qty.sort(key=lambda x: -x[0])
+    cand_data.sort(key=lambda x: -x[0])
+    status = next((c for c in cols if "status" in c or "situacao" in c), None)
+    return {"SKU": sku, "Quantidade": cand_qty[0][1], "Data": cand_data[0][1], "Status": status}
+
+
+def _dias(datas: pd.Series) -> np.ndarray:
+    """
+    Datas em texto -> dia do cubo; inválidas => -1. Cada formato é lido com
+    formato explícito (rápido e sem ambiguidade dia/mês): AAAA-MM-DD e
+    dd/mm/aaaa (com ou sem hora); o resto passa pelo parser genérico (dayfirst).
+    Só os textos distintos são convertidos (exports repetem muito a data).
+    """
+    codigos, distintos = pd.factorize(datas.astype(str))
+    if len(distintos) == 0:
+        return np.full(len(datas), -1, dtype=np.int64)
+    txt = pd.Series(distintos).str.strip().str.slice(0, 10)
+    d = pd.Series(pd.NaT, index=txt.index, dtype="datetime64[ns]")
+    iso = txt.str.match(r"\d{4}-\d{2}-\d{2}$").to_numpy()
+    br = txt.str.match(r"\d{2}/\d{2}/\d{4}$").to_numpy()
+    d[iso] = pd.to_datetime(txt[iso], format="%Y-%m-%d", errors="coerce")
+    d[br] = pd.to_datetime(txt[br], format="%d/%m/%Y", errors="coerce")
+    resto = ~(iso | br) & (txt != "").to_numpy()
+    if resto.any():
+        d[resto] = pd.to_datetime(txt[resto], dayfirst=True, errors="coerce", format="mixed")
+    dias = (d.to_numpy(dtype="datetime64[D]") - _EPOCA).astype(np.int64)
+    dias = np.where(d.isna().to_numpy(), -1, dias)
+    return np.where(codigos >= 0, dias[codigos], -1)
+
+
+# ===================== AGREGAÇÃO EM STREAMING =====================
+class AgregadorDiario:
+    """Soma (SKU, dia) -> quantidade bloco a bloco, com memória limitada."""
+
+    def __init__(self, max_linhas: int = ACUMULADOR_MAX_LINHAS):
+        self.max_linhas = max_linhas
+        self._partes = []
+        self._linhas = 0
+        self.linhas_lidas = 0
+        self.linhas_ignoradas = 0
+
+    def adicionar(self, sku: pd.Series, dia: np.ndarray, qtd: np.ndarray):
+        self.linhas_lidas += len(dia)
+        ok = (dia >= 0) & (sku.to_numpy() != "")
+        self.linhas_ignoradas += int((~ok).sum())
+        parte = pd.Series(qtd[ok], index=pd.MultiIndex.from_arrays(
+            [sku.to_numpy()[ok], dia[ok]], names=["SKU", "DIA"]
+        )).groupby(level=[0, 1], sort=False).sum()
+        self._partes.append(parte)
+        self._linhas += len(parte)
+        if self._linhas > self.max_linhas:
+            self._compactar()
+
+    def _compactar(self):
+        if len(self._partes) > 1:
+            self._partes = [pd.concat(self._partes).groupby(level=[0, 1], sort=False).sum()]
+        self._linhas = sum(len(p) for p in self._partes)
+
+    def resultado(self) -> pd.DataFrame:
+        """DataFrame SKU, DIA, QTD (um par por linha)."""
+        self._compactar()
+        if not self._partes:
+            return pd.DataFrame({"SKU": pd.Series(dtype=object), "DIA": pd.Series(dtype=np.int64),
+                                 "QTD": pd.Series(dtype=np.int64)})
+        return self._partes[0].rename("QTD").reset_index()
+
+
+def ingerir_blocos(
+    blocos: Iterable[pd.DataFrame],
+    empresa: str,
+    origem: str = ORIGEM_PADRAO,
+    arquivo: str = "",
+    db_path: str = CUBO_DB_PATH,
+) -> Optional[Dict]:
+    """
+    Ingere um export de pedidos já lido em blocos (colunas com norm_header).
+    Linhas com status de cancelamento, sem data ou sem SKU ficam de fora.
+
+    Os dias cobertos pelo arquivo (do 1º ao último) são substituídos no cubo
+    para (empresa, origem), numa transação. Retorna um resumo, ou None se o
+    arquivo não é de pedidos com data (ver colunas_pedidos).
+    """
+    agreg = AgregadorDiario()
+    escolha = None
+    for bloco in blocos:
+        if escolha is None:
+            escolha = colunas_pedidos(bloco.columns)
+            if escolha is None:
+                return None
+        if escolha["Status"] is not None:
+            cancelado = bloco[escolha["Status"]].astype(str).str.lower().str.contains("cancel", na=False)
+            bloco = bloco[~cancelado.to_numpy()]
+        agreg.adicionar(
+            norm_sku_series(bloco[escolha["SKU"]]),
+            _dias(bloco[escolha["Data"]]),
+            br_to_float_series(bloco[escolha["Quantidade"]]).fillna(0).astype(np.int64).to_numpy(),
+        )
+    if escolha is None:
+        return None
+
+    cubo = agreg.resultado()
+    resumo = {
+        "empresa": empresa, "origem": origem, "arquivo": arquivo,
+        "linhas": agreg.linhas_lidas, "linhas_ignoradas": agreg.linhas_ignoradas,
+        "pares": int(len(cubo)), "qtd_total": int(cubo["QTD"].sum()),
+        "dia_ini": None, "dia_fim": None,
+    }
+    if len(cubo) == 0:
+        return resumo
+    dia_ini, dia_fim = int(cubo["DIA"].min()), int(cubo["DIA"].max())
+    resumo.update(dia_ini=dia_para_data(dia_ini), dia_fim=dia_para_data(dia_fim))
+
+    con = _conectar(db_path)
+    try:
+        with con:
+            ids = _ids_skus(con, cubo["SKU"])
+            dias = cubo["DIA"].to_numpy(dtype=np.int64)
+            ordem = np.lexsort((ids, dias))
+            ids, dias, qtds = ids[ordem], dias[ordem], cubo["QTD"].to_numpy(dtype=np.int64)[ordem]
+            cortes = np.flatnonzero(np.diff(dias)) + 1
+            inicios = np.concatenate([[0], cortes])
+            fins = np.concatenate([cortes, [len(dias)]])
+            con.execute(
+                "DELETE FROM vendas_dia WHERE EMPRESA = ? AND DIA BETWEEN ? AND ? AND ORIGEM = ?",
+                (empresa, dia_ini, dia_fim, origem),
+            )
+            con.executemany(
+                "INSERT INTO vendas_dia (EMPRESA, DIA, ORIGEM, PARES, SKU_IDS, QTDS) VALUES (?, ?, ?, ?, ?, ?)",
+                ((empresa, int(dias[i]), origem, int(f - i),
+                  ids[i:f].astype(np.int32).tobytes(), qtds[i:f].astype(np.int32).tobytes())
+                 for i, f in zip(inicios, fins)),
+            )
+            con.execute(
+                "INSERT INTO ingestoes (EMPRESA, ORIGEM, ARQUIVO, DIA_INI, DIA_FIM, LINHAS, PARES, QTD_TOTAL, CRIADO_EM) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (empresa, origem, arquivo, dia_ini, dia_fim, resumo["linhas"], resumo["pares"],
+                 resumo["qtd_total"], time.time()),
+            )
+    finally:
+        con.close()
+    return resumo
+
+
+def _ids_skus(con: sqlite3.Connection, skus: pd.Series) -> np.ndarray:
+    """Id de cada SKU no dicionário `skus` (cria os que faltam)."""
+    existentes = pd.read_sql_query("SELECT ID, SKU FROM skus", con)
+    pos = pd.Index(existentes["SKU"]).get_indexer(skus)
+    novos = pd.unique(skus[pos < 0])
+    if len(novos):
+        con.executemany("INSERT INTO skus (SKU) VALUES (?)", ((str(x),) for x in novos))
+        existentes = pd.read_sql_query("SELECT ID, SKU FROM skus", con)
+        pos = pd.Index(existentes["SKU"]).get_indexer(skus)
+    return existentes["ID"].to_numpy(dtype=np.int64)[pos]
+
+
+# ===================== CONSULTAS (JANELAS) =====================
+def ultimo_dia(empresa: str, db_path: str = CUBO_DB_PATH) -> Optional[int]:
+    """Último dia com vendas da empresa no cubo (None se vazio)."""
+    con = _conectar(db_path)
+    try:
+        return con.execute("SELECT MAX(DIA) FROM vendas_dia WHERE EMPRESA = ?", (empresa,)).fetchone()[0]
+    finally:
+        con.close()
+
+
+def versao_cubo(empresa: str, db_path: str = CUBO_DB_PATH) -> str:
+    """Muda a cada ingestão da empresa (para chaves de cache)."""
+    con = _conectar(db_path)
+    try:
+        n, ultimo = con.execute("SELECT COUNT(*), MAX(ID) FROM ingestoes WHERE EMPRESA = ?", (empresa,)).fetchone()
+    finally:
+        con.close()
+    return f"{n}-{ultimo}"
+
+
+def janelas_vendas(
+    empresa: str,
+    janelas: Sequence[int] = (30, 60, 90),
+    ate: Optional[int] = None,
+    origem: Optional[str] = None,
+    db_path: str = CUBO_DB_PATH,
+) -> pd.DataFrame:
+    """
+    Vendas por SKU em cada janela de `janelas` dias terminando em `ate`
+    (dia do cubo, inclusivo; padrão: último dia com vendas da empresa).
+    Colunas: SKU, Vendas_{n}d ...
+
+    Lê do cubo só o trecho da maior janela; cada janela é C[fim] - C[corte]
+    sobre a soma acumulada das linhas ordenadas por (SKU, dia).
+    """
+    janelas = [int(n) for n in janelas]
+    rotulos = [f"Vendas_{n}d" for n in janelas]
+    if ate is None:
+        ate = ultimo_dia(empresa, db_path)
+    if ate is None or not janelas:
+        return pd.DataFrame({c: pd.Series(dtype=object if c == "SKU" else np.int64) for c in ["SKU", *rotulos]})
+    ini = ate - max(janelas) + 1
+
+    filtros, params = ["EMPRESA = ?", "DIA BETWEEN ? AND ?"], [empresa, ini, ate]
+    if origem is not None:
+        filtros.append("ORIGEM = ?")
+        params.append(origem)
+    con = _conectar(db_path)
+    try:
+        dias_lidos = con.execute(
+            f"SELECT DIA, PARES, SKU_IDS, QTDS FROM vendas_dia WHERE {' AND '.join(filtros)}", params
+        ).fetchall()
+        nomes = dict(con.execute("SELECT ID, SKU FROM skus").fetchall())
+    finally:
+        con.close()
+
+    ids = np.frombuffer(b"".join(r[2] for r in dias_lidos), dtype=np.int32).astype(np.int64)
+    qtd = np.frombuffer(b"".join(r[3] for r in dias_lidos), dtype=np.int32).astype(np.int64)
+    dia = np.repeat(np.array([r[0] for r in dias_lidos], dtype=np.int64) - ini,
+                    np.array([r[1] for r in dias_lidos], dtype=np.int64))  # 0 .. max(janelas)-1
+
+    cod, uniq = pd.factorize(ids, sort=True)
+    span = max(janelas) + 1
+    chave = cod.astype(np.int64) * span + dia
+    ordem = np.argsort(chave, kind="stable")
+    chave = chave[ordem]
+    acum = np.concatenate([[0], np.cumsum(qtd[ordem])])
+
+    base = np.arange(len(uniq), dtype=np.int64) * span
+    fim = np.searchsorted(chave, base + span, side="left")   # tudo do SKU (dias <= ate)
+    out = {"SKU": np.array([nomes[i] for i in uniq.tolist()], dtype=object)}
+    for n, rot in zip(janelas, rotulos):
+        corte = np.searchsorted(chave, base + (max(janelas) - n), side="left")  # 1º dia da janela
+        out[rot] = acum[fim] - acum[corte]
+    return pd.DataFrame(out).sort_values("SKU", kind="stable").reset_index(drop=True)
+
+
+def vendas_janela(empresa: str, dias: int = 60, ate: Optional[int] = None,
+                  db_path: str = CUBO_DB_PATH) -> pd.DataFrame:
+    """Vendas da janela no formato que o motor recebe em vendas_df (SKU, Quantidade; só > 0)."""
+    df = janelas_vendas(empresa, [dias], ate=ate, db_path=db_path)
+    df = df.rename(columns={f"Vendas_{int(dias)}d": "Quantidade"})
+    return df[df["Quantidade"] > 0].reset_index(drop=True)
@@ -1,8 +1,10 @@
 # v4_api/engine_compras.py
 # Motor de cálculo de reposição (sem UI)
 
-from dataclasses import dataclass
-from typing import Tuple, Dict
+import hashlib
+import time
+from dataclasses import dataclass, replace
+from typing import Tuple, Dict, List, Sequence, Optional, Union
 
 import numpy as np
 import pandas as pd
@@ -39,6 +41,71 @@ def norm_sku(x: str) -> str:
     return str(x).strip().upper()
 
 
+# ---- versões vetorizadas (coluna inteira), mesmos resultados das escalares ----
+
+def _float_ou_nan(s):
+    try:
+        return float(s)
+    except Exception:
+        return np.nan
+
+
+def _limpa_br(s: str) -> str:
+    return (
+        s.strip().replace("\u00a0", " ").replace("R$", "").replace(" ", "")
+         .replace(".", "").replace(",", ".")
+    )
+
+
+def br_to_float_series(s: pd.Series) -> pd.Series:
+    """
+    br_to_float aplicado a uma coluna inteira.
+
+    Colunas já numéricas passam direto (astype). Em colunas de texto, só os
+    valores distintos são limpos (quantidades e preços repetem muito), numa
+    única passada fundida — mais rápida que encadear vários .str.replace —,
+    e a conversão para float é feita em bloco pelo NumPy.
+    Colunas mistas (texto + número) caem no br_to_float escalar.
+    """
+    if pd.api.types.is_numeric_dtype(s.dtype):
+        return s.astype(float)
+    if pd.api.types.infer_dtype(s, skipna=True) not in ("string", "empty"):
+        return s.map(br_to_float).astype(float)
+
+    codes, uniq = pd.factorize(s, use_na_sentinel=True)
+    limpo = np.array([_limpa_br(x) or None for x in uniq], dtype=object)
+    try:
+        valores = limpo.astype(float)
+    except (ValueError, TypeError):
+        # há células não numéricas ("-", "n/d"...): float() valor a valor vira NaN
+        valores = np.array([np.nan if x is None else _float_ou_nan(x) for x in limpo], dtype=float)
+
+    valores = np.append(valores, np.nan)  # código -1 (NaN) => NaN
+    return pd.Series(valores[codes], index=s.index, dtype=float)
+
+
+def norm_sku_series(s: pd.Series, translit=None) -> pd.Series:
+    """
+    norm_sku aplicado a uma coluna inteira. Normaliza só os valores distintos
+    (SKU repete muito em relatórios de pedidos) e, se `translit` for dado
+    (ex.: unidecode), aplica-o apenas aos valores que não são ASCII puro.
+    """
+    codes, uniq = pd.factorize(s, use_na_sentinel=True)
+
+    if pd.api.types.infer_dtype(uniq, skipna=True) not in ("string", "empty"):
+        if translit is None:
+            norm = [norm_sku(x) for x in uniq]
+        else:
+            norm = [translit(str(x)).strip().upper() for x in uniq]
+    elif translit is None:
+        norm = [x.strip().upper() for x in uniq]
+    else:
+        norm = [(x if x.isascii() else translit(x)).strip().upper() for x in uniq]
+
+    valores = np.array(norm + [""], dtype=object)  # código -1 (NaN) => ""
+    return pd.Series(valores[codes], index=s.index, dtype=object)
+
+
 @dataclass
 class Catalogo:
     catalogo_simples: pd.DataFrame  # component_sku, fornecedor, status_reposicao
@@ -54,7 +121,7 @@ def explodir_por_kits(df: pd.DataFrame, kits: pd.DataFrame,
     usando a tabela de kits (kit_sku, component_sku, qty).
     """
     base = df.copy()
-    base["kit_sku"] = base[sku_col].map(norm_sku)
+    base["kit_sku"] = norm_sku_series(base[sku_col])
     base["qtd"] = base[qtd_col].astype(int)
 
     merged = base.merge(kits, on="kit_sku", how="left")
@@ -67,17 +134,273 @@ def explodir_por_kits(df: pd.DataFrame, kits: pd.DataFrame,
     return out
 
 
-def construir_kits_efetivo(cat: Catalogo) -> pd.DataFrame:
+@dataclass
+class KitExplosionIndex:
+    """
+    Tabela de kits efetiva em forma CSR (kit -> componentes), montada uma vez
+    a partir de construir_kits_efetivo e reutilizada em todas as explosões.
+
+      kit_skus:  SKUs de kit (ordenados), posição = id do kit
+      comp_skus: SKUs de componente (ordenados), posição = id do componente
+      indptr:    componentes do kit i em comp_ids/qty[indptr[i]:indptr[i+1]]
+      skus:      dicionário de SKUs do Padrão (kits, componentes e catálogo);
+                 código int32 do SKU = posição. Cada tabela de entrada é
+                 traduzida uma vez e o resto do cálculo (kits, componentes,
+                 junções) trabalha só com os códigos.
+    """
+    kit_skus: np.ndarray
+    comp_skus: np.ndarray
+    indptr: np.ndarray
+    comp_ids: np.ndarray
+    qty: np.ndarray
+    skus: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        self._kit_pos = pd.Index(self.kit_skus)
+        self._comp_pos = pd.Index(self.comp_skus)
+        if self.skus is None:
+            self.skus = _uniao_skus(self.kit_skus, self.comp_skus)
+        self._sku_pos = pd.Index(self.skus)
+        # código do dicionário -> id do kit / do componente (-1: não é)
+        self._kit_de = self._kit_pos.get_indexer(self._sku_pos).astype(np.int32)
+        self._comp_de = self._comp_pos.get_indexer(self._sku_pos).astype(np.int32)
+        self.cod_comp = self._sku_pos.get_indexer(self._comp_pos).astype(np.int32)
+        # kit dono de cada aresta (para o "gather" kit -> componente)
+        self._edge_kit = np.repeat(
+            np.arange(len(self.kit_skus), dtype=np.int64), np.diff(self.indptr)
+        )
+
+    @classmethod
+    def de_kits(cls, kits: pd.DataFrame, skus_extra=None) -> "KitExplosionIndex":
+        """
+        Compila o DataFrame (kit_sku, component_sku, qty) já normalizado.
+        `skus_extra` (ex.: SKUs do catálogo) entram no dicionário antes de
+        kits e componentes: catálogo sem duplicatas => código = linha do catálogo.
+        """
+        k = kits[["kit_sku", "component_sku", "qty"]].dropna(subset=["kit_sku", "component_sku"])
+        kit_codes, kit_skus = pd.factorize(k["kit_sku"], sort=True)
+        comp_codes, comp_skus = pd.factorize(k["component_sku"], sort=True)
+
+        ordem = np.argsort(kit_codes, kind="stable")
+        contagem = np.bincount(kit_codes, minlength=len(kit_skus))
+        indptr = np.zeros(len(kit_skus) + 1, dtype=np.int64)
+        np.cumsum(contagem, out=indptr[1:])
+
+        return cls(
+            kit_skus=np.asarray(kit_skus, dtype=object),
+            comp_skus=np.asarray(comp_skus, dtype=object),
+            indptr=indptr,
+            comp_ids=comp_codes[ordem].astype(np.int64),
+            qty=k["qty"].to_numpy()[ordem].astype(np.int64),
+            skus=None if skus_extra is None else _uniao_skus(skus_extra, kit_skus, comp_skus),
+        )
+
+    def com_skus(self, skus) -> "KitExplosionIndex":
+        """Mesmo índice, com `skus` acrescentados ao dicionário."""
+        return replace(self, skus=_uniao_skus(self.skus, skus))
+
+    def codigos(self, skus) -> np.ndarray:
+        """Código int32 de cada SKU (já normalizado) no dicionário; -1 quando não está."""
+        return self._sku_pos.get_indexer(pd.Index(skus)).astype(np.int32)
+
+    def kit_de_codigo(self, cod: np.ndarray) -> np.ndarray:
+        """Como ids_kit, mas a partir dos códigos do dicionário."""
+        return np.where(cod >= 0, self._kit_de[cod], -1).astype(np.int32)
+
+    def comp_de_codigo(self, cod: np.ndarray) -> np.ndarray:
+        """Como ids_comp, mas a partir dos códigos do dicionário."""
+        return np.where(cod >= 0, self._comp_de[cod], -1).astype(np.int32)
+
+    def ids_kit(self, skus) -> np.ndarray:
+        """Id do kit para cada SKU (já normalizado); -1 quando não é kit conhecido."""
+        return self._kit_pos.get_indexer(pd.Index(skus))
+
+    def ids_comp(self, skus) -> np.ndarray:
+        """Id do componente para cada SKU (já normalizado); -1 quando nenhum kit o contém."""
+        return self._comp_pos.get_indexer(pd.Index(skus))
+
+    def explodir(self, ids: np.ndarray, *qtds: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Explode N vetores de quantidade (alinhados a `ids`) numa passada só.
+
+        Retorna (matriz n_componentes x N, máscara de componentes alcançados),
+        onde "alcançado" = algum SKU de entrada é kit que contém o componente
+        (mesmo conjunto de linhas que o merge/groupby de explodir_por_kits).
+        """
+        q = np.column_stack([np.asarray(c, dtype=np.int64) for c in qtds]) if qtds else None
+        return self.explodir_matriz(ids, q)
+
+    def explodir_matriz(self, ids: np.ndarray, q: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Como explodir, mas recebendo as quantidades já como matriz (n_linhas x N).
+        Cada soma (linha -> kit, kit -> componente) é um único bincount sobre
+        o índice achatado (id * N + coluna), qualquer que seja N.
+        """
+        ids = np.asarray(ids)
+        validos = ids >= 0
+        ids_v = ids[validos]
+        n_kits, n_comp = len(self.kit_skus), len(self.comp_skus)
+
+        kit_hit = np.bincount(ids_v, minlength=n_kits) > 0
+        alcancado = np.bincount(
+            self.comp_ids, weights=kit_hit[self._edge_kit], minlength=n_comp
+        ) > 0
+
+        if q is None:
+            return np.zeros((n_comp, 0), dtype=np.int64), alcancado
+        q = np.asarray(q, dtype=np.int64)
+        if q.ndim == 1:
+            q = q[:, None]
+        q = q[validos]
+        k = q.shape[1]
+        cols = np.arange(k, dtype=np.int64)
+
+        por_kit = np.bincount(
+            (ids_v[:, None] * k + cols).ravel(), weights=q.ravel(), minlength=n_kits * k
+        ).reshape(n_kits, k)
+        por_comp = np.bincount(
+            (self.comp_ids[:, None] * k + cols).ravel(),
+            weights=(self.qty[:, None] * por_kit[self._edge_kit]).ravel(),
+            minlength=n_comp * k,
+        ).reshape(n_comp, k)
+        return np.rint(por_comp).astype(np.int64), alcancado
+
+    def alcancados(self, ids: np.ndarray, grupos: np.ndarray, n_grupos: int) -> np.ndarray:
+        """
+        Máscara n_componentes x n_grupos: componente alcançado por algum SKU
+        de entrada daquele grupo (ex.: empresa). Mesmo critério de explodir.
+        """
+        ids = np.asarray(ids)
+        validos = ids >= 0
+        n_kits, n_comp = len(self.kit_skus), len(self.comp_skus)
+        kit_hit = np.bincount(
+            ids[validos] * n_grupos + np.asarray(grupos)[validos], minlength=n_kits * n_grupos
+        ).reshape(n_kits, n_grupos) > 0
+        cols = np.arange(n_grupos, dtype=np.int64)
+        return np.bincount(
+            (self.comp_ids[:, None] * n_grupos + cols).ravel(),
+            weights=kit_hit[self._edge_kit].ravel(),
+            minlength=n_comp * n_grupos,
+        ).reshape(n_comp, n_grupos) > 0
+
+    def explodir_df(self, df: pd.DataFrame, sku_col: str, qtd_cols: Sequence[str]) -> pd.DataFrame:
+        """
+        Equivalente a chamar explodir_por_kits para cada coluna de `qtd_cols`,
+        mas numa única explosão. Retorna SKU + uma coluna por quantidade.
+        """
+        ids = self.ids_kit(df[sku_col])
+        mat, alcancado = self.explodir(ids, *[df[c].astype(int).to_numpy() for c in qtd_cols])
+        out = pd.DataFrame(mat[alcancado], columns=list(qtd_cols))
+        out.insert(0, "SKU", self.comp_skus[alcancado])
+        return out
+
+
+def _uniao_skus(*skus) -> np.ndarray:
+    """SKUs distintos das listas dadas, na ordem em que aparecem."""
+    return pd.unique(np.concatenate([np.asarray(s, dtype=object) for s in skus])).astype(object)
+
+
+def achatar_kits(kits: pd.DataFrame, estrito: bool = False) -> Tuple[pd.DataFrame, List[List[str]]]:
+    """
+    Fecho transitivo da aba KITS: componente que também é kit (ex.: combo de
+    dois 3-packs) é trocado pelos componentes dele, multiplicando as
+    quantidades pelo caminho; o mesmo componente por caminhos diferentes soma.
+
+    Retorna (kits achatados, ciclos). Cada ciclo é a lista de kits do laço
+    (ex.: ["A", "B", "A"]); kits num ciclo, ou que levam a um, ficam de fora
+    do resultado. Kit que lista a si mesmo (X -> X) não é ciclo: X é folha.
+    Sem kit aninhado, devolve a própria tabela.
+
+    `estrito`: ciclo vira ValueError (com os laços) em vez de ficar de fora.
+    """
+    kit_col, comp_col = kits["kit_sku"].to_numpy(), kits["component_sku"].to_numpy()
+    eh_kit = set(kit_col)
+    if not any(c in eh_kit and c != k for k, c in zip(kit_col, comp_col)):
+        return kits, []
+
+    # kit -> [(componente, qty)], sem o próprio kit (folha) e sem par repetido
+    filhos: Dict[str, List[Tuple[str, int]]] = {}
+    vistos = set()
+    for k, c, q in zip(kit_col, comp_col, kits["qty"].to_numpy()):
+        if (k, c) not in vistos:
+            vistos.add((k, c))
+            filhos.setdefault(k, []).append((c, int(q)))
+
+    # DFS iterativa: ordem pós-fixada (filhos antes dos pais) + ciclos
+    ciclos: List[List[str]] = []
+    estado: Dict[str, int] = {}  # 1 = na pilha, 2 = concluído
+    invalidos = set()
+    pos_ordem: List[str] = []
+    for raiz in filhos:
+        if raiz in estado:
+            continue
+        pilha = [(raiz, iter(filhos[raiz]))]
+        caminho = [raiz]
+        estado[raiz] = 1
+        while pilha:
+            kit, it = pilha[-1]
+            for comp, _ in it:
+                if comp not in filhos or comp == kit:
+                    continue
+                if estado.get(comp) == 1:
+                    ciclos.append(caminho[caminho.index(comp):] + [comp])
+                    invalidos.update(caminho[caminho.index(comp):])
+                elif comp not in estado:
+                    estado[comp] = 1
+                    pilha.append((comp, iter(filhos[comp])))
+                    caminho.append(comp)
+                    break
+            else:
+                pilha.pop()
+                caminho.pop()
+                estado[kit] = 2
+                if any(c in invalidos and c != kit for c, _ in filhos[kit]):
+                    invalidos.add(kit)
+                pos_ordem.append(kit)
+
+    if ciclos and estrito:
+        raise ValueError(descrever_ciclos(ciclos))
+
+    folhas: Dict[str, Dict[str, int]] = {}
+    for kit in pos_ordem:
+        if kit in invalidos:
+            continue
+        acc: Dict[str, int] = {}
+        for comp, q in filhos[kit]:
+            if comp in folhas and comp != kit:
+                for c2, q2 in folhas[comp].items():
+                    acc[c2] = acc.get(c2, 0) + q * q2
+            else:
+                acc[comp] = acc.get(comp, 0) + q
+        folhas[kit] = acc
+
+    linhas = [(kit, c, q) for kit in filhos if kit in folhas for c, q in folhas[kit].items()]
+    plano = pd.DataFrame(linhas, columns=["kit_sku", "component_sku", "qty"])
+    plano["qty"] = plano["qty"].astype(int)
+    return plano, ciclos
+
+
+def descrever_ciclos(ciclos: List[List[str]], limite: int = 5) -> str:
+    """Mensagem com os primeiros `limite` laços (ex.: "A → B → A")."""
+    lacos = "; ".join(" → ".join(c) for c in ciclos[:limite])
+    resto = f" (+{len(ciclos) - limite})" if len(ciclos) > limite else ""
+    return f"KITS com ciclo: {lacos}{resto}"
+
+
+def construir_kits_efetivo(cat: Catalogo, achatados: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Normaliza a tabela de kits:
+      - achata kits de kits (achatar_kits; kits em ciclo ficam de fora),
       - garante apenas componentes válidos (que aparecem no catálogo),
       - cria alias 1:1 para cada componente simples que não é kit.
+    `achatados`: achatar_kits(cat.kits_reais) já calculado por quem chama (o
+    fecho transitivo não é refeito).
     Retorna DataFrame com colunas: kit_sku, component_sku, qty
     """
-    kits = cat.kits_reais.copy()
+    kits = achatados if achatados is not None else achatar_kits(cat.kits_reais)[0]
 
     componentes_validos = set(cat.catalogo_simples["component_sku"].unique())
-    kits_validos = set(kits["kit_sku"].unique())
+    kits_validos = set(cat.kits_reais["kit_sku"].unique())
 
     # 1. Mantém apenas linhas cujos componentes são válidos no catálogo
     kits = kits[kits["component_sku"].isin(componentes_validos)].copy()
@@ -97,7 +420,610 @@ def construir_kits_efetivo(cat: Catalogo) -> pd.DataFrame:
     return kits
 
 
+# ===================== PADRÃO PRÉ-NORMALIZADO =====================
+
+def hash_tabelas(*dfs: pd.DataFrame, extra: str = "") -> str:
+    """Hash curto (16 hex) do conteúdo das tabelas, na ordem dada."""
+    hsh = hashlib.sha1()
+    for df in dfs:
+        hsh.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        hsh.update("|".join(map(str, df.columns)).encode("utf-8"))
+    hsh.update(extra.encode("utf-8"))
+    return hsh.hexdigest()[:16]
+
+
+@dataclass
+class PadraoPreparado:
+    """
+    Catálogo + kits já normalizados e compilados, prontos para vários cálculos.
+    `versao` é o hash do conteúdo normalizado (mesmo Padrão => mesma versão).
+    """
+    versao: str
+    catalogo_df: pd.DataFrame   # component_sku, fornecedor, status_reposicao
+    kits_df: pd.DataFrame       # kit_sku, component_sku, qty
+    kits_efetivo: pd.DataFrame
+    kidx: KitExplosionIndex
+    ciclos_kits: List[List[str]]  # kits em ciclo na aba KITS (ficam de fora do cálculo)
+
+
+def preparar_padrao(catalogo_df: pd.DataFrame, kits_df: pd.DataFrame,
+                    aceitar_ciclos: bool = False) -> PadraoPreparado:
+    """
+    Aplica a mesma limpeza do app (_carregar_padrao_de_content) sobre tabelas
+    que já chegam com as colunas canônicas, e compila os kits efetivos.
+
+    Kits em ciclo: ValueError, salvo com `aceitar_ciclos` (aí ficam de fora
+    do cálculo, como no app, e são listados em `ciclos_kits`).
+    """
+    faltam_k = [c for c in ["kit_sku", "component_sku", "qty"] if c not in kits_df.columns]
+    if faltam_k:
+        raise ValueError(f"Colunas obrigatórias ausentes em KITS: {faltam_k}")
+    if "component_sku" not in catalogo_df.columns:
+        raise ValueError("CATALOGO precisa ter a coluna 'component_sku'.")
+
+    # KITS
+    kits = kits_df[["kit_sku", "component_sku", "qty"]].copy()
+    kits["kit_sku"] = norm_sku_series(kits["kit_sku"])
+    kits["component_sku"] = norm_sku_series(kits["component_sku"])
+    kits["qty"] = br_to_float_series(kits["qty"]).fillna(0).astype(int)
+    kits = kits[kits["qty"] >= 1].drop_duplicates(subset=["kit_sku", "component_sku"], keep="first")
+    kits = kits.reset_index(drop=True)
+
+    # CATALOGO
+    cat = catalogo_df.copy()
+    for c in ["fornecedor", "status_reposicao"]:
+        if c not in cat.columns:
+            cat[c] = ""
+    cat["component_sku"] = norm_sku_series(cat["component_sku"])
+    cat["fornecedor"] = cat["fornecedor"].fillna("").astype(str)
+    cat["status_reposicao"] = cat["status_reposicao"].fillna("").astype(str)
+    cat = cat[~cat["status_reposicao"].str.lower().str.contains("nao_repor", na=False)]
+    cat = cat.drop_duplicates(subset=["component_sku"], keep="last")
+    cat = cat[["component_sku", "fornecedor", "status_reposicao"]].reset_index(drop=True)
+
+    achatados, ciclos = achatar_kits(kits, estrito=not aceitar_ciclos)
+    efetivo = construir_kits_efetivo(Catalogo(catalogo_simples=cat, kits_reais=kits), achatados=achatados)
+    return PadraoPreparado(
+        versao=hash_tabelas(cat, kits),
+        catalogo_df=cat,
+        kits_df=kits,
+        kits_efetivo=efetivo,
+        kidx=KitExplosionIndex.de_kits(efetivo, skus_extra=cat["component_sku"]),
+        ciclos_kits=ciclos,
+    )
+
+
 # ===================== CÁLCULO PRINCIPAL =====================
+# O cálculo é feito em duas etapas:
+#   1) preparar_base_calculo: tudo que NÃO depende de h/g/LT (normalização,
+#      explosão das vendas, demanda, físico/FULL alinhados ao catálogo, painel);
+#      os alinhamentos são gathers posicionais sobre a chave (empresa, código
+#      do SKU), sem merge nem quadros intermediários;
+#   2) aplicar_parametros: alvo/envio do FULL, uma explosão do envio_desejado
+#      e a compra sugerida. É a única parte refeita quando só h/g/LT mudam.
+
+COL_EMPRESA = "Empresa"
+
+COLUNAS_FINAIS = [
+    "SKU",
+    "fornecedor",
+    "Vendas_Total_60d",
+    "Estoque_Full",
+    "Estoque_Fisico",
+    "Preco",
+    "Compra_Sugerida",
+    "Valor_Compra_R$",
+    "ML_60d",
+    "Shopee_60d",
+    "TOTAL_60d",
+    "Reserva_30d",
+    "Folga_Fisico",
+    "Necessidade",
+    "Em_Transito",
+]
+
+
+def _inicio(etapas: Optional[Dict[str, float]]) -> float:
+    return time.perf_counter() if etapas is not None else 0.0
+
+
+def _marcar(etapas: Optional[Dict[str, float]], nome: str, t0: float) -> float:
+    """Soma em etapas[nome] o tempo desde t0. Com etapas=None não mede nada."""
+    if etapas is None:
+        return 0.0
+    t = time.perf_counter()
+    etapas[nome] = etapas.get(nome, 0.0) + (t - t0)
+    return t
+
+
+def etapas_ms(etapas: Dict[str, float]) -> Dict[str, float]:
+    """Etapas em milissegundos, no formato devolvido dentro do painel."""
+    return {nome: round(seg * 1000.0, 3) for nome, seg in etapas.items()}
+
+
+@dataclass
+class BaseCalculo:
+    """
+    Etapa do cálculo independente de h/g/LT, pronta para ser reaproveitada.
+
+      base:          uma linha por linha do resultado final (mesma ordem); DataFrame,
+                     ou {coluna: array} quando engine="numpy"
+      full_vendas/full_oferta: vendas 60d e estoque+trânsito de cada linha do FULL
+      full_kit_ids:  id do kit de cada linha do FULL em `kidx` (-1 = não é kit)
+      base_comp_ids: id do componente de cada linha da base em `kidx` (-1 = nenhum kit o contém)
+      full_emp/base_emp: posição da empresa de cada linha em `empresas`
+      empresas:      empresas calculadas (só [""] quando não é por empresa)
+      painel:        painel único, ou {empresa: painel} quando por_empresa
+      chave:         hash das entradas + versão do Padrão (para invalidar caches)
+      engine:        backend que montou a base ("pandas" ou "numpy")
+      oc_aberta:     quantidade em OCs não recebidas de cada linha da base (já somada
+                     ao Em_Transito e descontada da compra); None = sem OCs
+    """
+    base: Union[pd.DataFrame, Dict[str, np.ndarray]]
+    full_vendas: np.ndarray
+    full_oferta: np.ndarray
+    full_kit_ids: np.ndarray
+    base_comp_ids: np.ndarray
+    full_emp: np.ndarray
+    base_emp: np.ndarray
+    empresas: list
+    por_empresa: bool
+    kidx: KitExplosionIndex
+    painel: Dict
+    chave: str = ""
+    engine: str = "pandas"
+    oc_aberta: Optional[np.ndarray] = None
+
+
+def preparar_base_calculo(
+    full_df: pd.DataFrame,
+    fisico_df: pd.DataFrame,
+    vendas_df: pd.DataFrame,
+    catalogo_df: pd.DataFrame,
+    kits_df: pd.DataFrame,
+    kidx: Optional[KitExplosionIndex] = None,
+    chave: str = "",
+    por_empresa: bool = False,
+    etapas: Optional[Dict[str, float]] = None,
+    engine: str = "pandas",
+    ocs_abertas: Optional[pd.DataFrame] = None,
+) -> BaseCalculo:
+    """
+    Etapa 1 do cálculo (sem h/g/LT). Mesmas entradas de calcular_compra.
+
+    Com por_empresa=True, FULL/Físico/Vendas chegam empilhados com a coluna
+    "Empresa" e todas as empresas são calculadas juntas, sobre os mesmos kits:
+    cada explosão é uma passada só, com uma coluna de quantidade por empresa.
+
+    `etapas` (opcional): dict onde somar a duração (s) de cada etapa.
+    `engine`: só muda o recipiente da base — DataFrame ("pandas", padrão) ou
+    {coluna: array} ("numpy", sem o custo fixo do DataFrame; bom para a API).
+    O cálculo é o mesmo, sobre vetores, nos dois casos.
+    `ocs_abertas` (opcional): SKU, Qtd_Aberta [, Empresa] das OCs ainda não
+    recebidas (ex.: ocs_compras.em_aberto_por_sku). Entra no Em_Transito do
+    componente e é descontada da compra sugerida.
+    """
+    if engine not in ("pandas", "numpy"):
+        raise ValueError(f"engine inválido: {engine!r} (use 'pandas' ou 'numpy').")
+
+    t = _inicio(etapas)
+
+    # 0. Monta objeto Catalogo + kits efetivos (+ dicionário de SKUs)
+    cat_df, kidx, cat_cod = _catalogo_codificado(catalogo_df, kits_df, kidx)
+    n_cat = len(cat_df)
+
+    t = _marcar(etapas, "0_kits", t)
+
+    # 1. NORMALIZA BASES (só as colunas usadas; SKU vira código do dicionário)
+    ent = _vetorizar_entradas(full_df, fisico_df, vendas_df, kidx, por_empresa)
+    empresas = ent.empresas
+    n_emp = len(empresas)
+
+    t = _marcar(etapas, "1_normaliza", t)
+
+    # 2. EXPLODE VENDAS FULL/SHOPEE PARA COMPONENTES
+    # Uma coluna por empresa; vendas e estoque do FULL saem da mesma explosão.
+    full_ids, ml_mat, estoque_full_mat, shp_mat = _explodir_vendas(ent, kidx)
+
+    t = _marcar(etapas, "2_explode", t)
+
+    # 3. MONTA DEMANDA (catálogo repetido por empresa; componente fora dos kits => 0)
+    # Linha i da demanda = empresa i // n_cat, linha i % n_cat do catálogo.
+    cat_comp = np.tile(kidx.comp_de_codigo(cat_cod), n_emp)
+    cat_emp = np.repeat(np.arange(n_emp, dtype=np.int32), n_cat)
+    no_kit = cat_comp >= 0
+    ml, shopee = (np.zeros(n_cat * n_emp, dtype=np.int64) for _ in range(2))
+    ml[no_kit] = ml_mat[cat_comp[no_kit], cat_emp[no_kit]]
+    shopee[no_kit] = shp_mat[cat_comp[no_kit], cat_emp[no_kit]]
+
+    # chave inteira (empresa, código do SKU) para os alinhamentos; SKU fora do dicionário => -1
+    n_dic = len(kidx.skus)
+    n_chaves = n_emp * n_dic
+    dem_chave = cat_emp.astype(np.int64) * n_dic + np.tile(cat_cod, n_emp)
+
+    t = _marcar(etapas, "3_demanda", t)
+
+    # 4. ESTOQUE FÍSICO (alinhado à demanda por posição)
+    linhas, pos_fis = _alinhar(dem_chave, _chave(ent.fis_emp, ent.fis_cod, n_dic), n_chaves)
+
+    t = _marcar(etapas, "4_fisico", t)
+
+    # 5. FULL (estoque e trânsito), idem; monta a base de uma vez
+    linhas_full, pos_full = _alinhar(dem_chave[linhas], _chave(ent.full_emp, ent.full_cod, n_dic), n_chaves)
+    linhas = linhas[linhas_full]
+    pos_fis = pos_fis[linhas_full]
+    linha_cat = linhas % n_cat
+    base_chave = dem_chave[linhas]
+
+    ml, shopee = ml[linhas], shopee[linhas]
+    total = np.maximum(ml + shopee, ml)
+    base = {
+        COL_EMPRESA: np.array(empresas, dtype=object)[cat_emp[linhas]],
+        "SKU": cat_df["SKU"].to_numpy()[linha_cat],
+        "fornecedor": cat_df["fornecedor"].to_numpy()[linha_cat],
+        "status_reposicao": cat_df["status_reposicao"].to_numpy()[linha_cat],
+        "ML_60d": ml,
+        "Shopee_60d": shopee,
+        "TOTAL_60d": total,
+        "Vendas_Total_60d": ml + shopee,
+        "Estoque_Fisico": _coletar(ent.fis_estoque, pos_fis, 0),
+        "Preco": _coletar(ent.fis_preco, pos_fis, 0.0),
+        "Estoque_Full": _coletar(ent.full_estoque, pos_full, 0),
+        "Em_Transito": _coletar(ent.full_transito, pos_full, 0),
+    }
+    oc_aberta = _ocs_alinhadas(ocs_abertas, kidx, empresas, por_empresa, base_chave)
+    if oc_aberta is not None:
+        base["Em_Transito"] = base["Em_Transito"] + oc_aberta
+
+    t = _marcar(etapas, "5_full", t)
+
+    # 6. RESERVA/FOLGA DO FÍSICO (não dependem do horizonte)
+    base["Demanda_dia"] = total / 60.0
+    base["Reserva_30d"] = np.round(base["Demanda_dia"] * 30).astype(int)
+    base["Folga_Fisico"] = np.clip(base["Estoque_Fisico"] - base["Reserva_30d"], 0, None).astype(int)
+    if engine == "pandas":
+        base = pd.DataFrame(base)
+
+    t = _marcar(etapas, "6_reserva", t)
+
+    # 7. PAINEL RESUMO (mesma ideia do app atual), por empresa
+    paineis = _paineis(ent, kidx, full_ids, estoque_full_mat)
+
+    _marcar(etapas, "7_painel", t)
+
+    return BaseCalculo(
+        base=base,
+        full_vendas=ent.full_vendas,
+        full_oferta=(ent.full_estoque + ent.full_transito).astype(int),
+        full_kit_ids=full_ids,
+        base_comp_ids=kidx.comp_de_codigo((base_chave % n_dic).astype(np.int32)),
+        full_emp=ent.full_emp,
+        base_emp=(base_chave // n_dic).astype(np.int32),
+        empresas=empresas,
+        por_empresa=por_empresa,
+        kidx=kidx,
+        painel=paineis if por_empresa else paineis[""],
+        chave=chave,
+        engine=engine,
+        oc_aberta=oc_aberta,
+    )
+
+
+@dataclass
+class _Entradas:
+    """FULL/Físico/Vendas como vetores: código do SKU no dicionário (-1 = fora), quantidades e empresa."""
+    empresas: list
+    full_cod: np.ndarray
+    full_emp: np.ndarray
+    full_vendas: np.ndarray
+    full_estoque: np.ndarray
+    full_transito: np.ndarray
+    shp_cod: np.ndarray
+    shp_emp: np.ndarray
+    shp_qtd: np.ndarray
+    fis_cod: np.ndarray
+    fis_emp: np.ndarray
+    fis_estoque: np.ndarray
+    fis_preco: np.ndarray
+
+
+def _vetorizar_entradas(
+    full_df: pd.DataFrame, fisico_df: pd.DataFrame, vendas_df: pd.DataFrame,
+    kidx: KitExplosionIndex, por_empresa: bool,
+) -> _Entradas:
+    """Normaliza os SKUs, codifica no dicionário de `kidx` e separa as colunas usadas."""
+    full_cod = kidx.codigos(norm_sku_series(full_df["SKU"]))
+    shp_cod = kidx.codigos(norm_sku_series(vendas_df["SKU"]))
+    fis_cod = kidx.codigos(norm_sku_series(fisico_df["SKU"]))
+
+    if por_empresa:
+        rotulos = []
+        for nome, df in [("FULL", full_df), ("Vendas", vendas_df), ("Físico", fisico_df)]:
+            if COL_EMPRESA not in df.columns:
+                raise ValueError(f"Coluna '{COL_EMPRESA}' ausente em {nome}.")
+            rotulos.append(df[COL_EMPRESA].astype(str).to_numpy())
+        empresas = list(pd.unique(np.concatenate(rotulos)))
+        emp_pos = pd.Index(empresas)
+        full_emp, shp_emp, fis_emp = (emp_pos.get_indexer(r).astype(np.int32) for r in rotulos)
+    else:
+        empresas = [""]
+        full_emp, shp_emp, fis_emp = (np.zeros(len(c), dtype=np.int32) for c in (full_cod, shp_cod, fis_cod))
+
+    return _Entradas(
+        empresas=empresas,
+        full_cod=full_cod,
+        full_emp=full_emp,
+        full_vendas=full_df["Vendas_Qtd_60d"].astype(int).to_numpy(),
+        full_estoque=full_df["Estoque_Full"].astype(int).to_numpy(),
+        full_transito=full_df["Em_Transito"].astype(int).to_numpy(),
+        shp_cod=shp_cod,
+        shp_emp=shp_emp,
+        shp_qtd=vendas_df["Quantidade"].astype(int).to_numpy(),
+        fis_cod=fis_cod,
+        fis_emp=fis_emp,
+        fis_estoque=_numerico(fisico_df["Estoque_Fisico"]).fillna(0).astype(int).to_numpy(),
+        fis_preco=_numerico(fisico_df["Preco"]).fillna(0.0).to_numpy(dtype=float),
+    )
+
+
+def _explodir_vendas(ent: _Entradas, kidx: KitExplosionIndex):
+    """
+    (full_ids, ml, estoque_full, shopee): id do kit de cada linha do FULL e as
+    matrizes componente x empresa das vendas/estoque do FULL e das vendas Shopee.
+    """
+    n_emp = len(ent.empresas)
+    full_ids = kidx.kit_de_codigo(ent.full_cod)
+    full_mat, _ = kidx.explodir_matriz(
+        full_ids, _por_empresa(ent.full_emp, n_emp, ent.full_vendas, ent.full_estoque)
+    )
+    shp_mat, _ = kidx.explodir_matriz(
+        kidx.kit_de_codigo(ent.shp_cod), _por_empresa(ent.shp_emp, n_emp, ent.shp_qtd)
+    )
+    return full_ids, full_mat[:, :n_emp], full_mat[:, n_emp:], shp_mat
+
+
+def _chave(emp: np.ndarray, cod: np.ndarray, n_dic: int) -> np.ndarray:
+    """Chave inteira (empresa, código do SKU); -1 onde o SKU está fora do dicionário."""
+    return np.where(cod >= 0, emp.astype(np.int64) * n_dic + cod, -1)
+
+
+def _paineis(ent: _Entradas, kidx: KitExplosionIndex, full_ids: np.ndarray,
+             estoque_full_mat: np.ndarray) -> Dict[str, Dict]:
+    """
+    {empresa: painel}: unidades e valor do físico e do FULL. O valor do FULL
+    é o estoque explodido para componentes vezes o preço do físico (um
+    componente repetido no físico conta uma vez por linha, como no merge do app).
+    """
+    n_dic = len(kidx.skus)
+    full_alcancado = kidx.alcancados(full_ids, ent.full_emp, len(ent.empresas))
+    paineis = {}
+    for e, emp in enumerate(ent.empresas):
+        m = ent.fis_emp == e
+        est_e, preco_e = ent.fis_estoque[m], ent.fis_preco[m]
+
+        alc = full_alcancado[:, e]
+        comp_linhas, pos = _alinhar(kidx.cod_comp[alc], ent.fis_cod[m], n_dic)
+        qtd_comp = estoque_full_mat[alc, e][comp_linhas]
+        paineis[emp] = {
+            "full_unid": int(ent.full_estoque[ent.full_emp == e].sum()),
+            "full_valor": float((qtd_comp * _coletar(preco_e, pos, 0.0)).sum()),
+            "fisico_unid": int(est_e.sum()),
+            "fisico_valor": float((est_e * preco_e).sum()),
+        }
+    return paineis
+
+
+def _numerico(s: pd.Series) -> pd.Series:
+    """
+    Coluna como número antes do fillna: coluna object (None/NaN misturados,
+    números em texto) vira float em vez de depender do downcast do fillna.
+    """
+    return s if pd.api.types.is_numeric_dtype(s.dtype) else pd.to_numeric(s, errors="coerce")
+
+
+def _alinhar(esquerda: np.ndarray, direita: np.ndarray, n_chaves: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Left join posicional por chave inteira em [0, n_chaves) (-1 na direita = não casa).
+
+    Retorna (linhas, pos): a linha esquerda[linhas[i]] casa com direita[pos[i]] (-1 = sem par).
+    Mesmas linhas e ordem de um merge(how="left"): chave repetida à direita
+    repete a linha da esquerda, na ordem em que aparece à direita.
+    """
+    validos = np.flatnonzero(direita >= 0)
+    cont = np.bincount(direita[validos], minlength=n_chaves)
+    if len(cont) == 0 or cont.max() <= 1:
+        pos_chave = np.full(n_chaves, -1, dtype=np.int64)
+        pos_chave[direita[validos]] = validos
+        return np.arange(len(esquerda)), pos_chave[esquerda]
+
+    ordem = validos[np.argsort(direita[validos], kind="stable")]
+    inicio = np.concatenate([[0], np.cumsum(cont)[:-1]])
+    por_linha = np.maximum(cont[esquerda], 1)
+    linhas = np.repeat(np.arange(len(esquerda)), por_linha)
+    desloc = np.arange(len(linhas)) - np.repeat(np.cumsum(por_linha) - por_linha, por_linha)
+    casou = cont[esquerda[linhas]] > 0
+    pos = np.full(len(linhas), -1, dtype=np.int64)
+    pos[casou] = ordem[inicio[esquerda[linhas[casou]]] + desloc[casou]]
+    return linhas, pos
+
+
+def _coletar(valores: np.ndarray, pos: np.ndarray, vazio) -> np.ndarray:
+    """valores[pos], com `vazio` onde pos == -1 (o fillna do antigo merge)."""
+    out = np.full(len(pos), vazio, dtype=np.result_type(valores.dtype, type(vazio)))
+    ok = pos >= 0
+    out[ok] = valores[pos[ok]]
+    return out
+
+
+def _catalogo_codificado(
+    catalogo_df: pd.DataFrame, kits_df: pd.DataFrame, kidx: Optional[KitExplosionIndex]
+) -> Tuple[pd.DataFrame, KitExplosionIndex, np.ndarray]:
+    """(catálogo com SKU/fornecedor/status, índice de kits, código de cada SKU do catálogo)."""
+    cat_df = catalogo_df[["component_sku", "fornecedor", "status_reposicao"]].rename(
+        columns={"component_sku": "SKU"}
+    )
+    if kidx is None:
+        cat = Catalogo(
+            catalogo_simples=catalogo_df.copy(),
+            kits_reais=kits_df.copy()
+        )
+        kits = construir_kits_efetivo(cat)
+        kidx = KitExplosionIndex.de_kits(kits, skus_extra=cat_df["SKU"])
+    cat_skus = cat_df["SKU"].to_numpy(dtype=object)
+    n_cat = len(cat_skus)
+    if n_cat <= len(kidx.skus) and (kidx.skus[:n_cat] == cat_skus).all():
+        cat_cod = np.arange(n_cat, dtype=np.int32)  # catálogo do Padrão abre o dicionário
+    else:
+        cat_cod = kidx.codigos(cat_skus)
+        if (cat_cod < 0).any():  # índice compilado sem o catálogo no dicionário
+            kidx = kidx.com_skus(cat_skus)
+            cat_cod = kidx.codigos(cat_skus)
+    return cat_df, kidx, cat_cod
+
+
+def _ocs_alinhadas(
+    ocs_abertas: Optional[pd.DataFrame], kidx: KitExplosionIndex, empresas: list,
+    por_empresa: bool, base_chave: np.ndarray,
+) -> Optional[np.ndarray]:
+    """
+    Qtd_Aberta das OCs somada por (empresa, SKU) e alinhada às linhas da base
+    (mesma chave inteira dos alinhamentos). SKU fora do dicionário, ou empresa
+    que não está no cálculo, fica de fora. Sem por_empresa, soma todas as linhas.
+    """
+    if ocs_abertas is None:
+        return None
+    n_dic = len(kidx.skus)
+    cod = kidx.codigos(norm_sku_series(ocs_abertas["SKU"])).astype(np.int64)
+    if por_empresa:
+        if COL_EMPRESA not in ocs_abertas.columns:
+            raise ValueError(f"Coluna '{COL_EMPRESA}' ausente em OCs abertas.")
+        emp = pd.Index(empresas).get_indexer(ocs_abertas[COL_EMPRESA].astype(str))
+    else:
+        emp = np.zeros(len(cod), dtype=np.int64)
+    ok = (cod >= 0) & (emp >= 0)
+    qtd = _numerico(ocs_abertas["Qtd_Aberta"]).fillna(0).astype(np.int64).to_numpy()
+    soma = np.zeros(len(empresas) * n_dic, dtype=np.int64)
+    np.add.at(soma, emp[ok] * n_dic + cod[ok], qtd[ok])
+    return soma[base_chave]
+
+
+def _por_empresa(emp: np.ndarray, n_emp: int, *qtds: np.ndarray) -> np.ndarray:
+    """
+    Espalha cada vetor de quantidade na coluna da empresa da linha:
+    matriz n_linhas x (len(qtds) * n_emp), bloco j = quantidade j por empresa.
+    """
+    m = np.zeros((len(emp), len(qtds) * n_emp), dtype=np.int64)
+    linhas = np.arange(len(emp))
+    for j, q in enumerate(qtds):
+        m[linhas, j * n_emp + emp] = q
+    return m
+
+
+def _rotulo_cenario(h, g, LT) -> str:
+    return f"h{h}_g{g:g}_LT{LT}"
+
+
+def _compra_por_cenario(prep: BaseCalculo, cenarios: Sequence[Tuple[int, float, int]]):
+    """
+    Necessidade, compra e valor (matrizes n_linhas_base x n_cenários) para
+    uma lista de (h, g, LT). Alvo/envio do FULL são calculados em broadcast
+    e o envio_desejado de todos os cenários (e empresas) sai de uma única explosão.
+    """
+    hs = np.array([c[0] for c in cenarios])
+    lts = np.array([c[2] for c in cenarios])
+    # fator calculado em float Python, igual ao cálculo escalar original
+    fator = np.array([(1.0 + g / 100.0) ** (h / 30.0) for h, g, _ in cenarios], dtype=float)
+
+    vendas_dia = prep.full_vendas / 60.0
+    alvo = np.round(vendas_dia[:, None] * (lts + hs)[None, :] * fator[None, :]).astype(int)
+    envio_desejado = np.clip(alvo - prep.full_oferta[:, None], 0, None).astype(int)
+
+    # colunas da explosão: empresa * n_cenários + cenário
+    k = len(cenarios)
+    cols = np.arange(k)
+    if len(prep.empresas) > 1:
+        q = np.zeros((len(envio_desejado), len(prep.empresas) * k), dtype=np.int64)
+        q[np.arange(len(q))[:, None], prep.full_emp[:, None] * k + cols] = envio_desejado
+    else:
+        q = envio_desejado
+    nec_comp, _ = prep.kidx.explodir_matriz(prep.full_kit_ids, q)
+
+    ids = prep.base_comp_ids
+    alcancado = ids >= 0
+    necessidade = np.zeros((len(ids), k), dtype=int)
+    necessidade[alcancado] = nec_comp[
+        ids[alcancado][:, None], prep.base_emp[alcancado][:, None] * k + cols
+    ]
+
+    folga = np.asarray(prep.base["Folga_Fisico"])
+    if prep.oc_aberta is not None:
+        folga = folga + prep.oc_aberta  # o que já foi pedido e não chegou cobre a necessidade
+    preco = np.asarray(prep.base["Preco"], dtype=float)
+    compra = np.clip(necessidade - folga[:, None], 0, None).astype(int)
+    valor = np.round(compra.astype(float) * preco[:, None], 2)
+    return necessidade, compra, valor
+
+
+def aplicar_parametros(prep: BaseCalculo, h: int = 60, g: float = 0.0, LT: int = 0,
+                       etapas: Optional[Dict[str, float]] = None) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Etapa 2 do cálculo: envio desejado do FULL para h/g/LT, explodido para
+    componentes, e compra sugerida. Retorna (df_final, painel) como calcular_compra;
+    por empresa, df_final ganha a coluna "Empresa" e painel vem {empresa: painel}.
+    """
+    t = _inicio(etapas)
+
+    # 8. CÁLCULO DE NECESSIDADE (TARGET)
+    necessidade, compra, valor = _compra_por_cenario(prep, [(h, g, LT)])
+
+    base = prep.base.copy()
+    base["Necessidade"] = necessidade[:, 0]
+    base["Compra_Sugerida"] = compra[:, 0]
+    base["Valor_Compra_R$"] = valor[:, 0]
+
+    t = _marcar(etapas, "8_necessidade", t)
+
+    # 9. SELEÇÃO DAS COLUNAS FINAIS
+    colunas = ([COL_EMPRESA] if prep.por_empresa else []) + COLUNAS_FINAIS
+    if prep.engine == "numpy":
+        df_final = pd.DataFrame({c: base[c] for c in colunas})
+    else:
+        df_final = base[colunas].reset_index(drop=True)
+    _marcar(etapas, "9_selecao", t)
+    if prep.por_empresa:
+        return df_final, {emp: dict(p) for emp, p in prep.painel.items()}
+    return df_final, dict(prep.painel)
+
+
+def aplicar_cenarios(
+    prep: BaseCalculo, cenarios: Sequence[Tuple[int, float, int]],
+    etapas: Optional[Dict[str, float]] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Várias combinações (h, g, LT) de uma vez sobre a mesma base.
+
+    Retorna (compra, valor): DataFrames com a coluna SKU (mesmas linhas e
+    ordem do df_final; "Empresa" antes dela quando por empresa) e uma coluna
+    por cenário, rotulada "h{h}_g{g}_LT{LT}". Cada coluna é igual ao
+    Compra_Sugerida / Valor_Compra_R$ de aplicar_parametros com aqueles parâmetros.
+    """
+    if not cenarios:
+        raise ValueError("Informe ao menos um cenário (h, g, LT).")
+    t = _inicio(etapas)
+    _, compra, valor = _compra_por_cenario(prep, cenarios)
+    t = _marcar(etapas, "8_necessidade", t)
+    rotulos = [_rotulo_cenario(h, g, LT) for h, g, LT in cenarios]
+    chaves = [COL_EMPRESA, "SKU"] if prep.por_empresa else ["SKU"]
+    if prep.engine == "numpy":
+        base_chaves = pd.DataFrame({c: prep.base[c] for c in chaves})
+    else:
+        base_chaves = prep.base[chaves].reset_index(drop=True)
+
+    compra_df = pd.concat([base_chaves, pd.DataFrame(compra, columns=rotulos)], axis=1)
+    valor_df = pd.concat([base_chaves, pd.DataFrame(valor, columns=rotulos)], axis=1)
+    _marcar(etapas, "9_selecao", t)
+    return compra_df, valor_df
+
 
 def calcular_compra(
     full_df: pd.DataFrame,
@@ -108,6 +1034,11 @@ def calcular_compra(
     h: int = 60,
     g: float = 0.0,
     LT: int = 0,
+    kidx: Optional[KitExplosionIndex] = None,
+    por_empresa: bool = False,
+    medir_etapas: bool = False,
+    engine: str = "pandas",
+    ocs_abertas: Optional[pd.DataFrame] = None,
 ) -> Tuple[pd.DataFrame, Dict]:
     """
     Reproduz a lógica de cálculo atual, mas sem Streamlit nem estado global.
@@ -118,132 +1049,30 @@ def calcular_compra(
       vendas_df: SKU, Quantidade
       catalogo_df: component_sku, fornecedor, status_reposicao
       kits_df:   kit_sku, component_sku, qty
-    """
-
-    # 0. Monta objeto Catalogo + kits efetivos
-    cat = Catalogo(
-        catalogo_simples=catalogo_df.copy(),
-        kits_reais=kits_df.copy()
-    )
-    kits = construir_kits_efetivo(cat)
 
-    # 1. NORMALIZA BASES
-    full = full_df.copy()
-    full["SKU"] = full["SKU"].map(norm_sku)
-    full["Vendas_Qtd_60d"] = full["Vendas_Qtd_60d"].astype(int)
-    full["Estoque_Full"] = full["Estoque_Full"].astype(int)
-    full["Em_Transito"] = full["Em_Transito"].astype(int)
+    `kidx` (opcional): índice de kits já compilado para este catálogo
+    (ex.: PadraoPreparado.kidx), evitando reconstruir os kits efetivos.
 
-    shp = vendas_df.copy()
-    shp["SKU"] = shp["SKU"].map(norm_sku)
-    shp["Quantidade_60d"] = shp["Quantidade"].astype(int)
+    `por_empresa`: entradas empilhadas com a coluna "Empresa"; devolve um
+    resultado longo (com "Empresa") e {empresa: painel}.
 
-    # 2. EXPLODE VENDAS FULL/SHOPEE PARA COMPONENTES
-    ml_comp = explodir_por_kits(
-        full[["SKU", "Vendas_Qtd_60d"]].rename(columns={"SKU": "kit_sku", "Vendas_Qtd_60d": "Qtd"}),
-        kits, "kit_sku", "Qtd"
-    ).rename(columns={"Quantidade": "ML_60d"})
+    `medir_etapas`: inclui no painel "etapas_ms" = {etapa: duração em ms}.
 
-    shopee_comp = explodir_por_kits(
-        shp[["SKU", "Quantidade_60d"]].rename(columns={"SKU": "kit_sku", "Quantidade_60d": "Qtd"}),
-        kits, "kit_sku", "Qtd"
-    ).rename(columns={"Quantidade": "Shopee_60d"})
+    `engine`: "pandas" (padrão) ou "numpy" — mesmo df_final/painel; o
+    backend numpy evita o custo fixo dos DataFrames (bom para a API).
 
-    cat_df = catalogo_df[["component_sku", "fornecedor", "status_reposicao"]].rename(
-        columns={"component_sku": "SKU"}
-    )
+    `ocs_abertas`: SKU, Qtd_Aberta [, Empresa] das OCs não recebidas; somadas
+    ao Em_Transito e descontadas da compra (ver ocs_compras.em_aberto_por_sku).
 
-    # 3. MONTA DEMANDA
-    demanda = cat_df.merge(ml_comp, on="SKU", how="left").merge(shopee_comp, on="SKU", how="left")
-    demanda[["ML_60d", "Shopee_60d"]] = demanda[["ML_60d", "Shopee_60d"]].fillna(0).astype(int)
-    demanda["TOTAL_60d"] = np.maximum(
-        demanda["ML_60d"] + demanda["Shopee_60d"],
-        demanda["ML_60d"]
-    ).astype(int)
-    demanda["Vendas_Total_60d"] = demanda["ML_60d"] + demanda["Shopee_60d"]
-
-    # 4. ESTOQUE FÍSICO
-    fis = fisico_df.copy()
-    fis["SKU"] = fis["SKU"].map(norm_sku)
-    fis["Estoque_Fisico"] = fis["Estoque_Fisico"].fillna(0).astype(int)
-    fis["Preco"] = fis["Preco"].fillna(0.0)
-
-    base = demanda.merge(fis, on="SKU", how="left")
-    base["Estoque_Fisico"] = base["Estoque_Fisico"].fillna(0).astype(int)
-    base["Preco"] = base["Preco"].fillna(0.0)
-
-    # 5. MERGE COM FULL
-    full_simple = full[["SKU", "Estoque_Full", "Em_Transito"]].copy()
-    base = base.merge(full_simple, on="SKU", how="left")
-    base["Estoque_Full"] = base["Estoque_Full"].fillna(0).astype(int)
-    base["Em_Transito"] = base["Em_Transito"].fillna(0).astype(int)
-
-    # 6. CÁLCULO DE NECESSIDADE (TARGET)
-    fator = (1.0 + g / 100.0) ** (h / 30.0)
-
-    fk = full.copy()
-    fk["vendas_dia"] = fk["Vendas_Qtd_60d"] / 60.0
-    fk["alvo"] = np.round(fk["vendas_dia"] * (LT + h) * fator).astype(int)
-    fk["oferta"] = (full["Estoque_Full"] + full["Em_Transito"]).astype(int)
-    fk["envio_desejado"] = (fk["alvo"] - fk["oferta"]).clip(lower=0).astype(int)
-
-    necessidade = explodir_por_kits(
-        fk[["SKU", "envio_desejado"]].rename(columns={"SKU": "kit_sku", "envio_desejado": "Qtd"}),
-        kits, "kit_sku", "Qtd"
-    ).rename(columns={"Quantidade": "Necessidade"})
-
-    base = base.merge(necessidade, on="SKU", how="left")
-    base["Necessidade"] = base["Necessidade"].fillna(0).astype(int)
-
-    base["Demanda_dia"] = base["TOTAL_60d"] / 60.0
-    base["Reserva_30d"] = np.round(base["Demanda_dia"] * 30).astype(int)
-    base["Folga_Fisico"] = (base["Estoque_Fisico"] - base["Reserva_30d"]).clip(lower=0).astype(int)
-
-    base["Compra_Sugerida"] = (base["Necessidade"] - base["Folga_Fisico"]).clip(lower=0).astype(int)
-    base["Valor_Compra_R$"] = (
-        base["Compra_Sugerida"].astype(float) * base["Preco"].astype(float)
-    ).round(2)
-
-    # 7. SELEÇÃO DAS COLUNAS FINAIS
-    df_final = base[
-        [
-            "SKU",
-            "fornecedor",
-            "Vendas_Total_60d",
-            "Estoque_Full",
-            "Estoque_Fisico",
-            "Preco",
-            "Compra_Sugerida",
-            "Valor_Compra_R$",
-            "ML_60d",
-            "Shopee_60d",
-            "TOTAL_60d",
-            "Reserva_30d",
-            "Folga_Fisico",
-            "Necessidade",
-            "Em_Transito",
-        ]
-    ].reset_index(drop=True)
-
-    # 8. PAINEL RESUMO (mesma ideia do app atual)
-    fis_unid = int(fis["Estoque_Fisico"].sum())
-    fis_valor = float((fis["Estoque_Fisico"] * fis["Preco"]).sum())
-
-    full_stock_comp = explodir_por_kits(
-        full[["SKU", "Estoque_Full"]].rename(columns={"SKU": "kit_sku", "Estoque_Full": "Qtd"}),
-        kits, "kit_sku", "Qtd"
-    )
-    full_stock_comp = full_stock_comp.merge(fis[["SKU", "Preco"]], on="SKU", how="left")
-    full_unid = int(full["Estoque_Full"].sum())
-    full_valor = float(
-        (full_stock_comp["Quantidade"].fillna(0) * full_stock_comp["Preco"].fillna(0.0)).sum()
+    Para recalcular só com outros h/g/LT, guarde o resultado de
+    preparar_base_calculo e chame aplicar_parametros.
+    """
+    etapas = {} if medir_etapas else None
+    prep = preparar_base_calculo(
+        full_df, fisico_df, vendas_df, catalogo_df, kits_df, kidx=kidx, por_empresa=por_empresa,
+        etapas=etapas, engine=engine, ocs_abertas=ocs_abertas,
     )
-
-    painel = {
-        "full_unid": full_unid,
-        "full_valor": full_valor,
-        "fisico_unid": fis_unid,
-        "fisico_valor": fis_valor,
-    }
-
+    df_final, painel = aplicar_parametros(prep, h=h, g=g, LT=LT, etapas=etapas)
+    if etapas is not None:
+        painel["etapas_ms"] = etapas_ms(etapas)
     return df_final, painel
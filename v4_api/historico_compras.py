@@ -0,0 +1,295 @@
+# v4_api/historico_compras.py
+# Histórico dos resultados calculados: cada execução vira um snapshot
+# imutável em Parquet (colunar, zstd), particionado por empresa e data:
+#
+#   historico_compras/empresa=JCA/data=2026-10-17/20261017T081500-1a2b3c4d.parquet
+#
+# O índice (historico.db, SQLite) guarda parâmetros, versão do Padrão e hash
+# das entradas de cada snapshot; listar um ano de execuções é uma consulta
+# indexada e o diff lê só as colunas comparadas dos dois arquivos.
+
+import json
+import os
+import re
+import sqlite3
+import uuid
+import datetime as dt
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# ===================== CONFIG =====================
+RAIZ_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HIST_DIR = os.environ.get("HIST_DIR", os.path.join(RAIZ_DIR, "historico_compras"))
+HIST_COMPRESSAO = "zstd"
+_META_CHAVE = b"reposicao.snapshot"
+
+# Colunas comparadas por padrão no diff
+COLUNAS_DIFF = [
+    "Compra_Sugerida",
+    "Valor_Compra_R$",
+    "Necessidade",
+    "Vendas_Total_60d",
+    "Estoque_Full",
+    "Estoque_Fisico",
+    "Em_Transito",
+    "Preco",
+]
+
+MUDANCA_NOVO = "novo"
+MUDANCA_REMOVIDO = "removido"
+MUDANCA_ALTERADO = "alterado"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    RUN_ID         TEXT PRIMARY KEY,
+    EMPRESA        TEXT NOT NULL,
+    DATA           TEXT NOT NULL,
+    CRIADO_EM      REAL NOT NULL,
+    H              INTEGER,
+    G              REAL,
+    LT             INTEGER,
+    VERSAO_PADRAO  TEXT,
+    CHAVE_ENTRADAS TEXT,
+    LINHAS         INTEGER,
+    ARQUIVO        TEXT NOT NULL,
+    EXTRA_JSON     TEXT
+)
+"""
+
+_COLUNAS_INDICE = ["RUN_ID", "EMPRESA", "DATA", "CRIADO_EM", "H", "G", "LT",
+                   "VERSAO_PADRAO", "CHAVE_ENTRADAS", "LINHAS", "ARQUIVO", "EXTRA_JSON"]
+
+
+# ===================== ÍNDICE (SQLITE) =====================
+def _conectar(hist_dir: str) -> sqlite3.Connection:
+    os.makedirs(hist_dir, exist_ok=True)
+    con = sqlite3.connect(os.path.join(hist_dir, "historico.db"), timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(_SCHEMA)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_snap_empresa_data ON snapshots (EMPRESA, DATA, CRIADO_EM)")
+    return con
+
+
+def _particao(empresa: str) -> str:
+    """Nome de diretório seguro para a empresa (o nome original fica no índice)."""
+    return re.sub(r"[^0-9A-Za-z_.-]", "_", empresa) or "_"
+
+
+# ===================== GRAVAÇÃO =====================
+def gravar_snapshot(
+    df: pd.DataFrame,
+    empresa: str,
+    h: int,
+    g: float,
+    LT: int,
+    versao_padrao: str = "",
+    chave_entradas: str = "",
+    extra: Optional[Dict] = None,
+    quando: Optional[dt.datetime] = None,
+    hist_dir: str = HIST_DIR,
+) -> str:
+    """
+    Grava o resultado (df_final de uma empresa) como novo snapshot e o
+    registra no índice. Nunca sobrescreve: cada chamada gera um RUN_ID novo.
+    Retorna o RUN_ID.
+    """
+    quando = quando or dt.datetime.now()
+    run_id = f"{quando:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    data = quando.strftime("%Y-%m-%d")
+    meta = {
+        "run_id": run_id, "empresa": empresa, "data": data,
+        "h": int(h), "g": float(g), "LT": int(LT),
+        "versao_padrao": versao_padrao, "chave_entradas": chave_entradas,
+        "extra": extra or {},
+    }
+
+    rel = os.path.join(f"empresa={_particao(empresa)}", f"data={data}", f"{run_id}.parquet")
+    path = os.path.join(hist_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tabela = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    tabela = tabela.replace_schema_metadata({
+        **(tabela.schema.metadata or {}), _META_CHAVE: json.dumps(meta).encode("utf-8"),
+    })
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        pq.write_table(tabela, tmp, compression=HIST_COMPRESSAO)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    con = _conectar(hist_dir)
+    try:
+        with con:
+            con.execute(
+                f"INSERT INTO snapshots ({', '.join(_COLUNAS_INDICE)}) "
+                f"VALUES ({', '.join('?' * len(_COLUNAS_INDICE))})",
+                (run_id, empresa, data, quando.timestamp(), int(h), float(g), int(LT),
+                 versao_padrao, chave_entradas, int(len(df)), rel, json.dumps(extra or {})),
+            )
+    finally:
+        con.close()
+    return run_id
+
+
+def gravar_resultado(
+    df_final: pd.DataFrame,
+    por_empresa: bool,
+    empresa: Optional[str],
+    h: int,
+    g: float,
+    LT: int,
+    versao_padrao: str = "",
+    chave_entradas: str = "",
+    extra: Optional[Dict] = None,
+    hist_dir: str = HIST_DIR,
+) -> Dict[str, str]:
+    """
+    Um snapshot por empresa do resultado do motor (com coluna "Empresa" quando
+    `por_empresa`; senão tudo vai para `empresa`). Retorna {empresa: run_id}.
+    """
+    if por_empresa:
+        partes = {emp: df.drop(columns="Empresa") for emp, df in df_final.groupby("Empresa", sort=False)}
+    else:
+        partes = {str(empresa or ""): df_final}
+    return {
+        emp: gravar_snapshot(df, emp, h, g, LT, versao_padrao=versao_padrao,
+                             chave_entradas=chave_entradas, extra=extra, hist_dir=hist_dir)
+        for emp, df in partes.items()
+    }
+
+
+# ===================== CONSULTA =====================
+def listar_snapshots(
+    empresa: Optional[str] = None,
+    desde: Optional[str] = None,
+    ate: Optional[str] = None,
+    limite: Optional[int] = None,
+    hist_dir: str = HIST_DIR,
+) -> pd.DataFrame:
+    """Snapshots do índice, do mais recente para o mais antigo (datas "AAAA-MM-DD", inclusivas)."""
+    filtros, params = [], []
+    for cond, valor in [("EMPRESA = ?", empresa), ("DATA >= ?", desde), ("DATA <= ?", ate)]:
+        if valor is not None:
+            filtros.append(cond)
+            params.append(valor)
+    sql = f"SELECT {', '.join(_COLUNAS_INDICE[:-2])} FROM snapshots"
+    if filtros:
+        sql += " WHERE " + " AND ".join(filtros)
+    sql += " ORDER BY CRIADO_EM DESC"
+    if limite:
+        sql += f" LIMIT {int(limite)}"
+    con = _conectar(hist_dir)
+    try:
+        return pd.read_sql_query(sql, con, params=params)
+    finally:
+        con.close()
+
+
+def info_snapshot(run_id: str, hist_dir: str = HIST_DIR) -> Optional[Dict]:
+    """Linha do índice do snapshot (dict), ou None se não existe."""
+    con = _conectar(hist_dir)
+    try:
+        row = con.execute(
+            f"SELECT {', '.join(_COLUNAS_INDICE)} FROM snapshots WHERE RUN_ID = ?", (run_id,)
+        ).fetchone()
+    finally:
+        con.close()
+    if row is None:
+        return None
+    info = dict(zip(_COLUNAS_INDICE, row))
+    info["EXTRA_JSON"] = json.loads(info["EXTRA_JSON"] or "{}")
+    return info
+
+
+def ler_snapshot(run_id: str, colunas: Optional[Sequence[str]] = None,
+                 hist_dir: str = HIST_DIR) -> Optional[pd.DataFrame]:
+    """
+    Resultado gravado no snapshot (só `colunas`, se informadas); None se não
+    existe no índice ou se o arquivo Parquet sumiu do disco.
+    """
+    info = info_snapshot(run_id, hist_dir)
+    if info is None:
+        return None
+    path = os.path.join(hist_dir, info["ARQUIVO"])
+    if not os.path.exists(path):
+        return None
+    if colunas is not None:
+        existentes = set(pq.read_schema(path).names)
+        colunas = [c for c in colunas if c in existentes]
+    return pq.read_table(path, columns=colunas).to_pandas()
+
+
+# ===================== DIFF =====================
+def _primeira_posicao(codigos: np.ndarray, n: int) -> np.ndarray:
+    """Posição da 1ª ocorrência de cada código em [0, n) (-1 = ausente)."""
+    pos = np.full(n, -1, dtype=np.int64)
+    pos[codigos[::-1]] = np.arange(len(codigos) - 1, -1, -1)
+    return pos
+
+
+def diff_resultados(de: pd.DataFrame, para: pd.DataFrame,
+                    colunas: Sequence[str] = COLUNAS_DIFF) -> pd.DataFrame:
+    """
+    Compara dois resultados pelo SKU, sem merge: os SKUs dos dois lados viram
+    um dicionário de códigos (factorize) e cada coluna é alinhada por posição.
+
+    Retorna só as linhas que mudaram: SKU, Mudanca (novo/removido/alterado) e,
+    para cada coluna c, c_de, c_para e c_delta (lado ausente conta como 0 no
+    delta). SKU repetido num lado usa a 1ª ocorrência. Ordem: maior |delta|
+    da primeira coluna primeiro.
+    """
+    colunas = [c for c in colunas if c in de.columns and c in para.columns]
+    sku_de = de["SKU"].astype(str).to_numpy()
+    sku_para = para["SKU"].astype(str).to_numpy()
+    codigos, skus = pd.factorize(np.concatenate([sku_de, sku_para]))
+    n = len(skus)
+    pos_de = _primeira_posicao(codigos[:len(sku_de)], n)
+    pos_para = _primeira_posicao(codigos[len(sku_de):], n)
+    tem_de, tem_para = pos_de >= 0, pos_para >= 0
+
+    mudou = tem_de != tem_para
+    valores = {}
+    for c in colunas:
+        v_de = np.full(n, np.nan)
+        v_para = np.full(n, np.nan)
+        v_de[tem_de] = de[c].to_numpy(dtype=float)[pos_de[tem_de]]
+        v_para[tem_para] = para[c].to_numpy(dtype=float)[pos_para[tem_para]]
+        mudou |= tem_de & tem_para & ~np.isclose(v_de, v_para, rtol=0.0, atol=1e-9, equal_nan=True)
+        valores[c] = (v_de, v_para)
+
+    idx = np.flatnonzero(mudou)
+    mudanca = np.where(~tem_de[idx], MUDANCA_NOVO,
+                       np.where(~tem_para[idx], MUDANCA_REMOVIDO, MUDANCA_ALTERADO)).astype(object)
+    out = {"SKU": np.asarray(skus, dtype=object)[idx], "Mudanca": mudanca}
+    for c, (v_de, v_para) in valores.items():
+        out[f"{c}_de"] = v_de[idx]
+        out[f"{c}_para"] = v_para[idx]
+        out[f"{c}_delta"] = np.nan_to_num(v_para[idx]) - np.nan_to_num(v_de[idx])
+    df = pd.DataFrame(out)
+    if colunas and len(df):
+        ordem = np.argsort(-np.abs(df[f"{colunas[0]}_delta"].to_numpy()), kind="stable")
+        df = df.iloc[ordem].reset_index(drop=True)
+    return df
+
+
+def diff_snapshots(run_de: str, run_para: str, colunas: Sequence[str] = COLUNAS_DIFF,
+                   hist_dir: str = HIST_DIR) -> Optional[pd.DataFrame]:
+    """diff_resultados entre dois snapshots (lê só SKU + `colunas`); None se algum não existe."""
+    de = ler_snapshot(run_de, ["SKU", *colunas], hist_dir)
+    para = ler_snapshot(run_para, ["SKU", *colunas], hist_dir)
+    if de is None or para is None:
+        return None
+    return diff_resultados(de, para, colunas)
+
+
+def resumo_diff(diff: pd.DataFrame) -> Dict[str, int]:
+    """Contagem de linhas por tipo de mudança."""
+    cont = diff["Mudanca"].value_counts()
+    return {m: int(cont.get(m, 0)) for m in (MUDANCA_NOVO, MUDANCA_REMOVIDO, MUDANCA_ALTERADO)}
@@ -0,0 +1,313 @@
+# v4_api/jobs_compras.py
+# Fila de cálculos em segundo plano: pool de processos + resultados em SQLite.
+# O Padrão não viaja com cada job: a API publica as tabelas em Parquet (uma vez
+# por versão) e o processo filho lê do disco e guarda em memória até a versão mudar.
+
+import json
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+import datetime as dt
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from v4_api import historico_compras
+from v4_api.engine_compras import (
+    KitExplosionIndex, PadraoPreparado, aplicar_parametros, etapas_ms, preparar_base_calculo,
+)
+
+
+# ===================== CONFIG =====================
+# Banco próprio ao lado do controle_ocs.db (resultados são transitórios e
+# grandes; não disputam trava com as ordens de compra).
+RAIZ_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(RAIZ_DIR, "jobs_compras.db"))
+JOBS_TTL_S = 6 * 3600   # resultado (ou job travado) some após 6h
+JOBS_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+# Padrão publicado para os processos filhos: {versao}_{tabela}.parquet
+JOBS_PADRAO_DIR = os.environ.get("JOBS_PADRAO_DIR", os.path.join(RAIZ_DIR, "jobs_padrao"))
+_TABELAS_PADRAO = ("catalogo", "kits", "kits_efetivo")
+
+STATUS_PENDENTE = "pendente"
+STATUS_EXECUTANDO = "executando"
+STATUS_OK = "ok"
+STATUS_ERRO = "erro"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs_compras (
+    JOB_ID        TEXT PRIMARY KEY,
+    TIPO          TEXT,
+    STATUS        TEXT,
+    VERSAO_PADRAO TEXT,
+    CRIADO_EM     REAL,
+    ATUALIZADO_EM REAL,
+    EXPIRA_EM     REAL,
+    ERRO          TEXT,
+    LINHAS        INTEGER,
+    PAINEL_JSON   TEXT,
+    RESULTADO     BLOB,
+    SNAPSHOTS_JSON TEXT
+)
+"""
+
+
+# ===================== SQLITE =====================
+def _conectar(db_path: str) -> sqlite3.Connection:
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(_SCHEMA)
+    colunas = {r[1] for r in con.execute("PRAGMA table_info(jobs_compras)")}
+    if "SNAPSHOTS_JSON" not in colunas:  # banco criado antes do histórico nos jobs
+        con.execute("ALTER TABLE jobs_compras ADD COLUMN SNAPSHOTS_JSON TEXT")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_jobs_expira ON jobs_compras (EXPIRA_EM)")
+    return con
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return dt.datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+
+def limpar_expirados(db_path: str = JOBS_DB_PATH) -> int:
+    """Apaga jobs com TTL vencido; retorna quantos saíram."""
+    con = _conectar(db_path)
+    try:
+        with con:
+            cur = con.execute("DELETE FROM jobs_compras WHERE EXPIRA_EM < ?", (time.time(),))
+        return cur.rowcount
+    finally:
+        con.close()
+
+
+def _criar_job(db_path: str, tipo: str, versao_padrao: str) -> str:
+    job_id = uuid.uuid4().hex
+    agora = time.time()
+    con = _conectar(db_path)
+    try:
+        with con:
+            con.execute("DELETE FROM jobs_compras WHERE EXPIRA_EM < ?", (agora,))
+            con.execute(
+                "INSERT INTO jobs_compras (JOB_ID, TIPO, STATUS, VERSAO_PADRAO, CRIADO_EM, ATUALIZADO_EM, EXPIRA_EM) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, tipo, STATUS_PENDENTE, versao_padrao, agora, agora, agora + JOBS_TTL_S),
+            )
+    finally:
+        con.close()
+    return job_id
+
+
+def _atualizar(db_path: str, job_id: str, status: str, erro: Optional[str] = None,
+               painel: Optional[Dict] = None, resultado: Optional[pd.DataFrame] = None,
+               snapshots: Optional[Dict[str, str]] = None):
+    agora = time.time()
+    blob = None
+    linhas = None
+    if resultado is not None:
+        blob = zlib.compress(pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        linhas = int(len(resultado))
+    con = _conectar(db_path)
+    try:
+        with con:
+            con.execute(
+                "UPDATE jobs_compras SET STATUS = ?, ATUALIZADO_EM = ?, EXPIRA_EM = ?, ERRO = ?, "
+                "LINHAS = COALESCE(?, LINHAS), PAINEL_JSON = COALESCE(?, PAINEL_JSON), "
+                "RESULTADO = COALESCE(?, RESULTADO), SNAPSHOTS_JSON = COALESCE(?, SNAPSHOTS_JSON) "
+                "WHERE JOB_ID = ?",
+                (status, agora, agora + JOBS_TTL_S, erro, linhas,
+                 json.dumps(painel) if painel is not None else None, blob,
+                 json.dumps(snapshots) if snapshots is not None else None, job_id),
+            )
+    finally:
+        con.close()
+
+
+def status_job(job_id: str, db_path: str = JOBS_DB_PATH) -> Optional[Dict]:
+    """Metadados do job (sem o resultado); None se não existe ou expirou."""
+    con = _conectar(db_path)
+    try:
+        row = con.execute(
+            "SELECT JOB_ID, TIPO, STATUS, VERSAO_PADRAO, CRIADO_EM, ATUALIZADO_EM, EXPIRA_EM, ERRO, LINHAS, "
+            "SNAPSHOTS_JSON FROM jobs_compras WHERE JOB_ID = ? AND EXPIRA_EM >= ?",
+            (job_id, time.time()),
+        ).fetchone()
+    finally:
+        con.close()
+    if row is None:
+        return None
+    return {
+        "job_id": row[0],
+        "tipo": row[1],
+        "status": row[2],
+        "versao_padrao": row[3],
+        "criado_em": _iso(row[4]),
+        "atualizado_em": _iso(row[5]),
+        "expira_em": _iso(row[6]),
+        "erro": row[7],
+        "linhas": row[8],
+        "snapshots": json.loads(row[9]) if row[9] else None,
+    }
+
+
+def resultado_job(job_id: str, db_path: str = JOBS_DB_PATH) -> Optional[Tuple[pd.DataFrame, Dict]]:
+    """(df_final, painel) de um job concluído; None se não existe, expirou ou ainda não terminou."""
+    con = _conectar(db_path)
+    try:
+        row = con.execute(
+            "SELECT PAINEL_JSON, RESULTADO FROM jobs_compras WHERE JOB_ID = ? AND STATUS = ? AND EXPIRA_EM >= ?",
+            (job_id, STATUS_OK, time.time()),
+        ).fetchone()
+    finally:
+        con.close()
+    if row is None:
+        return None
+    return pickle.loads(zlib.decompress(row[1])), json.loads(row[0])
+
+
+# ===================== PADRÃO PUBLICADO EM DISCO =====================
+def _arquivo_padrao(padrao_dir: str, versao: str, tabela: str) -> str:
+    return os.path.join(padrao_dir, f"{versao}_{tabela}.parquet")
+
+
+def publicar_padrao(padrao: PadraoPreparado, padrao_dir: str = JOBS_PADRAO_DIR):
+    """
+    Grava catálogo, kits e kits efetivos da versão em Parquet (só se ainda não
+    estão lá; escrita atômica). Versões antigas saem depois do TTL dos jobs.
+    """
+    if all(os.path.exists(_arquivo_padrao(padrao_dir, padrao.versao, t)) for t in _TABELAS_PADRAO):
+        return
+    os.makedirs(padrao_dir, exist_ok=True)
+    for tabela, df in zip(_TABELAS_PADRAO, (padrao.catalogo_df, padrao.kits_df, padrao.kits_efetivo)):
+        destino = _arquivo_padrao(padrao_dir, padrao.versao, tabela)
+        tmp = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, destino)
+    limite = time.time() - JOBS_TTL_S
+    for nome in os.listdir(padrao_dir):
+        caminho = os.path.join(padrao_dir, nome)
+        if not nome.startswith(padrao.versao + "_") and os.path.getmtime(caminho) < limite:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+
+# Padrão do processo filho: carregado do disco na 1ª vez e mantido até a versão mudar
+_PADRAO_FILHO: Optional[PadraoPreparado] = None
+
+
+def _padrao_do_disco(versao: str, padrao_dir: str) -> PadraoPreparado:
+    global _PADRAO_FILHO
+    if _PADRAO_FILHO is None or _PADRAO_FILHO.versao != versao:
+        cat, kits, efetivo = (pd.read_parquet(_arquivo_padrao(padrao_dir, versao, t)) for t in _TABELAS_PADRAO)
+        _PADRAO_FILHO = PadraoPreparado(
+            versao=versao,
+            catalogo_df=cat,
+            kits_df=kits,
+            kits_efetivo=efetivo,
+            kidx=KitExplosionIndex.de_kits(efetivo, skus_extra=cat["component_sku"]),
+            ciclos_kits=[],
+        )
+    return _PADRAO_FILHO
+
+
+# ===================== EXECUÇÃO (PROCESSO FILHO) =====================
+def _executar_calculo(db_path: str, job_id: str, versao_padrao: str, padrao_dir: str,
+                      full_df: pd.DataFrame, fisico_df: pd.DataFrame, vendas_df: pd.DataFrame,
+                      h: int, g: float, LT: int, por_empresa: bool,
+                      ocs_abertas: Optional[pd.DataFrame] = None, medir_etapas: bool = False,
+                      historico: Optional[Dict[str, Any]] = None, engine: str = "pandas"):
+    _atualizar(db_path, job_id, STATUS_EXECUTANDO)
+    etapas: Optional[Dict[str, float]] = {} if medir_etapas else None
+    try:
+        padrao = _padrao_do_disco(versao_padrao, padrao_dir)
+    except (OSError, ValueError) as e:
+        _atualizar(db_path, job_id, STATUS_ERRO, erro=f"Padrão {versao_padrao} indisponível para o job: {e}")
+        return
+    try:
+        prep = preparar_base_calculo(
+            full_df, fisico_df, vendas_df,
+            padrao.catalogo_df, padrao.kits_df,
+            kidx=padrao.kidx, chave=(historico or {}).get("chave_entradas", ""),
+            por_empresa=por_empresa, etapas=etapas, engine=engine, ocs_abertas=ocs_abertas,
+        )
+        df_final, painel = aplicar_parametros(prep, h=h, g=g, LT=LT, etapas=etapas)
+    except Exception as e:
+        _atualizar(db_path, job_id, STATUS_ERRO, erro=f"Falha no cálculo: {e}")
+        return
+    if etapas is not None:
+        painel = {**painel, "etapas_ms": etapas_ms(etapas)}
+
+    snapshots = None
+    if historico is not None:
+        try:
+            snapshots = historico_compras.gravar_resultado(
+                df_final, por_empresa, historico.get("empresa"), h, g, LT,
+                versao_padrao=padrao.versao, chave_entradas=prep.chave,
+                extra={"origem": "job", "ocs_abertas": ocs_abertas is not None},
+            )
+        except Exception as e:
+            _atualizar(db_path, job_id, STATUS_ERRO, erro=f"Falha ao gravar o histórico: {e}")
+            return
+    _atualizar(db_path, job_id, STATUS_OK, painel=painel, resultado=df_final, snapshots=snapshots)
+
+
+# ===================== POOL =====================
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # spawn: o servidor tem threads (threadpool do FastAPI); fork com threads não é seguro
+            _POOL = ProcessPoolExecutor(
+                max_workers=JOBS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _POOL
+
+
+def encerrar_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+
+
+def submeter_calculo(padrao: PadraoPreparado, full_df: pd.DataFrame, fisico_df: pd.DataFrame,
+                     vendas_df: pd.DataFrame, h: int, g: float, LT: int,
+                     por_empresa: bool = False, ocs_abertas: Optional[pd.DataFrame] = None,
+                     medir_etapas: bool = False, historico: Optional[Dict[str, Any]] = None,
+                     engine: str = "pandas", db_path: str = JOBS_DB_PATH,
+                     padrao_dir: str = JOBS_PADRAO_DIR) -> str:
+    """
+    Registra o job e o envia ao pool; retorna o job_id na hora.
+    Ao processo filho vai só a versão do Padrão (publicar_padrao garante os
+    Parquet dela em `padrao_dir`), não o catálogo/kits/índice.
+    `historico` ({"empresa", "chave_entradas"}) grava snapshots do resultado,
+    e os run_ids ficam em status_job(...)["snapshots"].
+    """
+    publicar_padrao(padrao, padrao_dir)
+    tipo = "calcular-compra/empresas" if por_empresa else "calcular-compra"
+    job_id = _criar_job(db_path, tipo, padrao.versao)
+    fut = _pool().submit(
+        _executar_calculo, db_path, job_id, padrao.versao, padrao_dir, full_df, fisico_df, vendas_df,
+        h, g, LT, por_empresa, ocs_abertas, medir_etapas, historico, engine,
+    )
+
+    def _falha_no_pool(f: Future):
+        # erros do cálculo já ficam no banco; aqui só sobra falha do próprio pool
+        # (processo morto, pickle...) ou cancelamento no desligamento
+        erro = "Job cancelado." if f.cancelled() else f.exception()
+        if erro is not None:
+            _atualizar(db_path, job_id, STATUS_ERRO, erro=f"Falha ao executar o job: {erro}")
+
+    fut.add_done_callback(_falha_no_pool)
+    return job_id
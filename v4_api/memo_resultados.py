@@ -0,0 +1,103 @@
+# v4_api/memo_resultados.py
+# Memo de resultados do processo, compartilhado entre sessões: quem pede o
+# mesmo cálculo (mesmos uploads, Padrão, OCs e h/g/LT) recebe o que outra
+# sessão já calculou. LRU com orçamento de memória (bytes estimados dos
+# DataFrames/arrays guardados) e contadores de acerto/erro/descarte.
+#
+# Os valores são compartilhados: quem lê não pode alterá-los no lugar
+# (copie antes, como os filtros da tela já fazem).
+
+import dataclasses
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+# ===================== CONFIG =====================
+MEMO_MAX_BYTES = int(float(os.environ.get("MEMO_RESULTADOS_MB", "512")) * 1024 * 1024)
+
+
+def tamanho_aprox(obj: Any, _vistos: Optional[set] = None) -> int:
+    """Bytes aproximados de DataFrames/Series/arrays (inclusive dentro de dicts, listas e dataclasses)."""
+    vistos = set() if _vistos is None else _vistos
+    if id(obj) in vistos:
+        return 0
+    vistos.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(tamanho_aprox(k, vistos) + tamanho_aprox(v, vistos) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(tamanho_aprox(v, vistos) for v in obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return sum(tamanho_aprox(getattr(obj, f.name), vistos) for f in dataclasses.fields(obj))
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return sys.getsizeof(obj) + tamanho_aprox(vars(obj), vistos)
+    return sys.getsizeof(obj)
+
+
+class MemoResultados:
+    def __init__(self, max_bytes: int = MEMO_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._itens: "OrderedDict[Hashable, tuple]" = OrderedDict()  # chave -> (valor, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.erros = 0
+        self.descartes = 0
+
+    def obter(self, chave: Hashable) -> Optional[Any]:
+        """Valor guardado (e marca como recente), ou None."""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.erros += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item[0]
+
+    def guardar(self, chave: Hashable, valor: Any, nbytes: Optional[int] = None):
+        """
+        Guarda `valor` e descarta os menos usados até caber no orçamento.
+        Valor maior que o orçamento inteiro não é guardado.
+        """
+        nbytes = tamanho_aprox(valor) if nbytes is None else int(nbytes)
+        with self._lock:
+            antigo = self._itens.pop(chave, None)
+            if antigo is not None:
+                self._bytes -= antigo[1]
+            if nbytes > self.max_bytes:
+                return
+            self._itens[chave] = (valor, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, b) = self._itens.popitem(last=False)
+                self._bytes -= b
+                self.descartes += 1
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def estatisticas(self) -> Dict[str, float]:
+        with self._lock:
+            consultas = self.acertos + self.erros
+            return {
+                "entradas": len(self._itens),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "acertos": self.acertos,
+                "erros": self.erros,
+                "descartes": self.descartes,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            }
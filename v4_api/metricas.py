@@ -0,0 +1,108 @@
+# v4_api/metricas.py
+# Métricas da API em formato texto do Prometheus (sem dependências externas).
+#
+# Opt-in com API_METRICAS=1. Desligadas (padrão), o middleware nem é
+# registrado e o motor não cronometra etapas: o custo fica em alguns "if".
+
+import os
+import threading
+from typing import Dict, Sequence, Tuple
+
+ATIVAS = os.environ.get("API_METRICAS", "0") == "1"
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_BYTES = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+BUCKETS_LINHAS = (10, 100, 1e3, 1e4, 5e4, 1e5, 5e5, 1e6)
+
+_LOCK = threading.Lock()
+
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(nomes: Sequence[str], valores: Tuple[str, ...], extra: str = "") -> str:
+    pares = [f'{n}="{_esc(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Contador:
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *valores: str, n: float = 1.0):
+        with _LOCK:
+            self._valores[valores] = self._valores.get(valores, 0.0) + n
+
+    def exportar(self) -> str:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        for chave, v in sorted(self._valores.items()):
+            linhas.append(f"{self.nome}{_rotulos(self.rotulos, chave)} {v:g}")
+        return "\n".join(linhas)
+
+
+class Histograma:
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (), buckets=BUCKETS_SEGUNDOS):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}  # chave -> [contagens por bucket..., soma, total]
+
+    def observar(self, valor: float, *valores: str):
+        with _LOCK:
+            s = self._series.get(valores)
+            if s is None:
+                s = self._series[valores] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    s[i] += 1
+            s[-2] += valor
+            s[-1] += 1
+
+    def exportar(self) -> str:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        for chave, s in sorted(self._series.items()):
+            for limite, c in zip(self.buckets, s):
+                le = 'le="%g"' % limite
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {c}")
+            le = 'le="+Inf"'
+            linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {s[-1]}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {s[-2]:g}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {s[-1]}")
+        return "\n".join(linhas)
+
+
+# ===================== MÉTRICAS DA API =====================
+REQ_DURACAO = Histograma(
+    "reposicao_http_request_duration_seconds", "Latência das requisições HTTP.",
+    ["metodo", "rota", "status"],
+)
+REQ_BYTES = Histograma(
+    "reposicao_http_request_size_bytes", "Tamanho do corpo das requisições (Content-Length).",
+    ["rota"], buckets=BUCKETS_BYTES,
+)
+PAYLOAD_LINHAS = Histograma(
+    "reposicao_payload_linhas", "Linhas por bloco do payload de cálculo.",
+    ["bloco"], buckets=BUCKETS_LINHAS,
+)
+ETAPA_DURACAO = Histograma(
+    "reposicao_etapa_duration_seconds", "Duração de cada etapa do motor de cálculo.",
+    ["etapa"],
+)
+CACHE = Contador(
+    "reposicao_cache_total", "Consultas a caches da API, por resultado (hit/miss).",
+    ["cache", "resultado"],
+)
+
+TODAS = [REQ_DURACAO, REQ_BYTES, PAYLOAD_LINHAS, ETAPA_DURACAO, CACHE]
+
+
+def registrar_etapas(etapas: Dict[str, float]):
+    for nome, seg in etapas.items():
+        ETAPA_DURACAO.observar(seg, nome)
+
+
+def exportar() -> str:
+    return "\n".join(m.exportar() for m in TODAS) + "\n"
@@ -0,0 +1,466 @@
+# v4_api/ocs_compras.py
+# Ordens de compra (controle_ocs.db): cabeçalho em ordens_compra e itens
+# normalizados em ordens_compra_itens (uma linha por item da OC; um SKU pode repetir).
+#
+# ocs_em_aberto guarda a quantidade ainda não recebida por (empresa, SKU),
+# mantida por triggers a cada insert/update/delete de OC ou item: o cálculo
+# lê esse resumo pronto (alimenta o Em_Transito) sem varrer o histórico.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import datetime as dt
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+
+# ===================== CONFIG =====================
+RAIZ_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OCS_DB_PATH = os.environ.get("OCS_DB_PATH", os.path.join(RAIZ_DIR, "controle_ocs.db"))
+
+STATUS_ABERTA = "ABERTA"
+STATUS_RECEBIDA = "RECEBIDA"
+STATUS_CANCELADA = "CANCELADA"
+STATUS_FECHADOS = (STATUS_RECEBIDA, STATUS_CANCELADA)
+
+# PRAGMA user_version: 1 = itens normalizados (ITENS_JSON migrado); 2 = resumo ocs_em_aberto
+SCHEMA_VERSAO = 2
+
+# Quantidade em aberto de um item (i) da OC (o); OC recebida/cancelada => 0
+_ABERTA = ("CASE WHEN {o}STATUS IN ('RECEBIDA', 'CANCELADA') THEN 0 "
+           "ELSE MAX({i}QTD - {i}QTD_RECEBIDA, 0) END")
+
+
+def _somar(sinal: str, item: str) -> str:
+    """Upsert que soma (sinal '+') ou tira ('-') a quantidade em aberto do item `item` (NEW/OLD)."""
+    return f"""
+        INSERT INTO ocs_em_aberto (EMPRESA, SKU, QTD_ABERTA)
+        SELECT COALESCE(o.EMPRESA, ''), {item}.SKU, {sinal}{_ABERTA.format(o="o.", i=item + ".")}
+        FROM ordens_compra o WHERE o.OC_ID = {item}.OC_ID
+        ON CONFLICT (EMPRESA, SKU) DO UPDATE SET QTD_ABERTA = QTD_ABERTA + excluded.QTD_ABERTA;
+    """
+
+
+def _somar_oc(sinal: str, oc: str) -> str:
+    """Idem para todos os itens da OC `oc` (NEW/OLD do cabeçalho)."""
+    return f"""
+        INSERT INTO ocs_em_aberto (EMPRESA, SKU, QTD_ABERTA)
+        SELECT COALESCE({oc}.EMPRESA, ''), i.SKU, {sinal}SUM({_ABERTA.format(o=oc + ".", i="i.")})
+        FROM ordens_compra_itens i WHERE i.OC_ID = {oc}.OC_ID GROUP BY i.SKU
+        ON CONFLICT (EMPRESA, SKU) DO UPDATE SET QTD_ABERTA = QTD_ABERTA + excluded.QTD_ABERTA;
+    """
+
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS ordens_compra (
+        OC_ID TEXT PRIMARY KEY,
+        EMPRESA TEXT,
+        FORNECEDOR TEXT,
+        DATA_OC TEXT,
+        DATA_PREVISTA TEXT,
+        CONDICAO_PGTO TEXT,
+        VALOR_TOTAL_R NUMERIC,
+        STATUS TEXT,
+        ITENS_JSON TEXT,
+        ITENS_COUNT INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ordens_compra_itens (
+        OC_ID        TEXT NOT NULL REFERENCES ordens_compra (OC_ID) ON DELETE CASCADE,
+        ITEM         INTEGER NOT NULL,
+        SKU          TEXT NOT NULL,
+        QTD          INTEGER NOT NULL,
+        PRECO        REAL,
+        QTD_RECEBIDA INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (OC_ID, ITEM)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ocs_em_aberto (
+        EMPRESA    TEXT NOT NULL,
+        SKU        TEXT NOT NULL,
+        QTD_ABERTA INTEGER NOT NULL,
+        PRIMARY KEY (EMPRESA, SKU)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_oc_itens_sku ON ordens_compra_itens (SKU)",
+    "CREATE INDEX IF NOT EXISTS idx_oc_fornecedor ON ordens_compra (FORNECEDOR)",
+    "CREATE INDEX IF NOT EXISTS idx_oc_status ON ordens_compra (STATUS)",
+    "CREATE INDEX IF NOT EXISTS idx_oc_data_prevista ON ordens_compra (DATA_PREVISTA)",
+    # --- resumo ocs_em_aberto (incremental) ---
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_oc_itens_ins AFTER INSERT ON ordens_compra_itens
+    BEGIN {_somar("+", "NEW")} END
+    """,
+    # item apagado junto com a OC (cascade): o cabeçalho já saiu e o upsert não acha nada;
+    # a baixa foi feita antes, em trg_oc_del
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_oc_itens_del AFTER DELETE ON ordens_compra_itens
+    BEGIN {_somar("-", "OLD")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_oc_itens_upd
+    AFTER UPDATE OF OC_ID, SKU, QTD, QTD_RECEBIDA ON ordens_compra_itens
+    BEGIN {_somar("-", "OLD")} {_somar("+", "NEW")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_oc_del BEFORE DELETE ON ordens_compra
+    BEGIN {_somar_oc("-", "OLD")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_oc_upd AFTER UPDATE OF EMPRESA, STATUS ON ordens_compra
+    BEGIN {_somar_oc("-", "OLD")} {_somar_oc("+", "NEW")} END
+    """,
+    # linha zerada sai do resumo (fica só o que está de fato em aberto)
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_ocs_em_aberto_zero AFTER UPDATE OF QTD_ABERTA ON ocs_em_aberto
+    WHEN NEW.QTD_ABERTA = 0
+    BEGIN DELETE FROM ocs_em_aberto WHERE EMPRESA = NEW.EMPRESA AND SKU = NEW.SKU; END
+    """,
+]
+
+# Colunas do cabeçalho, na ordem do INSERT
+COLUNAS_OC = ["OC_ID", "EMPRESA", "FORNECEDOR", "DATA_OC", "DATA_PREVISTA",
+              "CONDICAO_PGTO", "VALOR_TOTAL_R", "STATUS", "ITENS_COUNT"]
+
+# Nomes aceitos nos itens de ITENS_JSON (gravados pelo app/planilhas antigas)
+_CHAVES_JSON = {
+    "SKU": ["SKU", "sku", "Sku"],
+    "QTD": ["Qtd_Ajustada", "QTD", "Qtd", "Quantidade", "qty", "Qtd_Sugerida"],
+    "PRECO": ["Preco_Custo", "PRECO", "Preco", "preco"],
+    "QTD_RECEBIDA": ["Qtd_Recebida", "QTD_RECEBIDA", "Recebido"],
+}
+
+
+# ===================== SQLITE =====================
+# Bancos (caminho absoluto) cujo schema/migrações já foram garantidos neste processo
+_SCHEMA_PRONTO: set = set()
+_SCHEMA_LOCK = threading.Lock()
+
+
+def conectar(db_path: str = OCS_DB_PATH) -> sqlite3.Connection:
+    """
+    Abre o banco com foreign_keys ligado. Na primeira abertura de cada arquivo
+    no processo (ou se ele sumiu do disco), liga o WAL, garante
+    tabelas/índices/triggers e aplica as migrações pendentes; depois só conecta.
+    """
+    chave = os.path.abspath(db_path)
+    if chave in _SCHEMA_PRONTO and os.path.exists(chave):
+        con = sqlite3.connect(db_path, timeout=30)
+        con.execute("PRAGMA foreign_keys=ON")
+        return con
+    with _SCHEMA_LOCK:
+        con = sqlite3.connect(db_path, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA foreign_keys=ON")
+        with con:
+            for ddl in _SCHEMA:
+                con.execute(ddl)
+        versao = con.execute("PRAGMA user_version").fetchone()[0]
+        if versao < 1:
+            migrar_itens_json(con)
+        if versao < 2:
+            recalcular_em_aberto(con)
+        if db_path != ":memory:":
+            _SCHEMA_PRONTO.add(chave)
+    return con
+
+
+def _valor(d: dict, campo: str, padrao=None):
+    for k in _CHAVES_JSON[campo]:
+        if d.get(k) is not None:
+            return d[k]
+    return padrao
+
+
+def _itens_de_json(texto: Optional[str]) -> List[Dict]:
+    try:
+        itens = json.loads(texto) if texto else []
+    except ValueError:
+        return []
+    if isinstance(itens, dict):  # formato colunar {coluna: [valores]}
+        itens = pd.DataFrame(itens).to_dict("records")
+    out = []
+    for d in itens if isinstance(itens, list) else []:
+        if not isinstance(d, dict) or _valor(d, "SKU") is None:
+            continue
+        out.append({
+            "SKU": str(_valor(d, "SKU")),
+            "QTD": int(float(_valor(d, "QTD", 0) or 0)),
+            "PRECO": float(_valor(d, "PRECO", 0.0) or 0.0),
+            "QTD_RECEBIDA": int(float(_valor(d, "QTD_RECEBIDA", 0) or 0)),
+        })
+    return out
+
+
+def migrar_itens_json(con: sqlite3.Connection) -> int:
+    """
+    Importa os itens de ITENS_JSON das OCs que ainda não têm linhas em
+    ordens_compra_itens (uma transação) e marca o schema como migrado.
+    Retorna quantos itens entraram. ITENS_JSON fica como estava.
+    """
+    linhas = con.execute(
+        "SELECT OC_ID, ITENS_JSON FROM ordens_compra o WHERE ITENS_JSON IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM ordens_compra_itens i WHERE i.OC_ID = o.OC_ID)"
+    ).fetchall()
+    registros = [
+        (oc_id, n, it["SKU"], it["QTD"], it["PRECO"], it["QTD_RECEBIDA"])
+        for oc_id, texto in linhas
+        for n, it in enumerate(_itens_de_json(texto), start=1)
+    ]
+    with con:
+        con.executemany(
+            "INSERT INTO ordens_compra_itens (OC_ID, ITEM, SKU, QTD, PRECO, QTD_RECEBIDA) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            registros,
+        )
+        con.execute("PRAGMA user_version = 1")
+    return len(registros)
+
+
+def recalcular_em_aberto(con: sqlite3.Connection) -> int:
+    """
+    Refaz ocs_em_aberto do zero a partir dos itens (migração, ou reparo se o
+    resumo tiver sido mexido por fora). Retorna nº de linhas (empresa, SKU).
+    """
+    with con:
+        con.execute("DELETE FROM ocs_em_aberto")
+        con.execute(
+            "INSERT INTO ocs_em_aberto (EMPRESA, SKU, QTD_ABERTA) "
+            f"SELECT COALESCE(o.EMPRESA, ''), i.SKU, SUM({_ABERTA.format(o='o.', i='i.')}) AS Q "
+            "FROM ordens_compra_itens i JOIN ordens_compra o ON o.OC_ID = i.OC_ID "
+            "GROUP BY 1, 2 HAVING Q > 0"
+        )
+        con.execute(f"PRAGMA user_version = {SCHEMA_VERSAO}")
+    return con.execute("SELECT COUNT(*) FROM ocs_em_aberto").fetchone()[0]
+
+
+# ===================== GRAVAÇÃO EM LOTE =====================
+def gravar_ocs(ocs: Sequence[Dict], itens: pd.DataFrame, db_path: str = OCS_DB_PATH,
+               so_abertas: bool = False) -> int:
+    """
+    Grava (ou substitui) várias OCs de uma vez, numa única transação.
+
+      ocs:   dicts com as chaves de COLUNAS_OC (OC_ID obrigatório; VALOR_TOTAL_R
+             e ITENS_COUNT saem dos itens quando ausentes)
+      itens: DataFrame OC_ID, SKU, QTD, PRECO [, QTD_RECEBIDA]
+      so_abertas: só substitui OC existente que ainda está ABERTA e sem nada
+             recebido; senão ValueError e nada é gravado.
+
+    Itens antigos das OCs regravadas são apagados antes. Retorna nº de itens gravados.
+    """
+    itens = itens.copy()
+    if "QTD_RECEBIDA" not in itens.columns:
+        itens["QTD_RECEBIDA"] = 0
+    itens["QTD"] = itens["QTD"].astype(int)
+    itens["PRECO"] = itens["PRECO"].astype(float)
+    itens["QTD_RECEBIDA"] = itens["QTD_RECEBIDA"].astype(int)
+    itens["ITEM"] = itens.groupby("OC_ID").cumcount() + 1
+
+    totais = (itens["QTD"] * itens["PRECO"]).groupby(itens["OC_ID"]).sum().round(2)
+    contagem = itens.groupby("OC_ID").size()
+    cabecalhos = []
+    for oc in ocs:
+        oc_id = oc["OC_ID"]
+        linha = {c: oc.get(c) for c in COLUNAS_OC}
+        linha["STATUS"] = linha["STATUS"] or STATUS_ABERTA
+        linha["DATA_OC"] = linha["DATA_OC"] or dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if linha["VALOR_TOTAL_R"] is None:
+            linha["VALOR_TOTAL_R"] = float(totais.get(oc_id, 0.0))
+        if linha["ITENS_COUNT"] is None:
+            linha["ITENS_COUNT"] = int(contagem.get(oc_id, 0))
+        cabecalhos.append(tuple(linha[c] for c in COLUNAS_OC))
+
+    registros = list(itens[["OC_ID", "ITEM", "SKU", "QTD", "PRECO", "QTD_RECEBIDA"]]
+                     .itertuples(index=False, name=None))
+    con = conectar(db_path)
+    try:
+        with con:
+            if so_abertas:
+                _recusar_oc_processada(con, [c[0] for c in cabecalhos])
+            con.executemany("DELETE FROM ordens_compra_itens WHERE OC_ID = ?", [(c[0],) for c in cabecalhos])
+            # upsert (não REPLACE): a troca de STATUS/EMPRESA passa pelo trigger de update
+            con.executemany(
+                f"INSERT INTO ordens_compra ({', '.join(COLUNAS_OC)}) "
+                f"VALUES ({', '.join('?' * len(COLUNAS_OC))}) ON CONFLICT (OC_ID) DO UPDATE SET "
+                + ", ".join(f"{c} = excluded.{c}" for c in COLUNAS_OC[1:]),
+                cabecalhos,
+            )
+            con.executemany(
+                "INSERT INTO ordens_compra_itens (OC_ID, ITEM, SKU, QTD, PRECO, QTD_RECEBIDA) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                registros,
+            )
+    finally:
+        con.close()
+    return len(registros)
+
+
+def _recusar_oc_processada(con: sqlite3.Connection, oc_ids: Sequence[str]):
+    """ValueError se alguma das OCs já existe e não está mais ABERTA (ou já teve recebimento)."""
+    if not oc_ids:
+        return
+    marcas = ", ".join("?" * len(oc_ids))
+    travadas = con.execute(
+        f"SELECT o.OC_ID, COALESCE(o.STATUS, ?) FROM ordens_compra o WHERE o.OC_ID IN ({marcas}) "
+        "AND (COALESCE(o.STATUS, ?) <> ? OR EXISTS (SELECT 1 FROM ordens_compra_itens i "
+        "                                            WHERE i.OC_ID = o.OC_ID AND i.QTD_RECEBIDA > 0))",
+        (STATUS_ABERTA, *oc_ids, STATUS_ABERTA, STATUS_ABERTA),
+    ).fetchall()
+    if travadas:
+        desc = ", ".join(f"{oc_id} ({status})" for oc_id, status in travadas)
+        raise ValueError(f"OC já existe e não pode ser regravada: {desc}. Use outro número.")
+
+
+def numero_oc_do_carrinho(carrinho: pd.DataFrame) -> str:
+    """
+    Número estável para o carrinho sem número: hash de empresa/SKU/quantidade.
+    Exportar o mesmo carrinho de novo regrava a mesma OC em vez de criar outra.
+    """
+    chave = sorted(
+        zip(carrinho["Empresa"].astype(str), carrinho["SKU"].astype(str),
+            pd.to_numeric(carrinho["Qtd_Ajustada"], errors="coerce").fillna(0).astype(int))
+    )
+    return "OC-" + hashlib.sha1(repr(chave).encode("utf-8")).hexdigest()[:10].upper()
+
+
+def gravar_oc_do_carrinho(carrinho: pd.DataFrame, oc_numero: str = "", fornecedor: str = "",
+                          data_prevista: Optional[str] = None, condicao_pgto: str = "",
+                          db_path: str = OCS_DB_PATH) -> List[str]:
+    """
+    Persiste o carrinho da aba "Pedido de Compra" (Empresa, SKU, Fornecedor,
+    Preco_Custo, Qtd_Ajustada). Uma OC por empresa; com mais de uma empresa
+    no carrinho o número ganha o sufixo "-EMPRESA". Retorna os OC_IDs.
+
+    Sem número, usa numero_oc_do_carrinho (reexportar não duplica a OC).
+    OC já recebida/cancelada (ou com recebimento) nunca é sobrescrita: ValueError.
+    """
+    numero = oc_numero.strip() or numero_oc_do_carrinho(carrinho)
+    empresas = list(pd.unique(carrinho["Empresa"]))
+    ocs = []
+    partes = []
+    for emp in empresas:
+        oc_id = numero if len(empresas) == 1 else f"{numero}-{emp}"
+        bloco = carrinho[carrinho["Empresa"] == emp]
+        ocs.append({
+            "OC_ID": oc_id,
+            "EMPRESA": emp,
+            "FORNECEDOR": fornecedor or (bloco["Fornecedor"].iloc[0] if len(bloco) else ""),
+            "DATA_PREVISTA": data_prevista,
+            "CONDICAO_PGTO": condicao_pgto,
+        })
+        partes.append(pd.DataFrame({
+            "OC_ID": oc_id,
+            "SKU": bloco["SKU"].astype(str).to_numpy(),
+            "QTD": bloco["Qtd_Ajustada"].to_numpy(),
+            "PRECO": bloco["Preco_Custo"].to_numpy(),
+        }))
+    itens = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=["OC_ID", "SKU", "QTD", "PRECO"])
+    gravar_ocs(ocs, itens, db_path=db_path, so_abertas=True)
+    return [oc["OC_ID"] for oc in ocs]
+
+
+# ===================== CONSULTAS =====================
+def itens_em_aberto(sku: Optional[str] = None, empresa: Optional[str] = None,
+                    db_path: str = OCS_DB_PATH) -> pd.DataFrame:
+    """Itens ainda não recebidos de OCs abertas (QTD_ABERTA = QTD - QTD_RECEBIDA > 0)."""
+    filtros, params = ["COALESCE(o.STATUS, '') NOT IN (?, ?)", "i.QTD > i.QTD_RECEBIDA"], list(STATUS_FECHADOS)
+    if sku is not None:
+        filtros.append("i.SKU = ?")
+        params.append(sku)
+    if empresa is not None:
+        filtros.append("o.EMPRESA = ?")
+        params.append(empresa)
+    con = conectar(db_path)
+    try:
+        return pd.read_sql_query(
+            "SELECT o.OC_ID, o.EMPRESA, o.FORNECEDOR, o.DATA_PREVISTA, o.STATUS, i.SKU, i.QTD, "
+            "i.QTD_RECEBIDA, i.QTD - i.QTD_RECEBIDA AS QTD_ABERTA, i.PRECO "
+            "FROM ordens_compra_itens i JOIN ordens_compra o ON o.OC_ID = i.OC_ID "
+            f"WHERE {' AND '.join(filtros)} ORDER BY o.DATA_PREVISTA, o.OC_ID, i.ITEM",
+            con, params=params,
+        )
+    finally:
+        con.close()
+
+
+def em_aberto_por_sku(empresa: Optional[str] = None, db_path: str = OCS_DB_PATH) -> pd.DataFrame:
+    """
+    Quantidade em aberto por SKU, lida do resumo ocs_em_aberto (sem JOIN nem JSON).
+
+    Com `empresa`: colunas SKU, Qtd_Aberta daquela empresa. Sem: Empresa, SKU,
+    Qtd_Aberta de todas. É o formato que o motor recebe em `ocs_abertas`.
+    """
+    con = conectar(db_path)
+    try:
+        if empresa is not None:
+            return pd.read_sql_query(
+                "SELECT SKU, QTD_ABERTA AS Qtd_Aberta FROM ocs_em_aberto "
+                "WHERE EMPRESA = ? AND QTD_ABERTA > 0 ORDER BY SKU",
+                con, params=[empresa],
+            )
+        return pd.read_sql_query(
+            "SELECT EMPRESA AS Empresa, SKU, QTD_ABERTA AS Qtd_Aberta FROM ocs_em_aberto "
+            "WHERE QTD_ABERTA > 0 ORDER BY EMPRESA, SKU",
+            con,
+        )
+    finally:
+        con.close()
+
+
+# ===================== ATUALIZAÇÕES =====================
+def atualizar_status(oc_id: str, status: str, db_path: str = OCS_DB_PATH) -> bool:
+    """Troca o STATUS da OC (ex.: CANCELADA). False se a OC não existe."""
+    con = conectar(db_path)
+    try:
+        with con:
+            cur = con.execute("UPDATE ordens_compra SET STATUS = ? WHERE OC_ID = ?", (status, oc_id))
+        return cur.rowcount > 0
+    finally:
+        con.close()
+
+
+def registrar_recebimento(oc_id: str, recebidos: Dict[str, int], db_path: str = OCS_DB_PATH) -> int:
+    """
+    Soma as quantidades recebidas ({SKU: qtd}) aos itens da OC, limitadas à
+    QTD pedida. SKU em mais de uma linha da OC: a quantidade preenche as
+    linhas em ordem de ITEM (o que sobra depois de todas é ignorado).
+    Quando nada mais fica em aberto, a OC passa a RECEBIDA.
+    Retorna nº de itens atualizados.
+    """
+    con = conectar(db_path)
+    try:
+        with con:
+            parcelas = []
+            for sku, q in recebidos.items():
+                resto = int(q)
+                linhas = con.execute(
+                    "SELECT ITEM, QTD - QTD_RECEBIDA FROM ordens_compra_itens "
+                    "WHERE OC_ID = ? AND SKU = ? ORDER BY ITEM",
+                    (oc_id, str(sku)),
+                ).fetchall()
+                for item, falta in linhas:
+                    parcela = min(resto, max(falta, 0))
+                    if parcela <= 0:
+                        continue
+                    parcelas.append((parcela, oc_id, item))
+                    resto -= parcela
+            con.executemany(
+                "UPDATE ordens_compra_itens SET QTD_RECEBIDA = QTD_RECEBIDA + ? WHERE OC_ID = ? AND ITEM = ?",
+                parcelas,
+            )
+            n = len(parcelas)
+            con.execute(
+                "UPDATE ordens_compra SET STATUS = ? WHERE OC_ID = ? AND COALESCE(STATUS, '') NOT IN (?, ?) "
+                "AND NOT EXISTS (SELECT 1 FROM ordens_compra_itens "
+                "                WHERE OC_ID = ? AND QTD > QTD_RECEBIDA)",
+                (STATUS_RECEBIDA, oc_id, *STATUS_FECHADOS, oc_id),
+            )
+        return n
+    finally:
+        con.close()
@@ -0,0 +1,55 @@
+# v4_api/tests/conftest.py
+# Bancos, histórico e armazém dos testes ficam num diretório temporário: os
+# módulos leem os caminhos das variáveis de ambiente na importação, então elas
+# são definidas aqui, antes de qualquer `from v4_api import ...`.
+
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+_TMP = tempfile.mkdtemp(prefix="reposicao_testes_")
+os.environ["OCS_DB_PATH"] = os.path.join(_TMP, "controle_ocs.db")
+os.environ["JOBS_DB_PATH"] = os.path.join(_TMP, "jobs_compras.db")
+os.environ["JOBS_PADRAO_DIR"] = os.path.join(_TMP, "jobs_padrao")
+os.environ["HIST_DIR"] = os.path.join(_TMP, "historico_compras")
+os.environ["CUBO_DB_PATH"] = os.path.join(_TMP, "cubo_vendas.db")
+os.environ.setdefault("API_METRICAS", "1")  # test_metricas precisa do middleware
+
+import importlib  # noqa: E402
+
+import pytest  # noqa: E402
+
+from benchmarks.gerador import ConfigCarga, gerar_carga  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def carga():
+    return gerar_carga(ConfigCarga(n_skus=300, seed=7), com_arquivos=False)
+
+
+@pytest.fixture(scope="session")
+def cliente(carga):
+    from fastapi.testclient import TestClient
+
+    from v4_api import api_compras
+
+    cl = TestClient(api_compras.app)
+    colunar = lambda df: {c: df[c].tolist() for c in df.columns}  # noqa: E731
+    r = cl.post("/padrao", json={"catalogo": colunar(carga.catalogo_df), "kits": colunar(carga.kits_df)})
+    assert r.status_code == 200, r.text
+    return cl
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """reposicao_facil (o app Streamlit, em modo bare) importado com o diretório de trabalho num temporário."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("app"))
+    try:
+        yield importlib.import_module("reposicao_facil")
+    finally:
+        os.chdir(cwd)
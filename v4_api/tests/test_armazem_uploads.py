@@ -0,0 +1,63 @@
+# v4_api/tests/test_armazem_uploads.py
+# Armazém de uploads: gravação atômica e deduplicada, leitura via mmap e poda
+# LRU que nunca remove objeto referenciado.
+
+import hashlib
+import os
+
+import pytest
+
+from v4_api.armazem_uploads import ArmazemUploads
+
+
+def _idade(armazem: ArmazemUploads, digest: str, ts: float):
+    os.utime(armazem._localizar(digest)[0], (ts, ts))
+
+
+def test_gravar_dedup_sem_temporarios_e_leitura_mmap(tmp_path):
+    armazem = ArmazemUploads(str(tmp_path))
+    conteudo = b"SKU;Quantidade\nA;1\n" * 100
+
+    digest = armazem.gravar(conteudo)
+    assert digest == hashlib.sha256(conteudo).hexdigest()
+    assert armazem.gravar(conteudo) == digest
+    arquivos = [n for _, _, nomes in os.walk(tmp_path / "objetos") for n in nomes]
+    assert arquivos == [digest]  # um objeto só, nenhum .tmp sobrando
+
+    with armazem.abrir(digest) as f:
+        assert type(f).__name__ == "_LeitorMmap"
+        assert f.read(3) == b"SKU"
+        f.seek(0)
+        assert f.read() == conteudo
+    assert armazem.ler(armazem.gravar(b"")) == b""
+
+
+def test_podar_mantem_referenciados(tmp_path):
+    armazem = ArmazemUploads(str(tmp_path), max_bytes=10**9)
+    velho, medio, novo = (armazem.gravar(bytes([i]) * 1000) for i in range(3))
+    for i, d in enumerate((velho, medio, novo)):
+        _idade(armazem, d, 1_000_000 + i)
+    armazem.apontar("JCA", "VENDAS", velho, "vendas.csv")  # o mais antigo está em uso
+
+    # cabe só um objeto: sai o LRU sem ref (medio) e depois o próximo (novo)
+    assert armazem.podar(max_bytes=2000) == 1000
+    assert armazem.existe(velho) and not armazem.existe(medio) and armazem.existe(novo)
+    assert armazem.podar(max_bytes=0) == 1000
+    assert armazem.existe(velho) and not armazem.existe(novo)
+    assert armazem.referencia("JCA", "VENDAS")["digest"] == velho
+
+    armazem.remover_referencia("JCA", "VENDAS")
+    armazem.podar(max_bytes=0)
+    assert not armazem.existe(velho)
+    with pytest.raises(FileNotFoundError):
+        armazem.abrir(velho)
+
+
+def test_abrir_renova_o_lru(tmp_path):
+    armazem = ArmazemUploads(str(tmp_path), max_bytes=10**9)
+    a, b = armazem.gravar(b"a" * 1000), armazem.gravar(b"b" * 1000)
+    _idade(armazem, a, 1_000_000)
+    _idade(armazem, b, 1_000_001)
+    armazem.ler(a)  # acesso faz touch: agora b é o menos recente
+    armazem.podar(max_bytes=1000)
+    assert armazem.existe(a) and not armazem.existe(b)
@@ -0,0 +1,80 @@
+# v4_api/tests/test_cubo_vendas.py
+# Cubo diário de vendas: ingestão de pedidos e janelas de N dias.
+
+import pandas as pd
+import pytest
+
+from v4_api import cubo_vendas as C
+
+COLS = ["id do pedido", "status do pedido", "data de criacao do pedido", "data prevista de envio",
+        "numero de referencia sku", "quantidade"]
+
+
+def _pedidos(linhas) -> pd.DataFrame:
+    """linhas: (status, data, sku, qtd) -> export de pedidos com colunas já normalizadas."""
+    return pd.DataFrame(
+        [(str(i), st, data, "01/01/2030", sku, qtd) for i, (st, data, sku, qtd) in enumerate(linhas)],
+        columns=COLS,
+    )
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "cubo.db")
+
+
+PEDIDOS = [
+    ("Concluído", "2026-03-31 10:00:00", "a", "1"),    # fora da janela de 30 dias
+    ("Concluído", "01/04/2026 09:12", "A", "2"),
+    ("Concluído", "2026-04-15", " a ", "3"),
+    ("Cancelado", "2026-04-20", "A", "100"),           # cancelado: fora
+    ("Enviado", "30/04/2026", "B", "1.000"),           # número BR
+    ("Concluído", "", "B", "7"),                       # sem data: fora
+    ("Concluído", "2026-04-30", "", "5"),              # sem SKU: fora
+    ("Concluído", "2026-01-31", "C", "4"),             # só na janela de 90
+]
+
+
+def test_janelas(db):
+    resumo = C.ingerir_blocos([_pedidos(PEDIDOS[:4]), _pedidos(PEDIDOS[4:])], "JCA", db_path=db)
+    assert (resumo["dia_ini"], resumo["dia_fim"]) == ("2026-01-31", "2026-04-30")
+    assert resumo["qtd_total"] == 1 + 2 + 3 + 1000 + 4
+
+    j = C.janelas_vendas("JCA", (30, 60, 90), db_path=db)
+    assert C.dia_para_data(C.ultimo_dia("JCA", db_path=db)) == "2026-04-30"
+    assert j.to_dict("list") == {
+        "SKU": ["A", "B", "C"],
+        "Vendas_30d": [5, 1000, 0],      # 01/04 .. 30/04
+        "Vendas_60d": [6, 1000, 0],      # 01/03 .. 30/04
+        "Vendas_90d": [6, 1000, 4],      # 31/01 .. 30/04
+    }
+
+    ate = C.data_para_dia("2026-04-14")
+    # só entram SKUs com venda dentro da maior janela
+    assert C.janelas_vendas("JCA", (1, 14), ate=ate, db_path=db).to_dict("list") == {
+        "SKU": ["A"], "Vendas_1d": [0], "Vendas_14d": [2],
+    }
+    assert C.vendas_janela("JCA", 30, db_path=db).to_dict("list") == {"SKU": ["A", "B"], "Quantidade": [5, 1000]}
+
+
+def test_reenvio_substitui_so_os_dias_cobertos(db):
+    C.ingerir_blocos([_pedidos(PEDIDOS)], "JCA", db_path=db)
+    v1 = C.versao_cubo("JCA", db_path=db)
+    # novo export de 15/04 a 30/04: A dobrado em 15/04, B some
+    C.ingerir_blocos([_pedidos([("Concluído", "2026-04-15", "A", "6"), ("Concluído", "2026-04-30", "D", "1")])],
+                     "JCA", db_path=db)
+    assert C.versao_cubo("JCA", db_path=db) != v1
+    j = C.janelas_vendas("JCA", (30, 90), db_path=db)
+    assert j.to_dict("list") == {"SKU": ["A", "C", "D"], "Vendas_30d": [8, 0, 1], "Vendas_90d": [9, 4, 1]}
+
+
+def test_empresas_separadas_e_vazio(db):
+    C.ingerir_blocos([_pedidos(PEDIDOS)], "JCA", db_path=db)
+    vazio = C.janelas_vendas("ALIVVIA", (30, 60), db_path=db)
+    assert vazio.empty and list(vazio.columns) == ["SKU", "Vendas_30d", "Vendas_60d"]
+    assert C.ultimo_dia("ALIVVIA", db_path=db) is None
+
+
+def test_planilha_sem_data_nao_e_pedido(db):
+    totalizada = pd.DataFrame({"sku": ["A"], "vendas 60d": ["3"]})
+    assert C.ingerir_blocos([totalizada], "JCA", db_path=db) is None
@@ -0,0 +1,227 @@
+# v4_api/tests/test_engine_compras.py
+# Motor de cálculo sobre um Padrão pequeno e fixo, com os resultados esperados
+# escritos à mão (os mesmos do motor original, anterior às otimizações).
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from v4_api import engine_compras
+from v4_api.engine_compras import _alinhar, achatar_kits, calcular_compra, preparar_padrao
+
+CATALOGO = pd.DataFrame({
+    "component_sku": ["A", "B", "C"],
+    "fornecedor": ["F1", "F1", "F2"],
+    "status_reposicao": ["", "", ""],
+})
+FISICO = pd.DataFrame({"SKU": ["A", "B", "C", "X9"], "Estoque_Fisico": [20, 0, 5, 100],
+                       "Preco": [2.5, 10.0, 1.0, 9.9]})
+VENDAS = pd.DataFrame({"SKU": ["K1", "c", "NOPE"], "Quantidade": [2, 3, 9]})
+
+
+def _full(kit2: str) -> pd.DataFrame:
+    return pd.DataFrame({"SKU": [" k1 ", kit2, "A", "ZZZ"], "Vendas_Qtd_60d": [10, 4, 5, 7],
+                         "Estoque_Full": [3, 1, 2, 50], "Em_Transito": [1, 0, 0, 0]})
+
+
+KITS = pd.DataFrame({"kit_sku": ["K1", "K1", "K1", "K3"], "component_sku": ["A", "B", "A", "C"],
+                     "qty": [2, 1, 2, 3]})  # (K1, A) repetido: conta uma vez só
+
+ESPERADO = pd.DataFrame({
+    "SKU": ["A", "B", "C"],
+    "fornecedor": ["F1", "F1", "F2"],
+    "Vendas_Total_60d": [29, 12, 15],
+    "Estoque_Full": [2, 0, 0],
+    "Estoque_Fisico": [20, 0, 5],
+    "Preco": [2.5, 10.0, 1.0],
+    "Compra_Sugerida": [17, 9, 12],
+    "Valor_Compra_R$": [42.5, 90.0, 12.0],
+    "ML_60d": [25, 10, 12],
+    "Shopee_60d": [4, 2, 3],
+    "TOTAL_60d": [29, 12, 15],
+    "Reserva_30d": [14, 6, 8],
+    "Folga_Fisico": [6, 0, 0],
+    "Necessidade": [23, 9, 12],
+    "Em_Transito": [0, 0, 0],
+})
+PAINEL = {"full_unid": 56, "full_valor": 53.0, "fisico_unid": 125, "fisico_valor": 1045.0}
+
+
+def _mesmos_tipos(df: pd.DataFrame) -> pd.DataFrame:
+    return ESPERADO.astype(df.dtypes.to_dict())
+
+
+# ===================== RESULTADO FIXO =====================
+@pytest.mark.parametrize("engine", ["pandas", "numpy"])
+def test_resultado_fixo(engine):
+    df, painel = calcular_compra(_full("K3"), FISICO, VENDAS, CATALOGO, KITS, h=60, g=10.0, LT=5, engine=engine)
+    pd.testing.assert_frame_equal(df, _mesmos_tipos(df))
+    assert painel == PAINEL
+
+
+def test_linhas_de_kit_repetidas_nao_somam():
+    sem_repetida = KITS.drop_duplicates(subset=["kit_sku", "component_sku"])
+    a, pa = calcular_compra(_full("K3"), FISICO, VENDAS, CATALOGO, KITS, h=60, g=10.0, LT=5)
+    b, pb = calcular_compra(_full("K3"), FISICO, VENDAS, CATALOGO, sem_repetida, h=60, g=10.0, LT=5)
+    pd.testing.assert_frame_equal(a, b)
+    assert pa == pb
+
+
+def test_skus_desconhecidos_ficam_fora_da_base():
+    # ZZZ (FULL), NOPE (vendas) e X9 (físico) não estão no Padrão: não geram linha
+    # nem mudam os componentes; só entram nos totais de estoque do painel.
+    df, painel = calcular_compra(_full("K3"), FISICO, VENDAS, CATALOGO, KITS, h=60, g=10.0, LT=5)
+    assert df["SKU"].tolist() == ["A", "B", "C"]
+    limpos = [d[~d["SKU"].str.strip().str.upper().isin(["ZZZ", "NOPE", "X9"])]
+              for d in (_full("K3"), FISICO, VENDAS)]
+    df2, painel2 = calcular_compra(*limpos, CATALOGO, KITS, h=60, g=10.0, LT=5)
+    pd.testing.assert_frame_equal(df, df2)
+    assert painel["full_unid"] - painel2["full_unid"] == 50
+    assert painel["fisico_unid"] - painel2["fisico_unid"] == 100
+
+
+def test_por_empresa_igual_a_uma_por_vez():
+    entradas = [_full("K3"), FISICO, VENDAS]
+    outra = [_full("K3").assign(Vendas_Qtd_60d=[1, 2, 3, 4]), FISICO.assign(Estoque_Fisico=[0, 1, 2, 3]), VENDAS]
+    empilhadas = [pd.concat([a.assign(Empresa="JCA"), b.assign(Empresa="ALIVVIA")], ignore_index=True)
+                  for a, b in zip(entradas, outra)]
+    for engine in ("pandas", "numpy"):
+        df, paineis = calcular_compra(*empilhadas, CATALOGO, KITS, h=30, g=5.0, LT=2,
+                                      por_empresa=True, engine=engine)
+        for emp, dfs in (("JCA", entradas), ("ALIVVIA", outra)):
+            sozinha, painel = calcular_compra(*dfs, CATALOGO, KITS, h=30, g=5.0, LT=2, engine=engine)
+            parte = df[df["Empresa"] == emp].drop(columns="Empresa").reset_index(drop=True)
+            pd.testing.assert_frame_equal(parte, sozinha)
+            assert paineis[emp] == painel
+
+
+# ===================== KITS ANINHADOS / CICLOS =====================
+def test_achatar_kits_aninhados():
+    kits = pd.DataFrame({"kit_sku": ["K1", "K1", "K2", "K2", "K3", "K3"],
+                         "component_sku": ["A", "B", "K1", "C", "K2", "K1"],
+                         "qty": [2, 1, 2, 3, 1, 1]})
+    plano, ciclos = achatar_kits(kits)
+    assert ciclos == []
+    got = {(k, c): q for k, c, q in plano.itertuples(index=False)}
+    assert got == {
+        ("K1", "A"): 2, ("K1", "B"): 1,
+        ("K2", "A"): 4, ("K2", "B"): 2, ("K2", "C"): 3,
+        ("K3", "A"): 6, ("K3", "B"): 3, ("K3", "C"): 3,  # K2 + K1: mesmo componente por dois caminhos soma
+    }
+
+
+def test_kit_aninhado_calcula_como_o_achatado():
+    aninhado = pd.DataFrame({"kit_sku": ["K1", "K1", "K2", "K2"], "component_sku": ["A", "B", "K1", "C"],
+                             "qty": [2, 1, 1, 3]})
+    achatado = pd.DataFrame({"kit_sku": ["K1", "K1", "K2", "K2", "K2"], "component_sku": ["A", "B", "A", "B", "C"],
+                             "qty": [2, 1, 2, 1, 3]})
+    for engine in ("pandas", "numpy"):
+        a, pa = calcular_compra(_full("K2"), FISICO, VENDAS, CATALOGO, aninhado, h=60, g=10.0, LT=5, engine=engine)
+        b, pb = calcular_compra(_full("K2"), FISICO, VENDAS, CATALOGO, achatado, h=60, g=10.0, LT=5, engine=engine)
+        pd.testing.assert_frame_equal(a, b)
+        assert pa == pb
+        assert a["ML_60d"].tolist() == [33, 14, 12]
+
+
+def test_ciclo_de_kits_levanta_erro():
+    kits = pd.DataFrame({"kit_sku": ["K1", "K1", "K2", "K3"], "component_sku": ["A", "K2", "K1", "C"],
+                         "qty": [1, 1, 1, 2]})
+    with pytest.raises(ValueError, match="K1 → K2 → K1"):
+        achatar_kits(kits, estrito=True)
+    with pytest.raises(ValueError, match="ciclo"):
+        preparar_padrao(CATALOGO, kits)
+
+    # aceitando: o laço fica de fora e é listado; o resto segue
+    padrao = preparar_padrao(CATALOGO, kits, aceitar_ciclos=True)
+    assert padrao.ciclos_kits == [["K1", "K2", "K1"]]
+    assert set(padrao.kits_efetivo["kit_sku"]) == {"K3", "A", "B", "C"}
+
+
+def test_preparar_padrao_achata_os_kits_uma_vez(monkeypatch):
+    chamadas = []
+    original = engine_compras.achatar_kits
+    monkeypatch.setattr(engine_compras, "achatar_kits", lambda *a, **k: chamadas.append(1) or original(*a, **k))
+    kits = pd.DataFrame({"kit_sku": ["K1", "K1", "K2", "K2"], "component_sku": ["A", "B", "K1", "C"],
+                         "qty": [2, 1, 1, 3]})
+    padrao = preparar_padrao(CATALOGO, kits)
+    assert len(chamadas) == 1
+    assert set(map(tuple, padrao.kits_efetivo.to_numpy().tolist())) >= {("K2", "A", 2), ("K2", "C", 3)}
+
+
+def test_kit_que_lista_a_si_mesmo_nao_e_ciclo():
+    kits = pd.DataFrame({"kit_sku": ["A", "K1", "K1"], "component_sku": ["A", "A", "B"], "qty": [1, 2, 1]})
+    plano, ciclos = achatar_kits(kits, estrito=True)
+    assert ciclos == []
+    pd.testing.assert_frame_equal(plano, kits)
+
+
+# ===================== BACKENDS (engine="pandas" x "numpy") =====================
+def _empilhar(carga, empresas=("JCA", "ALIVVIA")):
+    out = []
+    for nome in ("full_df", "fisico_df", "vendas_df"):
+        df = getattr(carga, nome)
+        partes = [df.assign(Empresa=emp) if i == 0 else df.sample(frac=0.7, random_state=i).assign(Empresa=emp)
+                  for i, emp in enumerate(empresas)]
+        out.append(pd.concat(partes, ignore_index=True))
+    return out
+
+
+@pytest.mark.parametrize("h,g,LT", [(60, 0.0, 0), (30, 12.5, 7), (90, -5.0, 15)])
+def test_numpy_igual_pandas(carga, h, g, LT):
+    ocs = pd.DataFrame({"SKU": carga.catalogo_df["component_sku"].iloc[:20].str.lower(), "Qtd_Aberta": range(20)})
+    args = (carga.full_df, carga.fisico_df, carga.vendas_df, carga.catalogo_df, carga.kits_df)
+    a, pa = calcular_compra(*args, h=h, g=g, LT=LT, engine="pandas", ocs_abertas=ocs)
+    b, pb = calcular_compra(*args, h=h, g=g, LT=LT, engine="numpy", ocs_abertas=ocs)
+    pd.testing.assert_frame_equal(a, b)
+    assert pa == pb
+
+
+def test_numpy_igual_pandas_por_empresa(carga):
+    full, fisico, vendas = _empilhar(carga)
+    ocs = pd.DataFrame({"Empresa": ["JCA", "ALIVVIA", "ALIVVIA"],
+                        "SKU": carga.catalogo_df["component_sku"].iloc[[0, 0, 5]].tolist(), "Qtd_Aberta": [3, 4, 5]})
+    args = (full, fisico, vendas, carga.catalogo_df, carga.kits_df)
+    a, pa = calcular_compra(*args, por_empresa=True, engine="pandas", ocs_abertas=ocs)
+    b, pb = calcular_compra(*args, por_empresa=True, engine="numpy", ocs_abertas=ocs)
+    pd.testing.assert_frame_equal(a, b)
+    assert pa == pb
+
+
+def test_engine_invalido():
+    with pytest.raises(ValueError, match="engine"):
+        calcular_compra(_full("K3"), FISICO, VENDAS, CATALOGO, KITS, engine="polars")
+
+
+@pytest.mark.parametrize("engine", ["pandas", "numpy"])
+def test_fisico_object_com_vazios(engine):
+    # colunas object (None/NaN, números em texto) viram número sem FutureWarning de downcast
+    fisico = pd.DataFrame({
+        "SKU": ["A", "B", "C"],
+        "Estoque_Fisico": pd.Series([20, None, "5"], dtype=object),
+        "Preco": pd.Series(["2.5", 10.0, None], dtype=object),
+    })
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        df, _ = calcular_compra(_full("K3"), fisico, VENDAS, CATALOGO, KITS, engine=engine)
+    assert df["Estoque_Fisico"].tolist() == [20, 0, 5]
+    assert df["Preco"].tolist() == [2.5, 10.0, 0.0]
+
+
+@pytest.mark.parametrize("direita", [
+    [3, 0, -1, 2],            # chaves únicas
+    [3, 0, 3, -1, 1, 0, 3],   # repetidas: a linha da esquerda se repete, na ordem da direita
+    [-1, -1],                 # nada casa
+    [],
+])
+def test_alinhar_igual_merge_left(direita):
+    esquerda = np.array([0, 1, 2, 3, 3, 4], dtype=np.int64)
+    direita = np.array(direita, dtype=np.int64)
+    linhas, pos = _alinhar(esquerda, direita, n_chaves=5)
+
+    esq = pd.DataFrame({"k": esquerda, "linha": np.arange(len(esquerda))})
+    dir_ = pd.DataFrame({"k": direita, "pos": np.arange(len(direita))})
+    ref = esq.merge(dir_[dir_["k"] >= 0], on="k", how="left")
+    assert linhas.tolist() == ref["linha"].tolist()
+    assert pos.tolist() == ref["pos"].fillna(-1).astype(int).tolist()
@@ -0,0 +1,77 @@
+# v4_api/tests/test_historico_compras.py
+# Snapshots do histórico e o diff entre execuções.
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from v4_api import historico_compras as H
+
+
+def _resultado(skus, compras, necessidades=None) -> pd.DataFrame:
+    return pd.DataFrame({
+        "SKU": skus,
+        "Compra_Sugerida": compras,
+        "Necessidade": necessidades if necessidades is not None else compras,
+    })
+
+
+def test_diff_resultados():
+    de = _resultado(["A", "B", "C", "D"], [10, 5, 0, 7])
+    para = _resultado(["B", "A", "E", "D"], [5, 4, 3, 7], [6, 4, 3, 7])
+    diff = H.diff_resultados(de, para, ["Compra_Sugerida", "Necessidade"])
+    # ordem: maior |delta| da primeira coluna primeiro (empate: ordem de aparição)
+    assert diff["SKU"].tolist() == ["A", "E", "B", "C"]
+    assert diff["Mudanca"].tolist() == [H.MUDANCA_ALTERADO, H.MUDANCA_NOVO, H.MUDANCA_ALTERADO, H.MUDANCA_REMOVIDO]
+    assert diff["Compra_Sugerida_delta"].tolist() == [-6.0, 3.0, 0.0, 0.0]
+    assert diff["Necessidade_delta"].tolist() == [-6.0, 3.0, 1.0, 0.0]
+    assert np.isnan(diff.loc[1, "Compra_Sugerida_de"]) and np.isnan(diff.loc[3, "Compra_Sugerida_para"])
+    assert H.resumo_diff(diff) == {H.MUDANCA_NOVO: 1, H.MUDANCA_REMOVIDO: 1, H.MUDANCA_ALTERADO: 2}
+
+
+def test_diff_resultados_sem_mudanca_e_coluna_ausente():
+    df = _resultado(["A", "B"], [1, 2])
+    diff = H.diff_resultados(df, df.iloc[::-1], ["Compra_Sugerida", "Nao_Existe"])
+    assert diff.empty
+    assert list(diff.columns) == ["SKU", "Mudanca", "Compra_Sugerida_de", "Compra_Sugerida_para",
+                                  "Compra_Sugerida_delta"]
+
+
+def test_snapshot_ida_e_volta_e_arquivo_ausente(tmp_path):
+    hist = str(tmp_path / "hist")
+    r1 = H.gravar_snapshot(_resultado(["A", "B"], [1, 2]), "JCA", 60, 0.0, 0, hist_dir=hist)
+    r2 = H.gravar_snapshot(_resultado(["A", "B"], [1, 3]), "JCA", 60, 0.0, 0, hist_dir=hist)
+    pd.testing.assert_frame_equal(H.ler_snapshot(r1, hist_dir=hist), _resultado(["A", "B"], [1, 2]))
+    diff = H.diff_snapshots(r1, r2, ["Compra_Sugerida"], hist_dir=hist)
+    assert diff["SKU"].tolist() == ["B"]
+
+    os.remove(os.path.join(hist, H.info_snapshot(r2, hist_dir=hist)["ARQUIVO"]))
+    assert H.ler_snapshot(r2, hist_dir=hist) is None
+    assert H.diff_snapshots(r1, r2, hist_dir=hist) is None
+    assert H.diff_snapshots(r1, "nao-existe", hist_dir=hist) is None
+
+
+def test_api_diff_404_quando_arquivo_sumiu(cliente):
+    r1 = H.gravar_snapshot(_resultado(["A"], [1]), "JCA", 60, 0.0, 0)
+    r2 = H.gravar_snapshot(_resultado(["A"], [2]), "JCA", 60, 0.0, 0)
+    assert cliente.get("/historico/diff", params={"de": r1, "para": r2}).status_code == 200
+
+    os.remove(os.path.join(H.HIST_DIR, H.info_snapshot(r2)["ARQUIVO"]))
+    r = cliente.get("/historico/diff", params={"de": r1, "para": r2})
+    assert r.status_code == 404
+    assert cliente.get("/historico/diff", params={"de": r1, "para": "nao-existe"}).status_code == 404
+
+
+@pytest.mark.parametrize("por_empresa", [False, True])
+def test_gravar_resultado_um_snapshot_por_empresa(tmp_path, por_empresa):
+    hist = str(tmp_path / "hist")
+    df = _resultado(["A", "B", "A"], [1, 2, 3])
+    if por_empresa:
+        df.insert(0, "Empresa", ["JCA", "JCA", "ALIVVIA"])
+    runs = H.gravar_resultado(df, por_empresa, "JCA", 60, 0.0, 0, hist_dir=hist)
+    assert sorted(runs) == (["ALIVVIA", "JCA"] if por_empresa else ["JCA"])
+    jca = H.ler_snapshot(runs["JCA"], hist_dir=hist)
+    assert "Empresa" not in jca.columns
+    assert jca["SKU"].tolist() == (["A", "B"] if por_empresa else ["A", "B", "A"])
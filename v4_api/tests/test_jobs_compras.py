@@ -0,0 +1,94 @@
+# v4_api/tests/test_jobs_compras.py
+# O job em segundo plano tem de devolver exatamente o que /calcular-compra
+# devolve para o mesmo payload (OCs abertas, etapas e histórico inclusive).
+
+import time
+
+import pandas as pd
+
+from v4_api import historico_compras, jobs_compras, ocs_compras
+from v4_api.engine_compras import preparar_padrao
+
+
+def colunar(df: pd.DataFrame) -> dict:
+    return {c: df[c].tolist() for c in df.columns}
+
+
+def _esperar(cliente, job_id: str, limite_s: float = 120.0) -> dict:
+    fim = time.time() + limite_s
+    while time.time() < fim:
+        info = cliente.get(f"/jobs/{job_id}").json()
+        if info["status"] in ("ok", "erro"):
+            return info
+        time.sleep(0.2)
+    raise AssertionError(f"job {job_id} não terminou em {limite_s}s")
+
+
+def test_job_igual_ao_sincrono_com_ocs_e_historico(cliente, carga):
+    sku = carga.catalogo_df.component_sku.iloc[0]
+    ocs_compras.gravar_oc_do_carrinho(
+        pd.DataFrame({"Empresa": ["JCA"], "SKU": [sku], "Fornecedor": ["F"],
+                      "Preco_Custo": [1.0], "Qtd_Ajustada": [7]}),
+        "OC-JOB-1",
+    )
+    body = {
+        "full": colunar(carga.full_df), "vendas": colunar(carga.vendas_df), "fisico": colunar(carga.fisico_df),
+        "h": 45, "g": 5.0, "LT": 10, "empresa": "JCA",
+        "ocs_abertas": True, "medir_etapas": True, "gravar_historico": True,
+    }
+    sinc = cliente.post("/calcular-compra", json=body).json()
+
+    r = cliente.post("/jobs/calcular-compra", json=body)
+    assert r.status_code == 202
+    info = _esperar(cliente, r.json()["job_id"])
+    assert info["status"] == "ok", info["erro"]
+    job = cliente.get(f"/jobs/{info['job_id']}/resultado").json()
+
+    assert job["resultado"] == sinc["resultado"]
+    assert set(job["painel"].pop("etapas_ms")) == set(sinc["painel"].pop("etapas_ms"))
+    assert job["painel"] == sinc["painel"]
+
+    # as OCs abertas entraram no cálculo do job
+    sem_ocs = cliente.post("/calcular-compra", json={**body, "ocs_abertas": None}).json()
+    res, base = pd.DataFrame(job["resultado"]), pd.DataFrame(sem_ocs["resultado"])
+    em_transito = lambda df: int(df.loc[df.SKU == sku, "Em_Transito"].iloc[0])  # noqa: E731
+    assert em_transito(res) == em_transito(base) + 7
+
+    # snapshot do job gravado e igual ao do cálculo síncrono
+    assert info["snapshots"] == job["snapshots"]
+    run_job, run_sinc = job["snapshots"]["JCA"], sinc["snapshots"]["JCA"]
+    assert historico_compras.info_snapshot(run_job)["CHAVE_ENTRADAS"] == \
+        historico_compras.info_snapshot(run_sinc)["CHAVE_ENTRADAS"]
+    diff = historico_compras.diff_snapshots(run_sinc, run_job)
+    assert sum(historico_compras.resumo_diff(diff).values()) == 0
+
+
+def test_job_ocs_abertas_invalidas_422(cliente, carga):
+    body = {"full": colunar(carga.full_df), "vendas": colunar(carga.vendas_df),
+            "fisico": colunar(carga.fisico_df), "ocs_abertas": "sim"}
+    assert cliente.post("/jobs/calcular-compra", json=body).status_code == 422
+
+
+def test_ocs_do_banco_sem_empresa_422(cliente, carga):
+    body = {"full": colunar(carga.full_df), "vendas": colunar(carga.vendas_df),
+            "fisico": colunar(carga.fisico_df), "ocs_abertas": True}
+    for rota in ("/calcular-compra", "/calcular-compra/cenarios", "/jobs/calcular-compra"):
+        extra = {"cenarios": [{"h": 30}]} if rota.endswith("cenarios") else {}
+        r = cliente.post(rota, json={**body, **extra})
+        assert r.status_code == 422 and "empresa" in r.json()["detail"], rota
+
+
+def test_padrao_do_job_vem_do_disco_e_fica_em_cache(carga, tmp_path):
+    padrao = preparar_padrao(carga.catalogo_df, carga.kits_df)
+    jobs_compras.publicar_padrao(padrao, str(tmp_path))
+    assert sorted(p.name for p in tmp_path.iterdir()) == \
+        sorted(f"{padrao.versao}_{t}.parquet" for t in ("catalogo", "kits", "kits_efetivo"))
+
+    lido = jobs_compras._padrao_do_disco(padrao.versao, str(tmp_path))
+    pd.testing.assert_frame_equal(lido.kits_efetivo, padrao.kits_efetivo)
+    assert jobs_compras._padrao_do_disco(padrao.versao, str(tmp_path)) is lido
+
+    # versão nova => relê do disco
+    outro = preparar_padrao(carga.catalogo_df.iloc[:-1], carga.kits_df)
+    jobs_compras.publicar_padrao(outro, str(tmp_path))
+    assert jobs_compras._padrao_do_disco(outro.versao, str(tmp_path)).versao == outro.versao
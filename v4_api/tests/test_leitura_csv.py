@@ -0,0 +1,113 @@
+# v4_api/tests/test_leitura_csv.py
+# Leitura dos CSV de upload (reposicao_facil): encoding detectado só pela
+# amostra e releitura em latin-1 quando um byte inválido aparece depois dela;
+# filtro das linhas de TOTAL na leitura completa e na leitura só das colunas mapeadas.
+
+import io
+
+import pytest
+
+from v4_api import cubo_vendas
+
+
+class _Contador(io.BytesIO):
+    """BytesIO que registra quantos bytes foram lidos."""
+
+    def __init__(self, dados: bytes):
+        super().__init__(dados)
+        self.lidos = 0
+
+    def read(self, n=-1):
+        out = super().read(n)
+        self.lidos += len(out)
+        return out
+
+
+def _csv_grande(ultima_linha: str, encoding: str, n: int = 20_000) -> bytes:
+    linhas = ["SKU;Estoque;Preco"] + [f"SKU-{i:05d};{i % 7};1,50" for i in range(n)] + [ultima_linha]
+    return ("\n".join(linhas) + "\n").encode(encoding)
+
+
+def test_sniff_le_so_a_amostra(app):
+    dados = _csv_grande("SKU-Ç;1;2,00", "utf-8")
+    fonte = _Contador(dados)
+    opts = app._sniff_csv(fonte)
+    assert opts["encoding"] == "utf-8" and opts["sep"] == ";"
+    assert fonte.lidos == app.CSV_SNIFF_BYTES < len(dados)
+    assert fonte.tell() == 0
+
+
+@pytest.mark.parametrize("chunk_rows", [100_000, 1_000])
+def test_latin1_depois_da_amostra(app, monkeypatch, chunk_rows):
+    monkeypatch.setattr(app, "CSV_CHUNK_ROWS", chunk_rows)
+    dados = _csv_grande("SKU-Ç;1;2,00", "latin-1")
+    assert app._sniff_csv(io.BytesIO(dados))["encoding"] == "utf-8"  # amostra é ASCII puro
+    df = app.load_any_table_from_bytes("estoque.csv", dados)
+    assert len(df) == 20_001
+    assert df["sku"].iloc[-1] == "SKU-C"  # "Ç" lido como latin-1 (e transliterado pelo norm do SKU)
+    assert list(df.columns) == ["sku", "estoque", "preco"]
+
+
+def test_utf8_multibyte_cortado_no_fim_da_amostra(app):
+    cabecalho = b"SKU;Obs\n"
+    enchimento = b"A;" + b"x" * (app.CSV_SNIFF_BYTES - len(cabecalho) - 3)  # "ç" (2 bytes) cruza o limite
+    dados = cabecalho + enchimento + "ç\nB;é\n".encode("utf-8")
+    assert app._sniff_csv(io.BytesIO(dados))["encoding"] == "utf-8"
+    df = app.load_any_table_from_bytes("x.csv", dados)
+    assert df["obs"].str[-1].tolist() == ["ç", "é"]
+
+
+def test_latin1_na_amostra_e_bom(app):
+    assert app._sniff_csv(io.BytesIO("SKU;Descrição\nA;Ç\n".encode("latin-1")))["encoding"] == "latin-1"
+    assert app._sniff_csv(io.BytesIO("SKU;Obs\nA;ç\n".encode("utf-8-sig")))["encoding"] == "utf-8-sig"
+
+
+def test_cubo_rele_pedidos_em_latin1(app, monkeypatch):
+    # o cubo é o do conftest (CUBO_DB_PATH temporário); empresa própria deste teste
+    monkeypatch.setattr(app, "CSV_CHUNK_ROWS", 1_000)
+    linhas = ["ID do pedido;Status do pedido;Data de criação do pedido;Número de referência SKU;Quantidade"]
+    linhas += [f"{i};Concluído;2026-04-{1 + i % 30:02d};SKU-{i % 50};1" for i in range(5_000)]
+    linhas += ["9999;Concluído;2026-04-30;SKU-Ç;2"]
+    dados = ("\n".join(linhas) + "\n").encode("latin-1")
+    dados = dados.replace("Concluído".encode("latin-1"), b"Concluido", 4_000)  # amostra ASCII
+    resumo = app.ingerir_pedidos_no_cubo("TESTE_LATIN1", "pedidos.csv", dados)
+    assert resumo["qtd_total"] == 5_002
+    j = cubo_vendas.janelas_vendas("TESTE_LATIN1", (30,)).set_index("SKU")["Vendas_30d"]
+    assert j["SKU-Ç"] == 2 and j.sum() == 5_002
+
+
+_FISICO_COM_TOTAIS = (
+    "Tipo;SKU;Descricao;Estoque;Preco;Obs\n"
+    "P;A;d;5;1,00;\n"
+    "TOTAL;;;5;;\n"          # total de verdade: sai nas duas leituras
+    "P;totais;d;1;1,00;\n"   # rótulo numa coluna lida
+    "P;B;d;3;2,00;Total\n"   # rótulo só na coluna Obs (não usada no mapeamento)
+).encode("utf-8")
+
+
+def test_total_em_qualquer_coluna_na_leitura_completa(app):
+    df = app.load_any_table_from_bytes("estoque.csv", _FISICO_COM_TOTAIS)
+    assert df["sku"].tolist() == ["A"]
+
+
+def test_total_na_leitura_projetada_so_ve_colunas_lidas(app):
+    tipo, df = app.load_mapped_table_from_bytes("estoque.csv", _FISICO_COM_TOTAIS, "FISICO")
+    assert tipo == "FISICO"
+    assert df["SKU"].tolist() == ["A", "B"]
+    assert df["Estoque_Fisico"].tolist() == [5, 3]
+
+
+def test_amostra_do_csv_lida_uma_vez_por_arquivo(app, monkeypatch):
+    chamadas = []
+    sniff = app._sniff_csv
+    monkeypatch.setattr(app, "_sniff_csv", lambda fonte: chamadas.append(1) or sniff(fonte))
+    monkeypatch.setattr(app, "CSV_CHUNK_ROWS", 1_000)
+    # ~85 KB: o byte latin-1 fica depois da amostra de bytes, mas dentro do buffer
+    # que o pandas decodifica já na amostra de linhas do layout
+    latin1 = _csv_grande("SKU-Ç;1;2,00", "latin-1", n=5_000)
+
+    assert app.load_any_table_from_bytes("estoque.csv", latin1)["sku"].iloc[-1] == "SKU-C"
+    app.load_mapped_table_from_bytes("estoque.csv", _FISICO_COM_TOTAIS, "FISICO")
+    magiic = b"Relatorio\n\nx;y\nA;1\n"  # sem SKU na linha 0: amostra também com header=2
+    app.load_any_table_from_bytes("full.csv", magiic)
+    assert len(chamadas) == 3
@@ -0,0 +1,48 @@
+# v4_api/tests/test_memo_resultados.py
+# Memo de resultados: orçamento de bytes, ordem de descarte (LRU) e
+# substituição de uma chave já guardada.
+
+import numpy as np
+
+from v4_api.memo_resultados import MemoResultados, tamanho_aprox
+
+
+def test_descarta_menos_usado_ate_caber():
+    memo = MemoResultados(max_bytes=300)
+    for chave in "abc":
+        memo.guardar(chave, chave, nbytes=100)
+    assert memo.obter("a") == "a"  # "a" vira o mais recente; "b" é o LRU
+
+    memo.guardar("d", "d", nbytes=150)
+    assert memo.obter("b") is None and memo.obter("c") is None
+    assert memo.obter("a") == "a" and memo.obter("d") == "d"
+    est = memo.estatisticas()
+    assert est["bytes"] == 250 <= est["max_bytes"]
+    assert est["descartes"] == 2 and est["entradas"] == 2
+
+
+def test_valor_maior_que_o_orcamento_nao_entra():
+    memo = MemoResultados(max_bytes=100)
+    memo.guardar("a", "a", nbytes=50)
+    memo.guardar("grande", "g", nbytes=101)
+    assert memo.obter("grande") is None and memo.obter("a") == "a"
+    assert memo.estatisticas()["descartes"] == 0
+
+
+def test_substituir_chave_atualiza_bytes():
+    memo = MemoResultados(max_bytes=300)
+    memo.guardar("a", "v1", nbytes=200)
+    memo.guardar("b", "b", nbytes=100)
+    memo.guardar("a", "v2", nbytes=50)  # não conta os 200 antigos nem descarta "b"
+    assert memo.obter("a") == "v2" and memo.obter("b") == "b"
+    est = memo.estatisticas()
+    assert est["bytes"] == 150 and est["entradas"] == 2 and est["descartes"] == 0
+
+    memo.guardar("a", "v3", nbytes=400)  # substituto grande demais: a chave some
+    assert memo.obter("a") is None and memo.estatisticas()["bytes"] == 100
+
+
+def test_tamanho_aprox_conta_arrays_compartilhados_uma_vez():
+    arr = np.zeros(1000, dtype=np.int64)
+    assert tamanho_aprox({"x": arr, "y": arr}) < 2 * arr.nbytes
+    assert tamanho_aprox({"x": arr}) >= arr.nbytes
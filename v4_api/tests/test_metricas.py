@@ -0,0 +1,49 @@
+# v4_api/tests/test_metricas.py
+# /metrics: a latência das respostas em streaming cobre o envio do corpo.
+
+import re
+import time
+
+import pytest
+
+from v4_api import api_compras, metricas
+
+pytestmark = pytest.mark.skipif(not metricas.ATIVAS, reason="métricas desligadas (API_METRICAS != 1)")
+
+
+def _serie(texto: str, sufixo: str, rota: str) -> float:
+    m = re.search(rf'reposicao_http_request_duration_seconds_{sufixo}\{{metodo="POST",rota="{re.escape(rota)}",'
+                  rf'status="200"\}} (\S+)', texto)
+    return float(m.group(1)) if m else 0.0
+
+
+def test_latencia_inclui_corpo_em_streaming(cliente, carga, monkeypatch):
+    rota = "/calcular-compra"
+    body = {c: {k: v.tolist() for k, v in getattr(carga, f"{c}_df").items()} for c in ("full", "vendas", "fisico")}
+    original = api_compras._blocos_ndjson
+
+    def blocos_lentos(df):
+        for parte in original(df):
+            time.sleep(0.2)
+            yield parte
+
+    monkeypatch.setattr(api_compras, "_blocos_ndjson", blocos_lentos)
+    antes = cliente.get("/metrics").text
+    r = cliente.post(rota, json=body, headers={"Accept": "application/x-ndjson"})
+    assert r.status_code == 200 and r.text.count("\n") == len(carga.catalogo_df)
+    depois = cliente.get("/metrics").text
+
+    assert _serie(depois, "count", rota) == _serie(antes, "count", rota) + 1
+    assert _serie(depois, "sum", rota) - _serie(antes, "sum", rota) >= 0.2
+
+
+def test_health(cliente, capsys):
+    assert cliente.get("/health").json() == {"status": "ok"}
+    assert capsys.readouterr().out == ""
+
+
+def test_rota_rotulada_pelo_template(cliente):
+    assert cliente.get("/jobs/nao-existe").status_code == 404
+    texto = cliente.get("/metrics").text
+    assert 'metodo="GET",rota="/jobs/{job_id}",status="404"' in texto
+    assert "nao-existe" not in texto
@@ -0,0 +1,59 @@
+# v4_api/tests/test_normalizacao.py
+# As versões vetorizadas (coluna inteira) têm de dar exatamente o resultado
+# das escalares br_to_float / norm_sku aplicadas valor a valor.
+
+import numpy as np
+import pandas as pd
+import pytest
+from unidecode import unidecode
+
+from v4_api.engine_compras import br_to_float, br_to_float_series, norm_sku, norm_sku_series
+
+TEXTOS_BR = ["R$ 1.234,56", "1.234,56", "12", " 7,5 ", "R$ 10,00", "", "-", "n/d", None, np.nan,
+             "1.234,56", "0,001", "-3,2", "R$ 1.000.000,00"]
+
+
+def _igual(a: pd.Series, b: pd.Series):
+    pd.testing.assert_series_equal(a, b, check_names=False)
+
+
+@pytest.mark.parametrize("valores", [
+    TEXTOS_BR,
+    ["1,5", "2,5", None],                 # só texto válido (caminho astype(float) em bloco)
+    [1, 2.5, np.nan],                     # numérica
+    ["1,5", 2, None, "abc"],              # mista: cai no escalar
+    [],
+])
+def test_br_to_float_series_igual_escalar(valores):
+    s = pd.Series(valores, dtype=object if valores else float)
+    _igual(br_to_float_series(s), s.map(br_to_float).astype(float))
+
+
+def test_br_to_float_series_mantem_indice():
+    s = pd.Series(["1,5", None, "2"], index=[10, 3, 7])
+    out = br_to_float_series(s)
+    assert out.index.tolist() == [10, 3, 7]
+    assert out.tolist()[0] == 1.5 and np.isnan(out.tolist()[1]) and out.tolist()[2] == 2.0
+
+
+@pytest.mark.parametrize("valores", [
+    [" kit-01 ", "Kit-01", "abc", None, np.nan, "", "Çà-1"],
+    [123, 45.0, None, "x"],               # não-texto: str() como no escalar
+    [],
+])
+def test_norm_sku_series_igual_escalar(valores):
+    s = pd.Series(valores, dtype=object)
+    _igual(norm_sku_series(s), s.map(norm_sku).astype(object))
+
+
+def test_norm_sku_series_translitera_so_nao_ascii():
+    chamados = []
+
+    def translit(x):
+        chamados.append(x)
+        return unidecode(x)
+
+    s = pd.Series(["ação-1", "abc", "ação-1", None, " pé "])
+    out = norm_sku_series(s, translit=translit)
+    assert out.tolist() == ["ACAO-1", "ABC", "ACAO-1", "", "PE"]
+    assert sorted(chamados) == [" pé ", "ação-1"]  # uma vez por valor distinto não ASCII
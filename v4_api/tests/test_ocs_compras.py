@@ -0,0 +1,146 @@
+# v4_api/tests/test_ocs_compras.py
+# Gravação de OCs a partir do carrinho e o resumo ocs_em_aberto mantido pelos triggers.
+
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from v4_api import ocs_compras
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "ocs.db")
+
+
+def _carrinho(qtds=(5, 3), empresas=("JCA", "JCA")) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Empresa": list(empresas),
+        "SKU": ["A", "B"],
+        "Fornecedor": ["F1", "F1"],
+        "Preco_Custo": [2.0, 10.0],
+        "Qtd_Ajustada": list(qtds),
+    })
+
+
+def _contar(db, tabela: str) -> int:
+    con = sqlite3.connect(db)
+    try:
+        return con.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+    finally:
+        con.close()
+
+
+def test_reexportar_sem_numero_nao_duplica(db):
+    ids1 = ocs_compras.gravar_oc_do_carrinho(_carrinho(), db_path=db)
+    ids2 = ocs_compras.gravar_oc_do_carrinho(_carrinho(), db_path=db)
+    assert ids1 == ids2
+    assert _contar(db, "ordens_compra") == 1
+    assert _contar(db, "ordens_compra_itens") == 2
+    aberto = ocs_compras.em_aberto_por_sku("JCA", db_path=db)
+    assert aberto.to_dict("list") == {"SKU": ["A", "B"], "Qtd_Aberta": [5, 3]}
+
+    # outro carrinho => outra OC
+    ids3 = ocs_compras.gravar_oc_do_carrinho(_carrinho(qtds=(6, 3)), db_path=db)
+    assert ids3 != ids1
+    assert _contar(db, "ordens_compra") == 2
+
+
+def test_numero_independe_da_ordem_das_linhas():
+    c = _carrinho()
+    assert ocs_compras.numero_oc_do_carrinho(c) == ocs_compras.numero_oc_do_carrinho(c.iloc[::-1])
+
+
+def test_varias_empresas_ganham_sufixo(db):
+    ids = ocs_compras.gravar_oc_do_carrinho(_carrinho(empresas=("JCA", "ALIVVIA")), "OC-9", db_path=db)
+    assert ids == ["OC-9-JCA", "OC-9-ALIVVIA"]
+
+
+@pytest.mark.parametrize("fechar", [
+    lambda oc, db: ocs_compras.atualizar_status(oc, ocs_compras.STATUS_CANCELADA, db_path=db),
+    lambda oc, db: ocs_compras.registrar_recebimento(oc, {"A": 5, "B": 3}, db_path=db),
+    lambda oc, db: ocs_compras.registrar_recebimento(oc, {"A": 1}, db_path=db),
+], ids=["cancelada", "recebida", "recebimento_parcial"])
+def test_nao_regrava_oc_processada(db, fechar):
+    (oc_id,) = ocs_compras.gravar_oc_do_carrinho(_carrinho(), "OC-1", db_path=db)
+    fechar(oc_id, db)
+    antes = ocs_compras.em_aberto_por_sku("JCA", db_path=db)
+    with pytest.raises(ValueError, match="OC-1"):
+        ocs_compras.gravar_oc_do_carrinho(_carrinho(qtds=(50, 30)), "OC-1", db_path=db)
+    con = sqlite3.connect(db)
+    try:
+        qtds = con.execute("SELECT QTD FROM ordens_compra_itens WHERE OC_ID = 'OC-1' ORDER BY ITEM").fetchall()
+    finally:
+        con.close()
+    assert qtds == [(5,), (3,)]
+    pd.testing.assert_frame_equal(ocs_compras.em_aberto_por_sku("JCA", db_path=db), antes)
+
+
+def test_triggers_mantem_em_aberto(db):
+    ocs_compras.gravar_oc_do_carrinho(_carrinho(), "OC-1", db_path=db)
+    ocs_compras.gravar_oc_do_carrinho(_carrinho(qtds=(1, 0), empresas=("ALIVVIA", "ALIVVIA")), "OC-2", db_path=db)
+    ocs_compras.registrar_recebimento("OC-1", {"A": 2}, db_path=db)
+    assert ocs_compras.em_aberto_por_sku(db_path=db).to_dict("list") == {
+        "Empresa": ["ALIVVIA", "JCA", "JCA"], "SKU": ["A", "A", "B"], "Qtd_Aberta": [1, 3, 3],
+    }
+    ocs_compras.atualizar_status("OC-1", ocs_compras.STATUS_CANCELADA, db_path=db)
+    assert ocs_compras.em_aberto_por_sku("JCA", db_path=db).empty
+
+    # o resumo mantido pelos triggers bate com o recalculado do zero
+    con = ocs_compras.conectar(db)
+    try:
+        antes = con.execute("SELECT EMPRESA, SKU, QTD_ABERTA FROM ocs_em_aberto WHERE QTD_ABERTA > 0 "
+                            "ORDER BY 1, 2").fetchall()
+        ocs_compras.recalcular_em_aberto(con)
+        depois = con.execute("SELECT EMPRESA, SKU, QTD_ABERTA FROM ocs_em_aberto ORDER BY 1, 2").fetchall()
+    finally:
+        con.close()
+    assert antes == depois
+
+
+def test_recebimento_de_sku_repetido_preenche_linhas_em_ordem(db):
+    itens = pd.DataFrame({"OC_ID": "OC-1", "SKU": ["A", "B", "A"], "QTD": [4, 2, 6], "PRECO": [1.0, 1.0, 1.0]})
+    ocs_compras.gravar_ocs([{"OC_ID": "OC-1", "EMPRESA": "JCA"}], itens, db_path=db)
+
+    assert ocs_compras.registrar_recebimento("OC-1", {"A": 7}, db_path=db) == 2
+    con = sqlite3.connect(db)
+    try:
+        recebido = con.execute("SELECT ITEM, QTD_RECEBIDA FROM ordens_compra_itens ORDER BY ITEM").fetchall()
+        status = con.execute("SELECT STATUS FROM ordens_compra").fetchone()[0]
+    finally:
+        con.close()
+    assert recebido == [(1, 4), (2, 0), (3, 3)]
+    assert status == ocs_compras.STATUS_ABERTA
+    assert ocs_compras.em_aberto_por_sku("JCA", db_path=db).to_dict("list") == {"SKU": ["A", "B"], "Qtd_Aberta": [3, 2]}
+
+    # o excedente é ignorado; só fecha quando todas as linhas chegaram
+    ocs_compras.registrar_recebimento("OC-1", {"A": 10}, db_path=db)
+    assert ocs_compras.em_aberto_por_sku("JCA", db_path=db)["SKU"].tolist() == ["B"]
+    ocs_compras.registrar_recebimento("OC-1", {"B": 2}, db_path=db)
+    con = sqlite3.connect(db)
+    try:
+        assert con.execute("SELECT STATUS FROM ordens_compra").fetchone()[0] == ocs_compras.STATUS_RECEBIDA
+    finally:
+        con.close()
+
+
+def test_schema_garantido_uma_vez_por_banco(db, monkeypatch):
+    ocs_compras.conectar(db).close()
+    monkeypatch.setattr(ocs_compras, "_SCHEMA", ocs_compras._SCHEMA + ["CREATE TABLE IF NOT EXISTS sentinela (x)"])
+
+    def tabelas():
+        con = ocs_compras.conectar(db)
+        try:
+            return {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            con.close()
+
+    assert "sentinela" not in tabelas()  # já inicializado: só conecta
+
+    os.remove(db)
+    for sufixo in ("-wal", "-shm"):
+        if os.path.exists(db + sufixo):
+            os.remove(db + sufixo)
+    assert "sentinela" in tabelas()  # arquivo novo: DDL de novo
@@ -0,0 +1,118 @@
+# v4_api/tests/test_padrao_cache.py
+# Cache do Padrão (reposicao_facil.padrao_de_url_com_cache) contra um servidor
+# HTTP local com ETag/Last-Modified: 200 na primeira vez, 304 sem reabrir o
+# Excel na revalidação e cópia do disco quando o servidor está fora do ar.
+
+import hashlib
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import requests
+
+ULTIMA_MODIFICACAO = "Wed, 01 Oct 2025 12:00:00 GMT"
+
+
+def _xlsx(catalogo: pd.DataFrame, kits: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf) as w:
+        kits.to_excel(w, sheet_name="KITS", index=False)
+        catalogo.to_excel(w, sheet_name="CATALOGO_SIMPLES", index=False)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def servidor():
+    estado = {
+        "corpo": _xlsx(
+            pd.DataFrame({"component_sku": ["A", "B", "C"], "fornecedor": ["F1", "F1", "F2"],
+                          "status_reposicao": ["", "", "nao_repor"]}),
+            pd.DataFrame({"kit_sku": ["K1", "K1"], "component_sku": ["A", "B"], "qty": [1, 2]}),
+        ),
+        "pedidos": [],
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            etag = '"' + hashlib.md5(estado["corpo"]).hexdigest() + '"'
+            estado["pedidos"].append((self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", ULTIMA_MODIFICACAO)
+            self.send_header("Content-Length", str(len(estado["corpo"])))
+            self.end_headers()
+            self.wfile.write(estado["corpo"])
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    estado["url"] = f"http://127.0.0.1:{srv.server_port}/spreadsheets/d/X/export?format=xlsx"
+    estado["srv"] = srv
+    yield estado
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def parses(app, monkeypatch, tmp_path):
+    """Isola o cache em tmp_path e conta quantas vezes o XLSX é parseado."""
+    monkeypatch.setattr(app, "PADRAO_CACHE_DIR", str(tmp_path / "padrao"))
+    contagem = []
+    original = app._carregar_padrao_de_content
+
+    def contar(content):
+        contagem.append(len(content))
+        return original(content)
+
+    monkeypatch.setattr(app, "_carregar_padrao_de_content", contar)
+    return contagem
+
+
+def test_get_condicional_e_fallback(app, servidor, parses):
+    sessao = requests.Session()
+    cat1, do_cache = app.padrao_de_url_com_cache(servidor["url"], session=sessao)
+    assert not do_cache and len(parses) == 1
+    assert servidor["pedidos"][-1] == (None, None)
+    assert sorted(cat1.catalogo_simples["component_sku"]) == ["A", "B"]  # "nao_repor" fora
+
+    # revalidação: manda os validadores, recebe 304 e não reabre o Excel
+    cat2, do_cache = app.padrao_de_url_com_cache(servidor["url"], session=sessao)
+    assert do_cache and len(parses) == 1
+    assert servidor["pedidos"][-1] == ('"' + hashlib.md5(servidor["corpo"]).hexdigest() + '"', ULTIMA_MODIFICACAO)
+    for campo in ("catalogo_simples", "kits_reais", "kits_efetivo"):
+        pd.testing.assert_frame_equal(getattr(cat1, campo), getattr(cat2, campo))
+    assert cat1.ciclos_kits == cat2.ciclos_kits == []  # guardado no cache junto com os kits
+
+    # servidor fora do ar: usa a cópia do disco
+    servidor["srv"].shutdown()
+    servidor["srv"].server_close()
+    cat3, do_cache = app.padrao_de_url_com_cache(servidor["url"], session=sessao)
+    assert do_cache and len(parses) == 1
+    pd.testing.assert_frame_equal(cat1.kits_efetivo, cat3.kits_efetivo)
+
+
+def test_conteudo_novo_e_reparseado(app, servidor, parses):
+    sessao = requests.Session()
+    app.padrao_de_url_com_cache(servidor["url"], session=sessao)
+    servidor["corpo"] = _xlsx(
+        pd.DataFrame({"component_sku": ["A"], "fornecedor": ["F1"], "status_reposicao": [""]}),
+        pd.DataFrame({"kit_sku": ["K1"], "component_sku": ["A"], "qty": [3]}),
+    )
+    cat, do_cache = app.padrao_de_url_com_cache(servidor["url"], session=sessao)
+    assert not do_cache and len(parses) == 2
+    assert cat.catalogo_simples["component_sku"].tolist() == ["A"]
+
+
+def test_sem_copia_no_disco_servidor_fora_propaga_erro(app, servidor, parses):
+    servidor["srv"].shutdown()
+    servidor["srv"].server_close()
+    with pytest.raises(requests.ConnectionError):
+        app.padrao_de_url_com_cache(servidor["url"], session=requests.Session())
@@ -0,0 +1,68 @@
+# v4_api/tests/test_selecao_carrinho.py
+# Seleção da aba 2 (reposicao_facil): o delta do editor (posições na vista)
+# vira a máscara do resultado, e o carrinho só ganha/perde as linhas que mudaram.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+RESULTADO = pd.DataFrame({
+    "SKU": ["A", "B", "C", "D"], "fornecedor": ["F1", "F1", "F2", "F2"],
+    "Preco": [1.0, 2.0, 3.0, 4.0], "Compra_Sugerida": [1, 0, 3, 4],
+    "Valor_Compra_R$": [1.0, 0.0, 9.0, 16.0],
+})
+
+
+@pytest.fixture
+def sessao(app):
+    st = app.st
+
+    def limpar():
+        for emp in app.EMPRESAS:
+            st.session_state[f"resultado_{emp}"] = None
+            app.mascara_selecao(emp)
+
+    limpar()
+    st.session_state["resultado_JCA"] = RESULTADO
+    app.mascara_selecao("JCA")
+    yield st.session_state
+    limpar()
+
+
+def _editar(app, sessao, linhas: dict):
+    """Simula o data_editor: vista = D, C, B, A e `linhas` = {posição na vista: marcado}."""
+    sel = sessao["sel_JCA"]
+    sel["vista"] = np.array([3, 2, 1, 0])
+    sessao["editor_teste"] = {"edited_rows": {p: {"Selecionar": v} for p, v in linhas.items()}}
+    app.aplicar_delta_selecao("JCA", "editor_teste", sel["versao"])
+
+
+def test_delta_da_vista_vira_mascara_do_resultado(app, sessao):
+    _editar(app, sessao, {0: True, 2: True})
+    assert sessao["sel_JCA"]["mask"].tolist() == [False, True, False, True]
+
+    # editor de uma versão anterior da vista: ignorado
+    sel = sessao["sel_JCA"]
+    sessao["editor_teste"] = {"edited_rows": {3: {"Selecionar": True}}}
+    app.aplicar_delta_selecao("JCA", "editor_teste", sel["versao"] - 1)
+    assert sel["mask"].tolist() == [False, True, False, True]
+
+
+def test_carrinho_acompanha_o_delta(app, sessao):
+    _editar(app, sessao, {0: True, 1: True, 2: True})  # D, C e B (B sem compra sugerida)
+    versao = sessao["carrinho_versao"]
+    carrinho = app.sincronizar_carrinho()
+    assert carrinho["SKU"].tolist() == ["C", "D"]
+    assert list(carrinho.columns) == app.COLS_CARRINHO
+    assert sessao["carrinho_versao"] == versao + 1
+
+    # Qtd_Ajustada editada sobrevive às sincronizações seguintes
+    app.gravar_qtd_ajustada(np.array([30, 40]))
+    assert app.sincronizar_carrinho()["Qtd_Ajustada"].tolist() == [30, 40]
+    assert sessao["carrinho_versao"] == versao + 1  # nada entrou nem saiu
+
+    _editar(app, sessao, {0: False, 3: True})  # sai D, entra A
+    carrinho = app.sincronizar_carrinho()
+    assert carrinho["SKU"].tolist() == ["A", "C"]
+    assert carrinho["Qtd_Ajustada"].tolist() == [1, 30]
+    assert sessao["carrinho_versao"] == versao + 2